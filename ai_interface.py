@@ -1,19 +1,242 @@
+import asyncio
 import os
-from huggingface_hub import InferenceClient
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+import huggingface_hub
+from huggingface_hub import AsyncInferenceClient, InferenceClient
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Seconds a model call may take before it is abandoned (the client default is to wait forever)
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "30"))
+# Connections kept open to the inference API, and seconds an idle one stays open
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", "20"))
+AI_KEEPALIVE_SECONDS = float(os.getenv("AI_KEEPALIVE_SECONDS", "60"))
+# Most task descriptions categorized by one prompt; longer lists are split into several
+AI_CATEGORIZE_BATCH_SIZE = int(os.getenv("AI_CATEGORIZE_BATCH_SIZE", "32"))
+
+def _http_module():
+    # The client type the hub's factory hooks take: httpx2 from huggingface_hub 2.0, httpx before
+    if int(huggingface_hub.__version__.split(".")[0]) >= 2:
+        import httpx2
+        return httpx2
+    import httpx
+    return httpx
+
+def configure_http_pool(max_connections: int = AI_MAX_CONNECTIONS, keepalive_seconds: float = AI_KEEPALIVE_SECONDS,
+                        timeout: float = AI_TIMEOUT, verify=True):
+    """
+    Give the HTTP clients huggingface_hub creates a sized keep-alive pool and timeouts.
+
+    Both go through the hub's public factory hooks: set_client_factory builds the one
+    client every InferenceClient sends through, and set_async_client_factory the
+    client of each AsyncInferenceClient (AIModel keeps one per process). TCP and
+    TLS setup is then paid once per pooled connection instead of once per model call.
+
+    Args:
+        max_connections (int): Concurrent connections to the inference API
+        keepalive_seconds (float): Idle time before a pooled connection is closed; 0 disables keep-alive
+        timeout (float): Default seconds per request
+        verify: TLS verification, True or a CA bundle path
+    """
+    keepalive = max_connections if keepalive_seconds > 0 else 0
+    if hasattr(huggingface_hub, "set_client_factory"):
+        http = _http_module()
+        settings = dict(
+            follow_redirects=True,
+            verify=verify,
+            timeout=http.Timeout(timeout),
+            limits=http.Limits(max_connections=max_connections, max_keepalive_connections=keepalive,
+                               keepalive_expiry=keepalive_seconds),
+        )
+        # Keep the hub's request hooks (headers, error handling) on our clients
+        hooks = huggingface_hub.get_session().event_hooks
+        huggingface_hub.set_client_factory(lambda: http.Client(event_hooks=hooks, **settings))
+        if hasattr(huggingface_hub, "set_async_client_factory"):
+            async_hooks = huggingface_hub.get_async_session().event_hooks
+            huggingface_hub.set_async_client_factory(lambda: http.AsyncClient(event_hooks=async_hooks, **settings))
+    else:
+        # Older, requests-based releases keep one session per thread
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        def backend_factory():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = verify
+            if not keepalive:
+                session.headers["Connection"] = "close"
+            return session
+
+        huggingface_hub.configure_http_backend(backend_factory=backend_factory)
+
+# Sampling settings for chat and summary answers, and greedy decoding for categories
+RESPONSE_PARAMETERS = {"max_new_tokens": 100, "temperature": 0.7, "do_sample": True, "top_p": 0.9,
+                       "stop": ["\n\n", "</s>"]}
+CATEGORY_PARAMETERS = {"max_new_tokens": 10, "temperature": 0.1, "do_sample": False, "stop": ["\n", ".", " "]}
+# Batched categories: one numbered line per task, so generation stops at the first blank line
+BATCH_CATEGORY_PARAMETERS = {"temperature": 0.1, "do_sample": False, "stop": ["\n\n"]}
+# Generated tokens allowed per task in a batch ("12. Personal\n" is about five)
+BATCH_TOKENS_PER_TASK = 6
+CATEGORIES = ["Urgent", "Work", "Personal"]
+# One line of a batched answer: a task number and its label, nothing else
+CATEGORY_LINE = re.compile(r"^\s*(\d+)[.):]\s*(urgent|work|personal)\s*$", re.IGNORECASE)
+FALLBACK_MODEL = "distilgpt2"
+
+class LatencyStats:
+    """
+    Thread-safe call count and percentiles over the most recent latencies.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self._samples.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, samples = self.count, sorted(self._samples)
+        if not samples:
+            return {"count": count, "p50_ms": None, "p95_ms": None, "max_ms": None}
+        def percentile(q):
+            return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 1)
+        return {"count": count, "p50_ms": percentile(0.5), "p95_ms": percentile(0.95),
+                "max_ms": round(samples[-1] * 1000, 1)}
+
 class AIModel:
     def __init__(self):
         # Get token from environment variables
         self.token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
         if not self.token:
             raise ValueError("HUGGINGFACEHUB_API_TOKEN environment variable not set")
-        self.client = InferenceClient(token=self.token)
+        self.timeout = AI_TIMEOUT
         # Use a more appropriate model for text generation
         self.model_name = os.getenv("HF_MODEL_NAME", "gpt2")
+        self.response_latency = LatencyStats()
+        # Streams: until the first token (what the user waits for) and until the last
+        self.first_token_latency = LatencyStats()
+        self.stream_latency = LatencyStats()
+        self.categorize_batch_latency = LatencyStats()
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+        # Async client for non-streamed calls, and the event loop its connections belong to
+        self._shared_async_client: Optional[AsyncInferenceClient] = None
+        self._shared_async_loop = None
+
+    @contextmanager
+    def _client(self):
+        # A client object is cheap (the connections live in the shared pool), but it holds
+        # every response it returned until closed, so each call gets its own
+        client = InferenceClient(token=self.token, timeout=self.timeout)
+        try:
+            yield client
+        finally:
+            if hasattr(client, "close"):
+                client.close()
+
+    @asynccontextmanager
+    async def _async_client(self, stream: bool = False):
+        if not stream:
+            # Non-streamed calls reuse one client, and so one keep-alive pool; it keeps no
+            # per-call state. Its connections belong to the event loop it was made in
+            loop = asyncio.get_running_loop()
+            if self._shared_async_client is None or self._shared_async_loop is not loop:
+                self._shared_async_client = AsyncInferenceClient(token=self.token, timeout=self.timeout)
+                self._shared_async_loop = loop
+            yield self._shared_async_client
+            return
+        # A streamed response stays open until its client is closed, so a stream gets its own
+        # client, closed with it even when the reader abandons the stream halfway
+        client = AsyncInferenceClient(token=self.token, timeout=self.timeout)
+        try:
+            yield client
+        finally:
+            await client.close()
+
+    async def aclose(self):
+        """Close the pooled async connections; safe to call more than once."""
+        client, loop = self._shared_async_client, self._shared_async_loop
+        self._shared_async_client = self._shared_async_loop = None
+        # Connections made in another (by now finished) event loop cannot be closed from this one
+        if client is not None and loop is asyncio.get_running_loop():
+            await client.close()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "model": self.model_name,
+            "fallback_model": FALLBACK_MODEL,
+            "responses": self.response_latency.stats(),
+            "stream_first_token": self.first_token_latency.stats(),
+            "stream_total": self.stream_latency.stats(),
+            "categorize_batches": self.categorize_batch_latency.stats(),
+            "fallbacks": counters.get("fallbacks", 0),
+            "failures": counters.get("failures", 0),
+            "categorize_batch_misses": counters.get("categorize_batch_misses", 0),
+        }
+
+    @staticmethod
+    def _clean_response(response: str) -> str:
+        return response.strip() if response.strip() else "AI could not generate a response."
+
+    @staticmethod
+    def _parse_category(response: str) -> str:
+        # Process the response to extract the category
+        category = response.strip().split()[-1].strip(" .,!?")
+
+        # Normalize the category to match expected values
+        category = category.capitalize()
+        if category in CATEGORIES:
+            return category
+        # Default to Personal if the model returned something unexpected
+        return "Personal"
+
+    @staticmethod
+    def _batch_prompt(descriptions: List[str]) -> str:
+        # One line per task, so a description with line breaks cannot shift the numbering
+        tasks = "\n".join(f"{i}. {' '.join(description.split())}" for i, description in enumerate(descriptions, 1))
+        # The answer is started for the model, which keeps it to the numbered format
+        return (f"Categorize each task as Urgent, Work or Personal. Answer with one numbered line per task.\n\n"
+                f"Tasks:\n{tasks}\n\nCategories:\n1.")
+
+    @staticmethod
+    def _parse_categories(response: str, count: int) -> List[Optional[str]]:
+        """
+        Per-task categories from a batched answer; None where a task got no usable label.
+
+        Only lines made of a task number and a label alone count, and they are keyed by
+        that number, so a reordered answer still lands on the right tasks and chatty
+        lines are ignored. A task with no such line, or with two disagreeing ones, is
+        left None.
+        """
+        labels: Dict[int, Optional[str]] = {}
+        # The prompt ends with "1." for the model to continue
+        for line in ("1." + response).splitlines():
+            match = CATEGORY_LINE.match(line)
+            if not match:
+                continue
+            i, label = int(match.group(1)) - 1, match.group(2).capitalize()
+            if 0 <= i < count:
+                labels[i] = label if labels.get(i, label) == label else None
+        return [labels.get(i) for i in range(count)]
 
     def generate_response(self, prompt: str) -> str:
         """
@@ -25,38 +248,102 @@ class AIModel:
         Returns:
             str: The generated response from the AI model
         """
+        started = time.perf_counter()
         try:
             # Using text generation with a more reliable model
             # Using a simpler approach that works better with gpt2 and similar models
-            response = self.client.text_generation(
-                prompt,
-                model=self.model_name,
-                max_new_tokens=100,
-                temperature=0.7,
-                do_sample=True,
-                top_p=0.9,
-                stop_sequences=["\n\n", "</s>"]
-            )
-            return response.strip() if response.strip() else "AI could not generate a response."
+            with self._client() as client:
+                response = client.text_generation(prompt, model=self.model_name, **RESPONSE_PARAMETERS)
+            return self._clean_response(response)
         except Exception as e:
             # More detailed error handling
             print(f"AI Error: {str(e)}")
             # Try a fallback model if the primary one fails
             try:
                 print("Trying fallback model...")
-                response = self.client.text_generation(
-                    prompt,
-                    model="distilgpt2",  # Fallback to a more reliable model
-                    max_new_tokens=100,
-                    temperature=0.7,
-                    do_sample=True,
-                    top_p=0.9,
-                    stop_sequences=["\n\n", "</s>"]
-                )
-                return response.strip() if response.strip() else "AI could not generate a response."
+                self._count("fallbacks")
+                with self._client() as client:
+                    response = client.text_generation(prompt, model=FALLBACK_MODEL, **RESPONSE_PARAMETERS)
+                return self._clean_response(response)
+            except Exception as fallback_error:
+                print(f"Fallback model also failed: {str(fallback_error)}")
+                self._count("failures")
+                return f"AI is thinking... please try again later."
+        finally:
+            self.response_latency.record(time.perf_counter() - started)
+
+    async def generate_response_async(self, prompt: str) -> str:
+        """
+        Async version of generate_response; waiting on the model holds no thread.
+
+        Args:
+            prompt (str): The input prompt for the AI model
+
+        Returns:
+            str: The generated response from the AI model
+        """
+        started = time.perf_counter()
+        try:
+            async with self._async_client() as client:
+                response = await client.text_generation(prompt, model=self.model_name, **RESPONSE_PARAMETERS)
+            return self._clean_response(response)
+        except Exception as e:
+            print(f"AI Error: {str(e)}")
+            try:
+                print("Trying fallback model...")
+                self._count("fallbacks")
+                async with self._async_client() as client:
+                    response = await client.text_generation(prompt, model=FALLBACK_MODEL, **RESPONSE_PARAMETERS)
+                return self._clean_response(response)
             except Exception as fallback_error:
                 print(f"Fallback model also failed: {str(fallback_error)}")
+                self._count("failures")
                 return f"AI is thinking... please try again later."
+        finally:
+            self.response_latency.record(time.perf_counter() - started)
+
+    async def stream_response(self, prompt: str) -> AsyncIterator[Dict[str, str]]:
+        """
+        Stream a response from the AI model as it is generated.
+
+        Yields {"token": text} events. If the primary model fails, {"fallback": model}
+        is yielded and the fallback model continues from the text streamed so far,
+        so a failure mid-answer does not restart it. If both fail, {"error": message}
+        is the last event.
+
+        Args:
+            prompt (str): The input prompt for the AI model
+        """
+        started = time.perf_counter()
+        text, tokens = "", 0
+        for model in (self.model_name, FALLBACK_MODEL):
+            remaining = RESPONSE_PARAMETERS["max_new_tokens"] - tokens
+            if model == FALLBACK_MODEL:
+                if remaining <= 0:
+                    break
+                print("Trying fallback model...")
+                self._count("fallbacks")
+                yield {"fallback": model}
+            try:
+                async with self._async_client(stream=True) as client:
+                    stream = await client.text_generation(
+                        prompt + text, model=model, stream=True, **dict(RESPONSE_PARAMETERS, max_new_tokens=remaining))
+                    async for token in stream:
+                        if tokens == 0:
+                            self.first_token_latency.record(time.perf_counter() - started)
+                        tokens += 1
+                        text += token
+                        yield {"token": token}
+                break
+            except Exception as e:
+                print(f"AI Error: {str(e)}" if model == self.model_name else f"Fallback model also failed: {str(e)}")
+        else:
+            self._count("failures")
+            yield {"error": "AI is thinking... please try again later."}
+            return
+        if not text.strip():
+            yield {"token": "AI could not generate a response."}
+        self.stream_latency.record(time.perf_counter() - started)
 
     def categorize_task(self, description: str) -> str:
         """
@@ -66,35 +353,85 @@ class AIModel:
         try:
             # Create a prompt specifically for task categorization
             prompt = f"Task: {description}\nCategory:"
-            response = self.client.text_generation(
-                prompt,
-                model=self.model_name,
-                max_new_tokens=10,  # Just need a short category response
-                temperature=0.1,  # Lower temperature for more consistent results
-                do_sample=False,  # Use greedy decoding for consistency
-                stop_sequences=["\n", ".", " "]
-            )
-
-            # Process the response to extract the category
-            category = response.strip().split()[-1].strip(" .,!?")
-
-            # Normalize the category to match expected values
-            category = category.capitalize()
-            if category in ["Urgent", "Work", "Personal"]:
-                return category
-            else:
-                # Default to Personal if the model returned something unexpected
-                return "Personal"
+            with self._client() as client:
+                response = client.text_generation(prompt, model=self.model_name, **CATEGORY_PARAMETERS)
+            return self._parse_category(response)
         except Exception as e:
             print(f"Task categorization error: {str(e)}")
             # Default to Personal if AI categorization fails
             return "Personal"
 
+    def categorize_tasks(self, descriptions: List[str], batch_size: int = AI_CATEGORIZE_BATCH_SIZE) -> List[Optional[str]]:
+        """
+        Categorize many tasks with one model call per `batch_size` descriptions.
+        Returns one of 'Urgent', 'Work', 'Personal' per description, in order.
+
+        A task the answer has no unambiguous label for, or whose batch call failed, is
+        None, so the caller can fall back to the local classifier instead of another call.
+        """
+        categories: List[Optional[str]] = []
+        for start in range(0, len(descriptions), batch_size):
+            batch = descriptions[start:start + batch_size]
+            started = time.perf_counter()
+            try:
+                with self._client() as client:
+                    response = client.text_generation(
+                        self._batch_prompt(batch), model=self.model_name,
+                        max_new_tokens=BATCH_TOKENS_PER_TASK * len(batch), **BATCH_CATEGORY_PARAMETERS)
+                parsed = self._parse_categories(response, len(batch))
+            except Exception as e:
+                print(f"Batch categorization error: {str(e)}")
+                parsed = [None] * len(batch)
+            finally:
+                self.categorize_batch_latency.record(time.perf_counter() - started)
+            misses = parsed.count(None)
+            if misses:
+                self._count("categorize_batch_misses", misses)
+            categories.extend(parsed)
+        return categories
+
+    async def categorize_task_async(self, description: str) -> str:
+        """
+        Async version of categorize_task.
+        Returns one of: 'Urgent', 'Work', 'Personal'
+        """
+        try:
+            prompt = f"Task: {description}\nCategory:"
+            async with self._async_client() as client:
+                response = await client.text_generation(prompt, model=self.model_name, **CATEGORY_PARAMETERS)
+            return self._parse_category(response)
+        except Exception as e:
+            print(f"Task categorization error: {str(e)}")
+            return "Personal"
+
+_ai_model: Optional[AIModel] = None
+_ai_model_lock = threading.Lock()
+
 def get_ai_model():
     """
-    Factory function to get an instance of the AI model.
+    Get the AI model shared by the whole process, creating it on first use.
+
+    Raises ValueError if the API token is not set; nothing is cached in that case,
+    so a later call can succeed once it is.
 
     Returns:
-        AIModel: An instance of the AI model
+        AIModel: The shared AI model
     """
-    return AIModel()
\ No newline at end of file
+    global _ai_model
+    if _ai_model is None:
+        with _ai_model_lock:
+            if _ai_model is None:
+                model = AIModel()
+                configure_http_pool()
+                _ai_model = model
+    return _ai_model
+
+async def close_ai_model():
+    """Drop the shared AI model and close its pooled connections, sync and async; safe to call twice."""
+    global _ai_model
+    with _ai_model_lock:
+        model, _ai_model = _ai_model, None
+        if hasattr(huggingface_hub, "close_session"):
+            huggingface_hub.close_session()
+    if model is not None:
+        await model.aclose()
@@ -0,0 +1,152 @@
+# benchmark_ai_client.py
+"""
+Per-call latency of the old AI model factory against the shared, pooled model.
+
+A local HTTPS server speaking the text-generation API stands in for the
+inference endpoint, so the numbers are client-side cost only: building the
+model, reading the environment, and the TCP and TLS handshakes. Against a
+remote endpoint every new connection also pays two or three network round
+trips on top, so the real saving is larger than what is measured here.
+
+    factory: load_dotenv() + a new AIModel for every call, no keep-alive
+    shared:  one AIModel for the process, pooled keep-alive connections
+
+Usage:
+    python benchmark_ai_client.py --calls 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+import ai_interface
+
+class GenerationHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, keep-alive connections
+    # would stall on the client's delayed ACK
+    disable_nagle_algorithm = True
+    reply = "Finish the report first, then call the client."
+    # Seconds before the first token, then between streamed tokens
+    delay = 0.0
+    token_delay = 0.0
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.delay:
+            time.sleep(self.delay)
+        if request.get("stream"):
+            self.stream_tokens()
+            return
+        body = json.dumps([{"generated_text": self.reply}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_tokens(self):
+        # Server-sent events in the text-generation-inference format, one word per token
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, word in enumerate(self.reply.split(" ")):
+                if i and self.token_delay:
+                    time.sleep(self.token_delay)
+                token = {"id": i, "text": word if i == 0 else f" {word}", "logprob": 0.0, "special": False}
+                self.write_chunk(f"data: {json.dumps({'index': i, 'token': token})}\n\n".encode())
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, as the app does when a chat stream is abandoned
+            self.close_connection = True
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def log_message(self, *args):
+        pass
+
+class GenerationServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+def start_server(directory: str, delay: float, tls: bool, handler=GenerationHandler):
+    handler.delay = delay
+    server = GenerationServer(("127.0.0.1", 0), handler)
+    cert = None
+    if tls:
+        cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+                        "-keyout", key, "-out", cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = "https" if tls else "http"
+    return server, f"{scheme}://127.0.0.1:{server.server_port}", cert
+
+def timed(call, calls: int, warmup: int = 5):
+    for _ in range(warmup):
+        call()
+    latencies = []
+    for _ in range(calls):
+        began = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - began) * 1000)
+    latencies.sort()
+    return {
+        "mean_ms": statistics.fmean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-call AI model factory with the shared pooled model")
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated generation time on the server")
+    parser.add_argument("--no-tls", action="store_true", help="Plain HTTP, which leaves only the TCP handshake to save")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, url, cert = start_server(directory, args.delay_ms / 1000, not args.no_tls)
+        os.environ.setdefault("HUGGINGFACEHUB_API_TOKEN", "benchmark")
+        # The model name doubles as the endpoint URL for the text-generation API
+        os.environ["HF_MODEL_NAME"] = url
+        verify = cert or True
+        prompt = "System: You are a helpful Todo Assistant.\n\nUser Question: what first?\nAssistant:"
+
+        def factory_call():
+            load_dotenv()
+            return ai_interface.AIModel().generate_response(prompt)
+
+        shared = ai_interface.AIModel()
+        results = {}
+        # Keep-alive off reproduces a fresh handshake per call, as with a new client each time
+        ai_interface.configure_http_pool(keepalive_seconds=0, verify=verify)
+        results["factory"] = timed(factory_call, args.calls)
+        asyncio.run(ai_interface.close_ai_model())
+        ai_interface.configure_http_pool(verify=verify)
+        results["shared"] = timed(lambda: shared.generate_response(prompt), args.calls)
+        asyncio.run(ai_interface.close_ai_model())
+        server.shutdown()
+
+    print(f"{'client':<10} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+    saved = results["factory"]["p50_ms"] - results["shared"]["p50_ms"]
+    print(f"saved per call (p50): {saved:.3f} ms ({'https' if cert else 'http'}, {args.calls} calls)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmark_categorize.py
+"""
+Categorization throughput: one model call per task against batched prompts.
+
+A local server speaking the text-generation API stands in for the model. It
+answers categorization prompts by keyword and charges --call-ms per request
+(network round trip, queueing, reading the prompt) plus --token-ms per
+generated token, since a model writes its answer one token at a time. The
+per-item loop pays the call cost for every task; a batch pays it once but
+generates a longer answer.
+
+    per-item: AIModel.categorize_task for each description
+    batched:  AIModel.categorize_tasks with the whole batch in one prompt
+
+For each batch size the batched labels are also compared with the per-item
+ones, which checks that the numbered answer was parsed back onto the right tasks.
+
+Usage:
+    python benchmark_categorize.py --call-ms 100 --token-ms 10
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import ai_interface
+from benchmark_ai_client import GenerationHandler, start_server
+
+KEYWORDS = {
+    "Urgent": ["urgent", "asap", "today", "critical"],
+    "Work": ["report", "meeting", "client", "presentation", "email"],
+}
+TASKS = [
+    "Finish the quarterly report", "Prepare the client presentation", "Email the meeting notes",
+    "Fix the critical login bug asap", "Pay the electricity bill today", "Buy groceries for the week",
+    "Call mom about the weekend", "Book a dentist appointment", "Water the plants", "Plan the birthday party",
+]
+
+def keyword_category(description: str) -> str:
+    words = description.lower()
+    for category, keywords in KEYWORDS.items():
+        if any(keyword in words for keyword in keywords):
+            return category
+    return "Personal"
+
+class CategoryHandler(GenerationHandler):
+    call_delay = 0.0
+    token_delay = 0.0
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = request["inputs"]
+        if "\nTasks:\n" in prompt:
+            tasks = prompt.split("\nTasks:\n", 1)[1].split("\n\nCategories:", 1)[0].splitlines()
+            # The prompt already starts the answer with "1."
+            lines = [f"{i}. {keyword_category(task)}" for i, task in enumerate(tasks, 1)]
+            reply = " " + "\n".join(lines)[len("1. "):]
+        else:
+            reply = " " + keyword_category(prompt.split("Task: ", 1)[1].split("\nCategory:", 1)[0])
+        # Roughly one token per word, number, punctuation mark and line break
+        tokens = len(re.findall(r"\w+|[^\w\s]|\n", reply))
+        time.sleep(self.call_delay + self.token_delay * tokens)
+        body = json.dumps([{"generated_text": reply}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def batch_sizes(largest: int):
+    size = 1
+    while size <= largest:
+        yield size
+        size *= 2
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-item and batched AI categorization throughput")
+    parser.add_argument("--call-ms", type=float, default=100, help="Simulated fixed cost of one model call")
+    parser.add_argument("--token-ms", type=float, default=10, help="Simulated time per generated token")
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    CategoryHandler.call_delay = args.call_ms / 1000
+    CategoryHandler.token_delay = args.token_ms / 1000
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as directory:
+        server, url, _ = start_server(directory, 0.0, tls=False, handler=CategoryHandler)
+        os.environ.setdefault("HUGGINGFACEHUB_API_TOKEN", "benchmark")
+        # The model name doubles as the endpoint URL for the text-generation API
+        os.environ["HF_MODEL_NAME"] = url
+        model = ai_interface.get_ai_model()
+        model.categorize_task(TASKS[0])
+
+        print(f"{'batch':>6} {'per-item tasks/s':>17} {'batched tasks/s':>16} {'speedup':>8} {'agree':>6}")
+        for size in batch_sizes(args.max_batch):
+            descriptions = [f"{random.choice(TASKS)} #{i}" for i in range(size)]
+            began = time.perf_counter()
+            single = [model.categorize_task(description) for description in descriptions]
+            single_seconds = time.perf_counter() - began
+            began = time.perf_counter()
+            batched = model.categorize_tasks(descriptions, batch_size=size)
+            batched_seconds = time.perf_counter() - began
+            agree = sum(a == b for a, b in zip(single, batched)) / size
+            print(f"{size:>6} {size / single_seconds:>17.1f} {size / batched_seconds:>16.1f} "
+                  f"{single_seconds / batched_seconds:>7.1f}x {agree:>6.0%}")
+        print(f"({args.call_ms:.0f} ms per call, {args.token_ms:.0f} ms per generated token; "
+              f"{model.stats()['categorize_batch_misses']} batched tasks got no usable label)")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
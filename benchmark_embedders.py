@@ -0,0 +1,105 @@
+# benchmark_embedders.py
+"""
+Retrieval quality and speed of the embedding backends on synthetic todos.
+
+Each query targets one todo and is made from it in one of three ways:
+reworded (same words, new order and filler), typo (two characters changed)
+or synonym (verb and object swapped for synonyms). Recall@k is the share of
+queries whose target is among the k most similar todos. Backends that are not
+installed are skipped.
+
+Usage:
+    python benchmark_embedders.py --todos 2000 --queries 300
+"""
+
+import argparse
+import random
+import resource
+import time
+import numpy as np
+from embedders import create_embedder
+
+VERBS = {"buy": "purchase", "call": "phone", "email": "message", "fix": "repair", "clean": "tidy",
+         "book": "reserve", "review": "check", "send": "mail", "plan": "organize", "pay": "settle",
+         "write": "draft", "cancel": "drop"}
+OBJECTS = {"groceries": "food shopping", "car": "vehicle", "report": "summary", "doctor": "physician",
+           "meeting": "sync", "flight": "plane ticket", "invoice": "bill", "kitchen": "cooking area",
+           "presentation": "slide deck", "gift": "present", "laptop": "notebook computer", "rent": "lease payment",
+           "dentist": "dental appointment", "budget": "spending plan", "garden": "yard", "contract": "agreement",
+           "hotel": "accommodation", "medicine": "prescription", "newsletter": "bulletin", "tickets": "passes"}
+PEOPLE = ["mom", "Alex", "the team", "Priya", "the landlord", "Sam", "the client", "dad", "Jordan", "the school"]
+WHEN = ["today", "tomorrow", "on Monday", "this week", "before Friday", "tonight", "next month", "asap"]
+
+def make_dataset(todos: int, queries: int, seed: int = 0):
+    rng = random.Random(seed)
+    combos = [(v, o, p, w) for v in VERBS for o in OBJECTS for p in PEOPLE for w in WHEN]
+    rng.shuffle(combos)
+    combos = combos[:todos]
+    documents = [f"{v.capitalize()} {o} for {p} {w}" for v, o, p, w in combos]
+    tests = []
+    for kind in ("reworded", "typo", "synonym"):
+        for target in rng.sample(range(len(combos)), queries):
+            v, o, p, w = combos[target]
+            if kind == "reworded":
+                query = f"{w}: need to {v} the {o} ({p})"
+            elif kind == "typo":
+                chars = list(documents[target])
+                for _ in range(2):
+                    i = rng.randrange(len(chars))
+                    chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+                query = "".join(chars)
+            else:
+                query = f"{VERBS[v].capitalize()} {OBJECTS[o]} for {p} {w}"
+            tests.append((kind, query, target))
+    return documents, tests
+
+def normalized(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def evaluate(backend: str, documents, tests, batch_size: int = 256) -> dict:
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    began = time.perf_counter()
+    embedder = create_embedder(backend)
+    embedder.load()
+    embedder.embed_documents(["warm up"])
+    load_seconds = time.perf_counter() - began
+
+    began = time.perf_counter()
+    doc_vectors = normalized(np.concatenate([
+        np.asarray(embedder.embed_documents(documents[i:i + batch_size]), dtype=np.float32)
+        for i in range(0, len(documents), batch_size)
+    ]))
+    docs_per_sec = len(documents) / (time.perf_counter() - began)
+    rss_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+    query_vectors = normalized(embedder.embed_documents([query for _, query, _ in tests]))
+    ranks = np.argsort(-(query_vectors @ doc_vectors.T), axis=1)[:, :5]
+    result = {"load_s": load_seconds, "docs_per_sec": docs_per_sec, "rss_mb": rss_mb}
+    for kind in ("reworded", "typo", "synonym"):
+        rows = [i for i, (test_kind, _, _) in enumerate(tests) if test_kind == kind]
+        targets = np.array([tests[i][2] for i in rows])
+        result[f"{kind}@1"] = float(np.mean(ranks[rows, 0] == targets))
+        result[f"{kind}@5"] = float(np.mean((ranks[rows] == targets[:, None]).any(axis=1)))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends on synthetic todo retrieval")
+    parser.add_argument("--backends", nargs="+", default=["hashing", "huggingface"])
+    parser.add_argument("--todos", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=300, help="Queries per kind")
+    args = parser.parse_args()
+
+    documents, tests = make_dataset(args.todos, args.queries)
+    columns = ["load_s", "docs_per_sec", "rss_mb", "reworded@1", "reworded@5", "typo@1", "typo@5", "synonym@1", "synonym@5"]
+    print(f"{'backend':<12} " + " ".join(f"{column:>12}" for column in columns))
+    for backend in args.backends:
+        try:
+            result = evaluate(backend, documents, tests)
+        except ImportError as e:
+            print(f"{backend:<12} skipped ({e})")
+            continue
+        print(f"{backend:<12} " + " ".join(f"{result[column]:>12.3f}" for column in columns))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# benchmark_rag.py
+"""
+Vector backend benchmark for the RAG service.
+
+Uses clustered random unit vectors in place of real embeddings so only the index
+is measured. Recall@k is measured against the exact NumPy backend.
+
+Usage:
+    python benchmark_rag.py --sizes 1000 10000 100000 --queries 200
+    python benchmark_rag.py --backends numpy hnsw --ef-search 32 64 128
+    python benchmark_rag.py --backends numpy numpy-f16 numpy-int8 numpy-int8-rerank --k 10
+    python benchmark_rag.py --sizes 100000 --stress 10
+"""
+
+import argparse
+import threading
+import time
+import numpy as np
+from vector_index import NumpyVectorIndex, QdrantVectorIndex
+from hnsw_index import HNSWVectorIndex
+from index_snapshot import SnapshotIndex
+
+DIM = 384
+
+BACKENDS = {
+    "qdrant": lambda: QdrantVectorIndex(collection_name="benchmark", dim=DIM),
+    "numpy": lambda: NumpyVectorIndex(dim=DIM),
+    "numpy-f16": lambda: NumpyVectorIndex(dim=DIM, dtype="float16"),
+    "numpy-int8": lambda: NumpyVectorIndex(dim=DIM, dtype="int8"),
+    "numpy-int8-rerank": lambda: NumpyVectorIndex(dim=DIM, dtype="int8", rerank=4),
+    "hnsw": lambda: HNSWVectorIndex(dim=DIM),
+}
+
+def random_unit_vectors(n: int, rng: np.random.Generator, centers: int = 0) -> np.ndarray:
+    # Real sentence embeddings are clustered by topic, which matters for ANN recall
+    if centers:
+        means = rng.standard_normal((centers, DIM)).astype(np.float32)
+        vectors = means[rng.integers(0, centers, n)] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    else:
+        vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    index = NumpyVectorIndex(dim=DIM)
+    index.upsert(list(range(len(corpus))), corpus, [{}] * len(corpus))
+    return [{hit[0] for hit in hits} for hits in index.search_batch(queries, k)]
+
+def recall_at_k(results: list, truth: list) -> float:
+    return float(np.mean([len({hit[0] for hit in hits} & expected) / len(expected)
+                          for hits, expected in zip(results, truth)]))
+
+def build_index(backend: str, corpus: np.ndarray, batch_size: int = 1000):
+    index = BACKENDS[backend]()
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), batch_size):
+        batch = corpus[offset:offset + batch_size]
+        ids = list(range(offset, offset + len(batch)))
+        index.upsert(ids, batch, [{"id": i} for i in ids])
+    return index, time.perf_counter() - start
+
+def measure_queries(index, queries: np.ndarray, k: int):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k))
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+    return results, float(np.percentile(latencies_ms, 50)), float(np.percentile(latencies_ms, 99))
+
+def benchmark_backend(backend: str, corpus: np.ndarray, queries: np.ndarray, k: int, truth: list) -> dict:
+    index, build_seconds = build_index(backend, corpus)
+    results, p50, p99 = measure_queries(index, queries, k)
+
+    start = time.perf_counter()
+    index.search_batch(queries, k)
+    batch_seconds = time.perf_counter() - start
+
+    memory_bytes = index.memory_bytes() if hasattr(index, "memory_bytes") else None
+    index.close()
+    return {
+        "backend": backend,
+        "size": len(corpus),
+        "vector_mb": memory_bytes / 2**20 if memory_bytes is not None else None,
+        "build_s": build_seconds,
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "batch_ms_per_query": batch_seconds * 1000 / len(queries),
+        "recall": recall_at_k(results, truth),
+    }
+
+def sweep_ef_search(corpus: np.ndarray, queries: np.ndarray, k: int, truth: list, ef_values: list):
+    """Latency/recall trade-off of one HNSW graph at several ef_search values."""
+    index, build_seconds = build_index("hnsw", corpus)
+    print(f"hnsw graph over {len(corpus)} vectors built in {build_seconds:.2f}s")
+    print(f"{'ef_search':>9} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(k):>9}")
+    for ef in ef_values:
+        index.ef_search = ef
+        results, p50, p99 = measure_queries(index, queries, k)
+        print(f"{ef:>9} {p50:>8.3f} {p99:>8.3f} {recall_at_k(results, truth):>9.3f}")
+
+class LockedIndex:
+    """The pre-snapshot pattern: one lock shared by searches and whole rebuilds / write batches."""
+
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+
+    def search(self, vector, k):
+        with self.lock:
+            return self.index.search(vector, k)
+
+    def apply(self, ids, vectors, payloads):
+        with self.lock:
+            self.index.upsert(ids, vectors, payloads)
+
+    def rebuild(self, corpus):
+        with self.lock:
+            self.index, _ = build_index("numpy", corpus)
+
+class SnapshotRebuild:
+    """Same operations on a SnapshotIndex: rebuilds happen off to the side and are swapped in."""
+
+    def __init__(self, index):
+        self.index = SnapshotIndex(index, dim=DIM)
+
+    def search(self, vector, k):
+        return self.index.search(vector, k)
+
+    def apply(self, ids, vectors, payloads):
+        self.index.apply(ids, vectors, payloads)
+
+    def rebuild(self, corpus):
+        base, _ = build_index("numpy", corpus)
+        self.index.replace_base(base)
+
+def read_latencies(index, queries: np.ndarray, k: int, readers: int, stop: threading.Event) -> list:
+    latencies = []
+
+    def reader(offset):
+        i = offset
+        while not stop.is_set():
+            start = time.perf_counter()
+            index.search(queries[i % len(queries)], k)
+            latencies.append(time.perf_counter() - start)
+            i += readers
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    return threads, latencies
+
+def stress_test(corpus: np.ndarray, queries: np.ndarray, k: int, seconds: float, readers: int = 4):
+    """
+    Search latency seen by concurrent readers while a writer alternates 1000-row
+    update batches with full rebuilds, with and without snapshots.
+    """
+    rng = np.random.default_rng(7)
+    print(f"{'mode':<10} {'phase':<8} {'searches':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'writes':>7}")
+    for name, wrapper in (("locked", LockedIndex), ("snapshot", SnapshotRebuild)):
+        index = wrapper(build_index("numpy", corpus)[0])
+        for phase in ("idle", "writing"):
+            stop = threading.Event()
+            threads, latencies = read_latencies(index, queries, k, readers, stop)
+            writes = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                if phase == "idle":
+                    time.sleep(0.05)
+                    continue
+                if writes % 5 == 4:
+                    index.rebuild(corpus)
+                else:
+                    ids = rng.integers(0, len(corpus), 1000)
+                    vectors = corpus[ids] + 0.01 * rng.standard_normal((len(ids), DIM)).astype(np.float32)
+                    index.apply([int(i) for i in ids], vectors, [{"id": int(i)} for i in ids])
+                writes += 1
+            stop.set()
+            for thread in threads:
+                thread.join()
+            latencies_ms = np.array(latencies) * 1000
+            print(f"{name:<10} {phase:<8} {len(latencies_ms):>9} {np.percentile(latencies_ms, 50):>8.3f} "
+                  f"{np.percentile(latencies_ms, 99):>8.3f} {latencies_ms.max():>8.3f} {writes:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector backends at several corpus sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--centers", type=int, default=100, help="Topic clusters in the synthetic corpus (0 = uniform)")
+    parser.add_argument("--ef-search", type=int, nargs="+", help="Sweep HNSW ef_search instead of comparing backends")
+    parser.add_argument("--stress", type=float, metavar="SECONDS",
+                        help="Measure search latency under concurrent writes and rebuilds, locked vs snapshots")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+
+    for size in args.sizes:
+        corpus = random_unit_vectors(size, rng, args.centers)
+        # Queries are perturbed corpus points, like a paraphrase of an existing todo
+        queries = corpus[rng.integers(0, size, args.queries)] + 0.05 * rng.standard_normal((args.queries, DIM)).astype(np.float32)
+        if args.stress:
+            stress_test(corpus, queries, args.k, args.stress)
+            continue
+        truth = exact_neighbours(corpus, queries, args.k)
+        if args.ef_search:
+            sweep_ef_search(corpus, queries, args.k, truth, args.ef_search)
+            continue
+        print(f"{'backend':<18} {'size':>8} {'build s':>9} {'p50 ms':>8} {'p99 ms':>8} {'batch ms/q':>11} {'recall@' + str(args.k):>9} {'vector MB':>10}")
+        for backend in args.backends:
+            r = benchmark_backend(backend, corpus, queries, args.k, truth)
+            memory = f"{r['vector_mb']:.1f}" if r["vector_mb"] is not None else "-"
+            print(f"{r['backend']:<18} {r['size']:>8} {r['build_s']:>9.2f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['batch_ms_per_query']:>11.3f} {r['recall']:>9.3f} {memory:>10}")
+
+if __name__ == "__main__":
+    main()
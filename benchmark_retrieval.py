@@ -0,0 +1,277 @@
+# benchmark_retrieval.py
+"""
+End-to-end retrieval benchmark over synthetic todo text, written as JSON.
+
+Builds a corpus of distinct todo descriptions, embeds it once (hashing embedder
+by default, so runs are hermetic) and derives paraphrased queries from known
+todos: reworded, misspelled or with synonyms. Every retrieval configuration is
+then built and queried in its own process, so resident memory is measured
+cleanly. Per configuration it reports:
+
+- build_s: time to upsert the whole corpus
+- p50_ms / p99_ms: single-query search latency (query embedding not included)
+- paraphrase_recall: share of queries whose source todo is in the top k
+- ann_recall: overlap of the top k with exact search over the same vectors
+- rss_mb: anonymous resident memory added by building the index
+
+Configurations slower than is practical at a size (see SIZE_LIMITS) are
+recorded as skipped. Compare two runs, e.g. before and after a change to rag.py:
+
+    python benchmark_retrieval.py --sizes 1000 100000 1000000 --out after.json
+    python benchmark_retrieval.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import numpy as np
+from benchmark_embedders import VERBS, OBJECTS, PEOPLE, WHEN
+from embedders import create_embedder
+
+DIM = 384
+ADJECTIVES = ["blue", "silent", "rapid", "golden", "northern", "tiny", "bright", "hidden", "wild", "steady",
+              "urban", "lunar", "crisp", "amber", "brave", "calm", "coastal", "digital", "early", "fresh",
+              "gentle", "grand", "iron", "jade", "kind", "late", "modern", "noble", "open", "prime"]
+NOUNS = ["falcon", "harbor", "orchard", "summit", "canyon", "meadow", "beacon", "garden", "river", "forge",
+         "lantern", "compass", "anchor", "atlas", "bridge", "cedar", "delta", "ember", "fjord", "glacier",
+         "horizon", "island", "jungle", "kestrel", "lagoon", "mesa", "nebula", "oasis", "prairie", "quarry",
+         "ridge", "savanna", "tundra", "valley", "willow", "yard", "zephyr", "bay", "cliff", "dune"]
+
+# Retrieval configurations: the path rag.py uses (a snapshot over Qdrant) and the alternatives
+CONFIGS = ["rag-qdrant", "qdrant", "numpy", "numpy-f16", "numpy-int8", "numpy-int8-rerank", "hnsw"]
+# Largest corpus each configuration is built for unless --no-limits is given
+SIZE_LIMITS = {"rag-qdrant": 100_000, "qdrant": 100_000, "hnsw": 100_000}
+
+def build_config(config: str):
+    from vector_index import NumpyVectorIndex, QdrantVectorIndex
+    from index_snapshot import SnapshotIndex
+    if config == "rag-qdrant":
+        return SnapshotIndex(QdrantVectorIndex(collection_name="benchmark", dim=DIM), dim=DIM)
+    if config == "qdrant":
+        return QdrantVectorIndex(collection_name="benchmark", dim=DIM)
+    if config == "numpy":
+        return NumpyVectorIndex(dim=DIM)
+    if config == "numpy-f16":
+        return NumpyVectorIndex(dim=DIM, dtype="float16")
+    if config == "numpy-int8":
+        return NumpyVectorIndex(dim=DIM, dtype="int8")
+    if config == "numpy-int8-rerank":
+        return NumpyVectorIndex(dim=DIM, dtype="int8", rerank=4)
+    if config == "hnsw":
+        from hnsw_index import HNSWVectorIndex
+        return HNSWVectorIndex(dim=DIM)
+    raise ValueError(f"Unknown configuration: {config}")
+
+def make_corpus(size: int, queries: int, seed: int = 0):
+    """Distinct todo descriptions plus (kind, query text, source row) paraphrase triples."""
+    rng = random.Random(seed)
+    verbs, objects = list(VERBS), list(OBJECTS)
+    slots = [len(verbs), len(objects), len(PEOPLE), len(WHEN), len(ADJECTIVES), len(NOUNS)]
+    capacity = int(np.prod(slots))
+    if size > capacity:
+        raise ValueError(f"At most {capacity} distinct todos can be generated")
+    codes = set()
+    while len(codes) < size:
+        codes.update(rng.randrange(capacity) for _ in range(size - len(codes)))
+    rows = []
+    for code in sorted(codes, key=lambda _: rng.random()):
+        parts = []
+        for slot in slots:
+            code, part = divmod(code, slot)
+            parts.append(part)
+        v, o, p, w, a, n = parts
+        rows.append((verbs[v], objects[o], PEOPLE[p], WHEN[w], f"{ADJECTIVES[a]} {NOUNS[n]}"))
+    documents = [f"{v.capitalize()} {o} for {p} {w} (project {project})" for v, o, p, w, project in rows]
+
+    tests = []
+    for kind in ("reworded", "typo", "synonym"):
+        for target in rng.sample(range(size), min(queries, size)):
+            v, o, p, w, project = rows[target]
+            if kind == "reworded":
+                query = f"{project} project: {v} the {o} {w}, for {p}"
+            elif kind == "typo":
+                chars = list(documents[target])
+                for _ in range(2):
+                    i = rng.randrange(len(chars))
+                    chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+                query = "".join(chars)
+            else:
+                query = f"{VERBS[v].capitalize()} {OBJECTS[o]} for {p} {w} (project {project})"
+            tests.append((kind, query, target))
+    return documents, tests
+
+def embed_to_file(embedder, texts, path: str, batch_size: int = 4096) -> float:
+    """Embed texts into a float32 .npy memmap; returns docs/sec."""
+    matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(texts), DIM))
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        vectors = np.asarray(embedder.embed_documents(texts[start:start + batch_size]), dtype=np.float32)
+        matrix[start:start + len(vectors)] = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    matrix.flush()
+    return len(texts) / (time.perf_counter() - started)
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, chunk: int = 100_000) -> np.ndarray:
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(corpus), chunk):
+        scores = queries @ np.asarray(corpus[start:start + chunk]).T
+        top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        best_ids = np.concatenate([best_ids, top + start], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        best_ids = np.take_along_axis(best_ids, keep, axis=1)
+    return best_ids
+
+def rss_anon_mb() -> float:
+    # File-backed pages of the memory-mapped corpus are not counted
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def run_config(config: str, corpus_path: str, queries_path: str, k: int, results):
+    try:
+        corpus = np.load(corpus_path, mmap_mode="r")
+        queries = np.load(queries_path)
+        baseline = rss_anon_mb()
+        index = build_config(config)
+        started = time.perf_counter()
+        for start in range(0, len(corpus), 1000):
+            batch = np.asarray(corpus[start:start + 1000])
+            ids = list(range(start, start + len(batch)))
+            if hasattr(index, "apply"):
+                index.apply(ids, batch, [{"id": i} for i in ids])
+            else:
+                index.upsert(ids, batch, [{"id": i} for i in ids])
+        if hasattr(index, "compact"):
+            index.compact()
+        build_seconds = time.perf_counter() - started
+        memory = rss_anon_mb() - baseline
+
+        hits, latencies = [], []
+        for query in queries:
+            started = time.perf_counter()
+            hits.append([hit[0] for hit in index.search(query, k)])
+            latencies.append(time.perf_counter() - started)
+        index.close()
+        latencies_ms = np.array(latencies) * 1000
+        results.put({
+            "build_s": build_seconds,
+            "p50_ms": float(np.percentile(latencies_ms, 50)),
+            "p99_ms": float(np.percentile(latencies_ms, 99)),
+            "rss_mb": memory,
+            "hits": hits,
+        })
+    except Exception as e:
+        results.put({"error": str(e)})
+
+def benchmark_size(size: int, args, embedder, workdir: str) -> list:
+    documents, tests = make_corpus(size, args.queries)
+    corpus_path = os.path.join(workdir, f"corpus_{size}.npy")
+    queries_path = os.path.join(workdir, f"queries_{size}.npy")
+    docs_per_sec = embed_to_file(embedder, documents, corpus_path)
+    del documents
+    queries = np.asarray(embedder.embed_documents([query for _, query, _ in tests]), dtype=np.float32)
+    queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    np.save(queries_path, queries)
+    corpus = np.load(corpus_path, mmap_mode="r")
+    exact = exact_top_k(corpus, queries, args.k)
+    targets = np.array([target for _, _, target in tests])
+    kinds = np.array([kind for kind, _, _ in tests])
+
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for config in args.configs:
+        row = {"config": config, "size": size, "k": args.k, "embedder": embedder.name,
+               "embed_docs_per_sec": docs_per_sec}
+        if not args.no_limits and size > SIZE_LIMITS.get(config, size):
+            rows.append({**row, "skipped": f"size above {SIZE_LIMITS[config]}; pass --no-limits to run it"})
+            continue
+        results = ctx.Queue()
+        proc = ctx.Process(target=run_config, args=(config, corpus_path, queries_path, args.k, results))
+        proc.start()
+        result = results.get()
+        proc.join()
+        if "error" in result:
+            rows.append({**row, "error": result["error"]})
+            continue
+        hits = [set(ids) for ids in result.pop("hits")]
+        found = np.array([target in ids for target, ids in zip(targets, hits)])
+        row.update(result)
+        row["paraphrase_recall"] = float(found.mean())
+        row["paraphrase_recall_by_kind"] = {kind: float(found[kinds == kind].mean()) for kind in ("reworded", "typo", "synonym")}
+        row["ann_recall"] = float(np.mean([len(ids & set(expected.tolist())) / args.k for ids, expected in zip(hits, exact)]))
+        rows.append(row)
+        print(f"{config:<18} {size:>8} {row['build_s']:>9.2f} {row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} "
+              f"{row['paraphrase_recall']:>11.3f} {row['ann_recall']:>9.3f} {row['rss_mb']:>8.1f}", flush=True)
+    return rows
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = {(row["config"], row["size"]): row for row in json.load(f)["results"]}
+    with open(after_path) as f:
+        after = json.load(f)["results"]
+    print(f"{'config':<18} {'size':>8} {'build':>8} {'p50':>8} {'p99':>8} {'recall':>8} {'rss':>8}")
+    for row in after:
+        old = before.get((row["config"], row["size"]))
+        if old is None or "p50_ms" not in row or "p50_ms" not in old:
+            continue
+        ratios = [row[key] / old[key] if old[key] else float("nan") for key in ("build_s", "p50_ms", "p99_ms")]
+        print(f"{row['config']:<18} {row['size']:>8} " + " ".join(f"{ratio:>7.2f}x" for ratio in ratios)
+              + f" {row['paraphrase_recall'] - old['paraphrase_recall']:>+8.3f} {row['rss_mb'] - old['rss_mb']:>+8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval configurations on synthetic todos; writes JSON")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=100, help="Paraphrased queries per kind")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--configs", nargs="+", default=CONFIGS, choices=CONFIGS)
+    parser.add_argument("--embedder", default="hashing", help="Embedding backend for corpus and queries")
+    parser.add_argument("--no-limits", action="store_true", help="Also run configurations above their SIZE_LIMITS")
+    parser.add_argument("--out", help="JSON output path (default: print to stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Print the change between two JSON runs")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    embedder = create_embedder(args.embedder)
+    embedder.load()
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "numpy": np.__version__,
+                    "platform": platform.platform(), "cpus": os.cpu_count()},
+        "args": {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+        "results": [],
+    }
+    print(f"{'config':<18} {'size':>8} {'build s':>9} {'p50 ms':>8} {'p99 ms':>8} {'paraphrase':>11} {'ann':>9} {'RSS MB':>8}")
+    with tempfile.TemporaryDirectory(prefix="retrieval-bench-") as workdir:
+        for size in args.sizes:
+            report["results"].extend(benchmark_size(size, args, embedder, workdir))
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
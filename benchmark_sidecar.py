@@ -0,0 +1,108 @@
+# benchmark_sidecar.py
+"""
+Memory and search latency of N API workers with and without the RAG sidecar.
+
+Each worker is a separate process, like a uvicorn worker. Without the sidecar
+every worker loads the embedding model and builds its own index; with it they
+share the sidecar's over a Unix socket. All workers search concurrently.
+Memory is the summed resident set size of every process involved.
+
+Usage:
+    python benchmark_sidecar.py --workers 1 2 4 --todos 5000 --queries 200
+"""
+
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def worker(index: int, queries: int, ready, start, results):
+    import database
+    from rag import RAGService, get_rag_service
+    # get_rag_service picks the sidecar client when RAG_SIDECAR_SOCKET is set
+    rag = get_rag_service() if database.RAG_SIDECAR_SOCKET else RAGService()
+    rag.ensure_ready()
+    ready.put(os.getpid())
+    start.wait()
+    rng = np.random.default_rng(index)
+    latencies = []
+    for _ in range(queries):
+        # Distinct texts so the result cache does not answer for the index
+        query = f"task {int(rng.integers(0, 10**9))} about topic {int(rng.integers(0, 50))}"
+        began = time.perf_counter()
+        rag.search_similar_tasks(query, k=5)
+        latencies.append(time.perf_counter() - began)
+    results.put(latencies)
+
+def run(workers: int, queries: int, sidecar_pid=None) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    ready, results, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=worker, args=(i, queries, ready, start, results)) for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    pids = [ready.get() for _ in procs]
+    memory = sum(rss_mb(pid) for pid in pids) + (rss_mb(sidecar_pid) if sidecar_pid else 0.0)
+    start.set()
+    latencies = np.concatenate([results.get() for _ in procs]) * 1000
+    for proc in procs:
+        proc.join()
+    return {"rss_mb": memory, "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))}
+
+def seed_database(todos: int):
+    import database
+    import models
+    models.Base.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    db.bulk_save_objects([
+        models.TodoDB(description=f"task {i} about topic {i % 50}", completed=i % 3 == 0, category="Work")
+        for i in range(todos)
+    ])
+    db.commit()
+    db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare N workers with and without the RAG sidecar")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--todos", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200, help="Searches per worker")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="sidecar-bench-")
+    # Set before the first import of database so this process and every child use it
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/todos.db"
+    os.environ["EMBEDDING_CACHE_PATH"] = f"{tmp}/embedding_cache.db"
+    os.environ["RAG_WARMUP"] = "false"
+    seed_database(args.todos)
+
+    print(f"{'mode':<10} {'workers':>7} {'RSS MB':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        os.environ.pop("RAG_SIDECAR_SOCKET", None)
+        r = run(workers, args.queries)
+        print(f"{'in-process':<10} {workers:>7} {r['rss_mb']:>8.1f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+
+        socket_path = f"{tmp}/rag.sock"
+        sidecar = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_sidecar.py"),
+                                    "--socket", socket_path], stdout=subprocess.DEVNULL)
+        while not os.path.exists(socket_path):
+            time.sleep(0.05)
+        os.environ["RAG_SIDECAR_SOCKET"] = socket_path
+        try:
+            r = run(workers, args.queries, sidecar_pid=sidecar.pid)
+        finally:
+            sidecar.terminate()
+            sidecar.wait()
+        print(f"{'sidecar':<10} {workers:>7} {r['rss_mb']:>8.1f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import heapq
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import database
+import models
+
+class CategorizeWorker:
+    """
+    Background worker that categorizes and indexes todos created as pending.
+
+    POST /todos inserts the row with category_pending set and enqueues its id.
+    The worker collects ids for up to `linger` seconds (or until `batch_size`
+    are waiting), indexes the batch so search finds it straight away, then
+    categorizes it in one call, so the local classifier embeds it in one go and
+    only its unsure tasks reach the LLM. Categories are written back only to
+    rows still pending, so an edit made in the meantime wins. A failed batch is
+    retried after `retry_delay` seconds, doubling per attempt, up to
+    `max_retries` times; rows still pending after that, or left pending by a
+    restart, are picked up by a sweep when the worker starts.
+    """
+
+    def __init__(self, categorize: Callable[[List[str], List[bool]], List[str]], index=None,
+                 session_factory=database.SessionLocal, batch_size: int = database.CATEGORIZE_BATCH_SIZE,
+                 linger: float = database.CATEGORIZE_LINGER_SECONDS,
+                 retry_delay: float = database.CATEGORIZE_RETRY_SECONDS,
+                 max_retries: int = database.CATEGORIZE_MAX_RETRIES):
+        self.categorize = categorize
+        # Called with rows to (re-)index and the time.monotonic() from before they were read:
+        # once when their batch starts and again with the rows whose category was written
+        self.index = index
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.linger = linger
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.categorized = 0
+        self.batches = 0
+        self.errors = 0
+        self.abandoned = 0
+        self._queue: Dict[int, None] = {}
+        # Failed attempts per queued id, and (due time, ids) of batches waiting to be retried
+        self._attempts: Dict[int, int] = {}
+        self._retries: List[Tuple[float, List[int]]] = []
+        self._busy = False
+        self._condition = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stop = False
+            # Busy until the startup sweep has queued the pending rows, so wait_idle waits for them
+            self._busy = True
+            self._thread = threading.Thread(target=self._run, name="categorize", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, todo_ids: Iterable[int]):
+        with self._condition:
+            for todo_id in todo_ids:
+                self._queue[todo_id] = None
+            self._condition.notify()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queue is empty and no batch is running or waiting to retry; False on timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while self._queue or self._busy or self._retries:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def shutdown(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            queued = len(self._queue)
+            retrying = sum(len(ids) for _, ids in self._retries)
+        return {"queued": queued, "retrying": retrying, "categorized": self.categorized, "batches": self.batches,
+                "errors": self.errors, "abandoned": self.abandoned}
+
+    def _run(self):
+        self._sweep()
+        with self._condition:
+            self._busy = False
+            self._condition.notify_all()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._categorize_batch(batch)
+                failed = False
+            except Exception as e:
+                print(f"Background categorization failed: {str(e)}")
+                self.errors += 1
+                failed = True
+            with self._condition:
+                if failed:
+                    self._schedule_retry(batch)
+                else:
+                    for todo_id in batch:
+                        self._attempts.pop(todo_id, None)
+                self._busy = False
+                self._condition.notify_all()
+
+    def _schedule_retry(self, batch: List[int]):
+        # Called with the condition held
+        attempt = max(self._attempts.get(todo_id, 0) for todo_id in batch) + 1
+        if attempt > self.max_retries:
+            # The rows stay pending and are retried by the sweep on the next start
+            print(f"Giving up on categorizing {len(batch)} todos after {self.max_retries} retries")
+            for todo_id in batch:
+                self._attempts.pop(todo_id, None)
+            self.abandoned += len(batch)
+            return
+        for todo_id in batch:
+            self._attempts[todo_id] = attempt
+        heapq.heappush(self._retries, (time.monotonic() + self.retry_delay * 2 ** (attempt - 1), batch))
+
+    def _sweep(self):
+        db = self.session_factory()
+        try:
+            rows = db.query(models.TodoDB.id).filter(models.TodoDB.category_pending.is_(True)).all()
+            self.enqueue(todo_id for (todo_id,) in rows)
+        except Exception as e:
+            print(f"Error finding pending todos: {str(e)}")
+        finally:
+            db.close()
+
+    def _next_batch(self) -> Optional[List[int]]:
+        with self._condition:
+            while True:
+                if self._stop:
+                    return None
+                now = time.monotonic()
+                while self._retries and self._retries[0][0] <= now:
+                    for todo_id in heapq.heappop(self._retries)[1]:
+                        self._queue[todo_id] = None
+                if self._queue:
+                    break
+                self._condition.wait(self._retries[0][0] - now if self._retries else None)
+            # Give a burst of creates a moment to join the same batch
+            deadline = time.monotonic() + self.linger
+            while len(self._queue) < self.batch_size and not self._stop:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = list(self._queue)[:self.batch_size]
+            for todo_id in batch:
+                del self._queue[todo_id]
+            self._busy = True
+            return batch
+
+    def _categorize_batch(self, todo_ids: List[int]):
+        db = self.session_factory()
+        try:
+            read_at = time.monotonic()
+            rows = (
+                db.query(models.TodoDB)
+                .filter(models.TodoDB.id.in_(todo_ids), models.TodoDB.category_pending.is_(True))
+                .all()
+            )
+            if not rows:
+                return
+            if self.index is not None:
+                # read_at lets the index drop rows deleted after this read
+                self.index(rows, read_at)
+            categories = self.categorize([row.description for row in rows], [row.completed for row in rows])
+            updated = []
+            for row, category in zip(rows, categories):
+                # Conditional, so a category set by the user meanwhile is kept
+                count = (
+                    db.query(models.TodoDB)
+                    .filter(models.TodoDB.id == row.id, models.TodoDB.category_pending.is_(True))
+                    .update({"category": category, "category_source": models.CATEGORY_SOURCE_MODEL,
+                             "category_pending": False}, synchronize_session=False)
+                )
+                if count:
+                    updated.append(row.id)
+            if updated:
+                database.bump_write_version(db)
+            db.commit()
+            self.batches += 1
+            self.categorized += len(updated)
+            if not updated:
+                return
+            if self.index is not None:
+                db.expire_all()
+                read_at = time.monotonic()
+                self.index(db.query(models.TodoDB).filter(models.TodoDB.id.in_(updated)).all(), read_at)
+        finally:
+            db.close()
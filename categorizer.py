@@ -0,0 +1,99 @@
+import threading
+from typing import List, Dict, Tuple, Optional, Sequence
+import numpy as np
+import models
+
+class CentroidCategorizer:
+    """
+    Nearest-centroid classifier over todo embeddings.
+
+    Each category keeps the sum and count of its todos' normalized embeddings, so
+    adding, removing or relabelling a todo is an O(dim) update and the model is
+    always trained on the current labels. Callers pass None for todos whose label
+    should not be learned, such as ones the model categorized itself. A prediction
+    is one matrix product against the normalized centroids.
+
+    Predictions whose margin (best minus second-best cosine similarity) is below
+    min_margin, or made before at least two categories have min_examples todos,
+    are returned as None so the caller can fall back to the LLM.
+    """
+
+    def __init__(self, min_examples: int = 3, min_margin: float = 0.05):
+        self.min_examples = min_examples
+        self.min_margin = min_margin
+        self._sums: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, int] = {}
+        # (labels, normalized centroid matrix) of the categories eligible for prediction
+        self._centroids: Optional[Tuple[List[str], np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _add(self, vectors: Sequence[Sequence[float]], labels: Sequence[Optional[str]], sign: int):
+        if not len(vectors):
+            return
+        matrix = self._normalize(vectors)
+        with self._lock:
+            for row, label in zip(matrix, labels):
+                # None: not a training label (see RAGService._training_label)
+                if not label or label == models.PENDING_CATEGORY:
+                    continue
+                if label not in self._sums:
+                    self._sums[label] = np.zeros_like(row)
+                    self._counts[label] = 0
+                self._sums[label] += sign * row
+                self._counts[label] += sign
+                if self._counts[label] <= 0:
+                    del self._sums[label], self._counts[label]
+            self._centroids = None
+
+    def learn(self, vectors: Sequence[Sequence[float]], labels: Sequence[Optional[str]]):
+        self._add(vectors, labels, 1)
+
+    def forget(self, vectors: Sequence[Sequence[float]], labels: Sequence[Optional[str]]):
+        self._add(vectors, labels, -1)
+
+    def clear(self):
+        with self._lock:
+            self._sums.clear()
+            self._counts.clear()
+            self._centroids = None
+
+    def _eligible(self) -> Tuple[List[str], np.ndarray]:
+        centroids = self._centroids
+        if centroids is None:
+            with self._lock:
+                labels = sorted(label for label, count in self._counts.items() if count >= self.min_examples)
+                matrix = self._normalize([self._sums[label] for label in labels]) if labels else np.zeros((0, 0), np.float32)
+                centroids = self._centroids = (labels, matrix)
+        return centroids
+
+    def predict(self, vectors: Sequence[Sequence[float]],
+                min_margin: Optional[float] = None) -> List[Tuple[Optional[str], float]]:
+        """
+        Categorize a batch of embeddings.
+
+        Args:
+            vectors (list): Embeddings to categorize
+            min_margin (float): Overrides self.min_margin; 0 returns the best guess
+
+        Returns:
+            List[Tuple[Optional[str], float]]: (category or None if unsure, margin) per vector
+        """
+        labels, centroids = self._eligible()
+        if len(labels) < 2 or not len(vectors):
+            return [(None, 0.0) for _ in vectors]
+        scores = self._normalize(vectors) @ centroids.T
+        top_two = np.sort(np.partition(scores, -2, axis=1)[:, -2:], axis=1)
+        margins = top_two[:, 1] - top_two[:, 0]
+        best = scores.argmax(axis=1)
+        min_margin = self.min_margin if min_margin is None else min_margin
+        return [(labels[i] if margin >= min_margin else None, float(margin))
+                for i, margin in zip(best.tolist(), margins.tolist())]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._counts)
@@ -0,0 +1,99 @@
+from typing import Optional, Sequence
+import numpy as np
+
+class MiniBatchKMeans:
+    """
+    Spherical mini-batch k-means (Sculley, 2010) over unit-length embeddings.
+
+    Points go to the centroid with the highest cosine similarity, and every
+    centroid moves towards its points with a per-centroid learning rate of
+    1 / (points seen), so partial_fit can keep absorbing new todos without
+    revisiting old ones. Each step is a matrix product plus a bincount-style
+    scatter; nothing loops over points in Python.
+    """
+
+    def __init__(self, k: int, seed: int = 0, n_init: int = 3):
+        self.k = k
+        self.n_init = n_init
+        self.centers: Optional[np.ndarray] = None
+        self.counts: Optional[np.ndarray] = None
+        self._rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def _normalize(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _seed(self, points: np.ndarray) -> np.ndarray:
+        # k-means++: later centers favour points far from earlier ones
+        centers = [points[self._rng.integers(len(points))]]
+        distance = 1.0 - points @ centers[0]
+        for _ in range(1, min(self.k, len(points))):
+            weights = np.maximum(distance, 0)
+            total = weights.sum()
+            choice = self._rng.choice(len(points), p=weights / total) if total > 0 else self._rng.integers(len(points))
+            centers.append(points[choice])
+            distance = np.minimum(distance, 1.0 - points @ points[choice])
+        return np.array(centers, dtype=np.float32)
+
+    def _init_centers(self, points: np.ndarray, refine_steps: int = 3):
+        # A bad seeding can merge two topics for good, so try n_init seedings on the first
+        # batch, refine each with a few full-batch steps and keep the tightest
+        best, best_score = None, -np.inf
+        for _ in range(self.n_init):
+            centers = self._seed(points)
+            for _ in range(refine_steps):
+                labels = (points @ centers.T).argmax(axis=1)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, labels, points)
+                filled = np.bincount(labels, minlength=len(centers)) > 0
+                centers[filled] = self._normalize(sums[filled])
+            score = (points @ centers.T).max(axis=1).mean()
+            if score > best_score:
+                best, best_score = centers, score
+        self.centers = best
+        self.counts = np.zeros(len(best), dtype=np.float64)
+
+    def partial_fit(self, vectors: Sequence[Sequence[float]]) -> "MiniBatchKMeans":
+        if not len(vectors):
+            return self
+        points = self._normalize(vectors)
+        if self.centers is None:
+            self._init_centers(points)
+        labels = (points @ self.centers.T).argmax(axis=1)
+        batch_counts = np.bincount(labels, minlength=len(self.centers)).astype(np.float64)
+        sums = np.zeros_like(self.centers, dtype=np.float64)
+        np.add.at(sums, labels, points)
+        moved = batch_counts > 0
+        self.counts += batch_counts
+        # Same as applying c += (x - c) / count point by point, one centroid at a time
+        rate = (batch_counts[moved] / self.counts[moved])[:, None]
+        updated = (1 - rate) * self.centers[moved] + rate * (sums[moved] / batch_counts[moved][:, None])
+        self.centers[moved] = self._normalize(updated)
+        return self
+
+    def fit(self, batches, epochs: int = 3) -> "MiniBatchKMeans":
+        """
+        Fit from scratch.
+
+        Args:
+            batches (callable): Returns an iterable of vector batches; called once per epoch
+            epochs (int): Passes over the data
+        """
+        self.centers = self.counts = None
+        for _ in range(epochs):
+            for batch in batches():
+                self.partial_fit(batch)
+        return self
+
+    def predict(self, vectors: Sequence[Sequence[float]]):
+        """
+        Returns:
+            tuple: (cluster per vector, cosine similarity to that cluster's centroid)
+        """
+        if self.centers is None or not len(vectors):
+            return np.zeros(len(vectors), dtype=np.int64), np.zeros(len(vectors), dtype=np.float32)
+        scores = self._normalize(vectors) @ self.centers.T
+        labels = scores.argmax(axis=1)
+        return labels, scores[np.arange(len(labels)), labels]
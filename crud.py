@@ -1,6 +1,10 @@
+import time
+from typing import List, Optional
 from sqlalchemy.orm import Session
 import models
+import database
 from ai_interface import get_ai_model
+from rag import get_rag_service
 
 def get_todo(db: Session, todo_id: int):
     return db.query(models.TodoDB).filter(models.TodoDB.id == todo_id).first()
@@ -8,16 +12,42 @@ def get_todo(db: Session, todo_id: int):
 def get_todos(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.TodoDB).offset(skip).limit(limit).all()
 
+def categorize_tasks(descriptions: List[str], completed: Optional[List[bool]] = None) -> List[str]:
+    # Local embedding classifier first; the remote model only for tasks it is unsure about
+    completed = completed or [False] * len(descriptions)
+    categories = get_rag_service().categorize_tasks(descriptions, completed)
+    unsure = [i for i, category in enumerate(categories) if category is None]
+    if unsure:
+        try:
+            # One prompt per AI_CATEGORIZE_BATCH_SIZE tasks rather than a round trip each
+            batched = get_ai_model().categorize_tasks([descriptions[i] for i in unsure])
+        except ValueError as e:
+            # No API token: the classifier's best guess below still gives every task a category
+            print(f"AI model not configured: {str(e)}")
+            batched = []
+        for i, category in zip(unsure, batched):
+            categories[i] = category
+    unanswered = [i for i, category in enumerate(categories) if category is None]
+    if unanswered:
+        # No usable label from the model either: take the classifier's best guess, however close
+        guesses = get_rag_service().categorize_tasks(
+            [descriptions[i] for i in unanswered], [completed[i] for i in unanswered], min_margin=0.0)
+        for i, category in zip(unanswered, guesses):
+            # Same default as AIModel.categorize_task before the classifier has two categories
+            categories[i] = category or "Personal"
+    return categories
+
 def create_todo(db: Session, todo: models.TodoCreate):
-    # Auto-categorize the task using AI
-    ai_model = get_ai_model()
-    category = ai_model.categorize_task(todo.description)
+    # Stored as pending; the background categorizer (categorize_worker.py) sets the category
+    # and indexes the todo, so creating one never waits on the AI or embedding model
     db_todo = models.TodoDB(
         description=todo.description,
         completed=todo.completed,
-        category=category
+        category=models.PENDING_CATEGORY,
+        category_pending=True
     )
     db.add(db_todo)
+    database.bump_write_version(db)
     db.commit()
     db.refresh(db_todo)
     return db_todo
@@ -31,9 +61,19 @@ def update_todo(db: Session, todo_id: int, todo_update: models.TodoUpdate):
     update_data = todo_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_todo, key, value)
+    if "category" in update_data:
+        # Setting a category, even the one the model picked, confirms it as a training label
+        # and ends a pending categorization
+        db_todo.category_source = models.CATEGORY_SOURCE_USER
+        db_todo.category_pending = False
 
+    database.bump_write_version(db)
     db.commit()
+    # Taken before the row is re-read, so a DELETE committed after that is not undone by the upsert
+    read_at = time.monotonic()
     db.refresh(db_todo)
+    # Re-embeds only if the description or status actually changed
+    get_rag_service().upsert_todo(db_todo, read_at=read_at)
     return db_todo
 
 def delete_todo(db: Session, todo_id: int):
@@ -41,5 +81,7 @@ def delete_todo(db: Session, todo_id: int):
     if not db_todo:
         return False
     db.delete(db_todo)
+    database.bump_write_version(db)
     db.commit()
+    get_rag_service().delete_todo(todo_id)
     return True
\ No newline at end of file
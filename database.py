@@ -1,16 +1,89 @@
 # my_todo_app/database.py
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
+from dotenv import load_dotenv
+
+# Load .env before any setting below is read; main.py imports this module first
+load_dotenv()
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./todos.db")
+# "qdrant" (default), "numpy" for the in-process brute-force matrix or "hnsw" for the approximate graph index
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+# numpy backend storage: "float32", "float16" or "int8"; VECTOR_RERANK > 0 re-scores
+# the top k * VECTOR_RERANK compressed hits against exact vectors kept in a memory-mapped file
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", "4"))
+# Default retrieval for similarity search: "hybrid" (BM25 + vectors), "vector" or "lexical"
+RAG_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "hybrid")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Load the embedding model in a background thread at startup instead of on first semantic search
+RAG_WARMUP = os.getenv("RAG_WARMUP", "true").lower() in ("1", "true", "yes")
+# A failed warm-up (e.g. the model download) is retried after this many seconds, doubling per
+# attempt up to RAG_WARMUP_RETRY_MAX_SECONDS; 0 leaves it failed until the process restarts
+RAG_WARMUP_RETRY_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_SECONDS", "5"))
+RAG_WARMUP_RETRY_MAX_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_MAX_SECONDS", "300"))
+# Directory for Qdrant's on-disk storage; empty keeps the vector index in memory
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "")
+# "huggingface" (all-MiniLM-L6-v2) or "hashing" (NumPy feature hashing, no model download)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface")
+# SQLite file caching embeddings by text hash; empty disables the cache
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+# In-memory LRU sizes for query vectors and search results (0 disables)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "1024"))
+# Largest offset GET /api/search accepts, and how many ranked candidates hybrid search fuses
+# per query (at most up to that offset). Every page of a hybrid query is sliced from the one
+# fused ranking, so pages never repeat or skip a task; hybrid results end after it
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "5000"))
+HYBRID_FUSION_DEPTH = int(os.getenv("HYBRID_FUSION_DEPTH", "1000"))
+# Writes buffered in the snapshot delta before they are folded into the vector backend
+SNAPSHOT_DELTA_LIMIT = int(os.getenv("SNAPSHOT_DELTA_LIMIT", "256"))
+# Estimated tokens of task list put into AI prompts, and how many retrieval hits rank it
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_RETRIEVAL_DEPTH = int(os.getenv("CONTEXT_RETRIEVAL_DEPTH", "50"))
+# Rendered prompt contexts kept per (write version, user context, query); 0 disables
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "64"))
+# Embedding processes for the background reindex job (0 = one per core) and rows per batch
+REINDEX_WORKERS = int(os.getenv("REINDEX_WORKERS", "0"))
+REINDEX_CHUNK_SIZE = int(os.getenv("REINDEX_CHUNK_SIZE", "256"))
+# Neighbours precomputed per todo for GET /todos/{id}/related
+RELATED_GRAPH_K = int(os.getenv("RELATED_GRAPH_K", "10"))
+# Local categorizer: todos a category needs before it is predicted, and the minimum
+# similarity margin over the runner-up below which the LLM decides instead
+CATEGORIZER_MIN_EXAMPLES = int(os.getenv("CATEGORIZER_MIN_EXAMPLES", "3"))
+CATEGORIZER_MIN_MARGIN = float(os.getenv("CATEGORIZER_MIN_MARGIN", "0.05"))
+# Background categorization of new todos: most todos per batch, and seconds to wait
+# for more to arrive before a batch is sent
+CATEGORIZE_BATCH_SIZE = int(os.getenv("CATEGORIZE_BATCH_SIZE", "32"))
+CATEGORIZE_LINGER_SECONDS = float(os.getenv("CATEGORIZE_LINGER_SECONDS", "0.05"))
+# A failed batch is retried after this many seconds, doubling per attempt, at most
+# CATEGORIZE_MAX_RETRIES times before it is left for the sweep on the next start
+CATEGORIZE_RETRY_SECONDS = float(os.getenv("CATEGORIZE_RETRY_SECONDS", "1.0"))
+CATEGORIZE_MAX_RETRIES = int(os.getenv("CATEGORIZE_MAX_RETRIES", "5"))
+# Topic clusters returned by GET /api/clusters when k is not given
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", "8"))
+# Unix socket of a rag_sidecar.py process that owns the model and index for all workers; empty = in-process
+RAG_SIDECAR_SOCKET = os.getenv("RAG_SIDECAR_SOCKET", "")
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Bumped in the same transaction as every write to the todos table, so data derived from
+# it can be cached until the table changes. The counter is a row in the database
+# (models.WriteVersion), so a write from any process retires the caches of all of them
+def bump_write_version(db) -> None:
+    db.execute(text("UPDATE write_version SET version = version + 1 WHERE id = 1"))
+
+def get_write_version(db) -> int:
+    return db.execute(text("SELECT version FROM write_version WHERE id = 1")).scalar() or 0
+
 Base = declarative_base()
 
 class TodoDB(Base):
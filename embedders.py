@@ -0,0 +1,150 @@
+import re
+import zlib
+from typing import List, Sequence, Tuple
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+class Embedder:
+    """
+    Interface shared by the text embedders behind RAGService.
+
+    Mirrors the langchain embed_documents / embed_query methods so an embedder can
+    be wrapped by CachedEmbeddings. name identifies the vectors it produces: it is
+    stored with every indexed point and keys the embedding cache, so switching
+    embedders re-embeds instead of mixing vector spaces.
+    """
+
+    name = ""
+    dim = 384
+    # Whether looking a vector up in the on-disk embedding cache beats computing it again
+    cacheable = True
+
+    def load(self):
+        """Load model weights; called once during warm-up, before the first embedding."""
+        pass
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class HuggingFaceEmbedder(Embedder):
+    """sentence-transformers model through langchain_huggingface, loaded on first use."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        self.name = model_name
+        self._model = None
+
+    def load(self):
+        if self._model is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            self._model = HuggingFaceEmbeddings(
+                model_name=self.name,
+                model_kwargs={'device': 'cpu'}  # Explicitly set device
+            )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.load()
+        return self._model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.load()
+        return self._model.embed_query(text)
+
+def _mix32(h: np.ndarray) -> np.ndarray:
+    # murmur3 finalizer on uint64 arrays holding 32-bit values; spreads rolling hashes over all bits
+    h = h ^ (h >> np.uint64(16))
+    h = (h * np.uint64(0x85EBCA6B)) & _MASK32
+    h = h ^ (h >> np.uint64(13))
+    h = (h * np.uint64(0xC2B2AE35)) & _MASK32
+    return h ^ (h >> np.uint64(16))
+
+class HashingEmbedder(Embedder):
+    """
+    Feature-hashing embedder: character n-grams plus word tokens, no model files.
+
+    Each feature is hashed to one of dim buckets with a +/-1 sign, the n-gram and
+    word parts are L2-normalized separately and summed, and the result is
+    normalized again. The n-grams of a whole batch are hashed at once with NumPy
+    (a rolling hash over the concatenated UTF-8 bytes). It matches on shared
+    words and spellings, not meaning: "buy milk" and "purchase dairy" are far apart.
+    """
+
+    cacheable = False
+
+    def __init__(self, dim: int = 384, ngram_range: Tuple[int, int] = (3, 5), word_weight: float = 1.0):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.word_weight = word_weight
+        self.name = f"hashing-{dim}-{ngram_range[0]}{ngram_range[1]}"
+
+    def _buckets(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        hashes = _mix32(hashes)
+        signs = np.where(hashes & np.uint64(0x80000000), -1.0, 1.0)
+        return (hashes % np.uint64(self.dim)).astype(np.int64), signs
+
+    def _accumulate(self, rows: np.ndarray, hashes: np.ndarray, count: int) -> np.ndarray:
+        buckets, signs = self._buckets(hashes)
+        flat = np.bincount(rows * self.dim + buckets, weights=signs, minlength=count * self.dim)
+        matrix = flat.reshape(count, self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _char_ngrams(self, texts: Sequence[str]) -> np.ndarray:
+        # Spaces mark the start and end of each text, like word boundaries inside it
+        encoded = [f" {text.lower()} ".encode("utf-8") for text in texts]
+        lengths = np.array([len(data) for data in encoded], dtype=np.int64)
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        ends = np.repeat(np.cumsum(lengths), lengths)
+        rows_all = np.repeat(np.arange(len(texts)), lengths)
+        positions = np.arange(len(data))
+        rows, hashes = [], []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            valid = positions + n <= ends
+            starts = positions[valid]
+            h = np.full(len(starts), n, dtype=np.uint64)
+            for offset in range(n):
+                h = (h * np.uint64(16777619) + data[starts + offset]) & _MASK32
+            rows.append(rows_all[valid])
+            hashes.append(h)
+        return self._accumulate(np.concatenate(rows), np.concatenate(hashes), len(texts))
+
+    def _words(self, texts: Sequence[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                rows.append(row)
+                hashes.append(zlib.crc32(word.encode("utf-8")))
+        return self._accumulate(np.array(rows, dtype=np.int64), np.array(hashes, dtype=np.uint64), len(texts))
+
+    def embed_matrix(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a batch into a (len(texts), dim) float32 array of unit vectors."""
+        if not len(texts):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        matrix = self._char_ngrams(texts) + self.word_weight * self._words(texts)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+def create_embedder(backend: str, dim: int = 384, model_name: str = "all-MiniLM-L6-v2") -> Embedder:
+    """
+    Build the embedder selected by name.
+
+    Args:
+        backend (str): "huggingface" (sentence-transformers) or "hashing"
+        dim (int): Vector dimension of the hashing embedder; must match the vector index
+        model_name (str): sentence-transformers model of the huggingface embedder
+
+    Returns:
+        Embedder: The selected embedder, not loaded yet
+    """
+    if backend == "huggingface":
+        return HuggingFaceEmbedder(model_name)
+    if backend == "hashing":
+        return HashingEmbedder(dim=dim)
+    raise ValueError(f"Unknown embedding backend: {backend}")
@@ -0,0 +1,223 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache stored in SQLite.
+
+    Entries are keyed by a hash of the normalized text and the model name, and the
+    least recently used entries are evicted once max_entries is exceeded. Hits only
+    note their use time in memory; it is written back in batches (with the next
+    insert, before an eviction, every `flush_entries` hits or `flush_seconds`), so
+    a cache read is never a database write.
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = 100000,
+                 flush_entries: int = 1000, flush_seconds: float = 60.0):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.flush_entries = flush_entries
+        self.flush_seconds = flush_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> last use time, not yet written to the embeddings table
+        self._touched: Dict[str, float] = {}
+        self._flushed_at = time.monotonic()
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+
+        # Vectors from a different model are useless, so start over when it changes
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'model_name'").fetchone()
+        if row is None or row[0] != model_name:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model_name', ?)", (model_name,))
+        self.conn.commit()
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        # all-MiniLM-L6-v2 is uncased, so case and spacing never change the vector
+        return " ".join(text.lower().split())
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        keys = [self._key(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique_keys = list(set(keys))
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                for key in found:
+                    self._touched[key] = now
+                if (len(self._touched) >= self.flush_entries
+                        or time.monotonic() - self._flushed_at >= self.flush_seconds):
+                    self._flush_touched()
+                    self.conn.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for vector in results if vector is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = [
+            (self._key(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._entries += self.conn.total_changes - before
+            # Rides on this commit, and eviction must see recent use
+            self._flush_touched()
+            if self._entries > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._flushed_at = time.monotonic()
+
+    def _evict(self):
+        # Trim to 90% of the bound so eviction does not run on every insert
+        excess = self._entries - int(self.max_entries * 0.9)
+        self.conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM embeddings")
+            self.conn.commit()
+            self._entries = 0
+            self._touched.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": self._entries,
+                "max_entries": self.max_entries,
+                "model_name": self.model_name,
+            }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self.conn.commit()
+            self.conn.close()
+
+class CachedEmbeddings:
+    """
+    Embeddings wrapper that consults an EmbeddingCache before the underlying model.
+
+    Exposes the same embed_documents / embed_query interface as the langchain
+    embeddings it wraps, so document and query paths share one cache.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing: Dict[str, List[int]] = {}
+        for i, (text, vector) in enumerate(zip(texts, vectors)):
+            if vector is None:
+                missing.setdefault(self.cache.normalize(text), []).append(i)
+        if missing:
+            # Embed each distinct normalized text once, however often it repeats
+            pending = [texts[positions[0]] for positions in missing.values()]
+            embedded = self.embeddings.embed_documents(pending)
+            self.cache.put_many(pending, embedded)
+            for positions, vector in zip(missing.values(), embedded):
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get_many([text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([text], [vector])
+        return vector
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded in-memory LRU map that counts hits and misses.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._data),
+                "max_entries": self.max_size,
+            }
@@ -0,0 +1,375 @@
+import heapq
+import math
+import os
+import pickle
+import random
+import threading
+from typing import List, Dict, Any, Set, Tuple
+import numpy as np
+from vector_index import VectorIndex, FILTER_FIELDS, check_filter
+
+class HNSWVectorIndex(VectorIndex):
+    """
+    Approximate nearest-neighbour index (Hierarchical Navigable Small World graph).
+
+    M bounds the links per node (2*M on the bottom layer), ef_construction is the
+    candidate list size used while inserting and ef_search the one used while
+    querying; larger values trade speed for recall. Deletes and re-embedded
+    upserts leave tombstones that still route searches but are never returned,
+    and the graph is rebuilt off to the side once more than half of its nodes are
+    dead. With a path, the graph is loaded from that file on start, written back
+    every save_every written or deleted points, and on close().
+
+    Vector rows and link lists are never changed once written (a changed list is
+    replaced by a new one), so a save or rebuild copies only the top-level
+    containers under the lock and does the slow part outside it.
+
+    Filtered searches use a payload index of id sets per field value: small
+    matching sets are scored exactly, larger ones are searched through the graph
+    with non-matching nodes skipped like tombstones.
+    """
+
+    # Matching sets up to this size are scored exactly instead of through the graph
+    EXACT_FILTER_LIMIT = 2048
+    # Shared by every instance, so an index and the staging index that takes over its
+    # file never write "{path}.tmp" at the same time
+    _save_lock = threading.Lock()
+
+    def __init__(self, dim: int = 384, M: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 path: str = "", seed: int = 42, save_every: int = 1000):
+        self.dim = dim
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.path = path
+        self.save_every = save_every
+        # Points written or deleted since the last save; a crash loses at most save_every of them
+        self._unsaved = 0
+        # Ids written while a rebuild runs, or None when none is running
+        self._rebuild_dirty = None
+        self._level_mult = 1 / math.log(M)
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._reset()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _reset(self, capacity: int = 1024):
+        self._vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        self._node_ids: List[int] = []               # node -> todo id
+        self._links: List[List[List[int]]] = []      # node -> neighbour list per layer
+        self._nodes: Dict[int, int] = {}             # todo id -> live node
+        self._payloads: Dict[int, Dict[str, Any]] = {}
+        self._payload_index: Dict[Tuple[str, Any], Set[int]] = {}  # (field, value) -> todo ids
+        self._deleted: Set[int] = set()
+        self._entry = -1
+        self._max_level = -1
+
+    def _grow(self, needed: int):
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._node_ids)] = self._vectors[:len(self._node_ids)]
+        self._vectors = vectors
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, level: int) -> List[Tuple[float, int]]:
+        """Best-first search of one layer; returns up to ef (similarity, node) pairs, best first."""
+        visited = set(entry_points)
+        sims = (self._vectors[entry_points] @ query).tolist()
+        candidates = [(-s, n) for s, n in zip(sims, entry_points)]
+        results = [(s, n) for s, n in zip(sims, entry_points)]
+        heapq.heapify(candidates)
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            neighbours = [n for n in self._links[node][level] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            # Score the whole neighbour list with one matrix product
+            for sim, n in zip((self._vectors[neighbours] @ query).tolist(), neighbours):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)
+
+    def _select_neighbours(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """
+        Neighbour selection heuristic from the HNSW paper: skip a candidate that is
+        closer to an already selected neighbour than to the base point, then top up
+        with the skipped ones so nodes keep m links.
+        """
+        if len(candidates) <= 1:
+            return [node for _, node in candidates]
+        nodes = [node for _, node in candidates]
+        # All candidate-to-candidate similarities in one product instead of one per candidate
+        vectors = self._vectors[nodes]
+        pairwise = vectors @ vectors.T
+        # Similarity of every candidate to its closest already selected neighbour
+        closest = np.full(len(nodes), -np.inf, dtype=np.float32)
+        selected: List[int] = []
+        pruned: List[int] = []
+        for i, (sim, _) in enumerate(candidates):
+            if len(selected) >= m:
+                break
+            if closest[i] > sim:
+                pruned.append(i)
+            else:
+                selected.append(i)
+                np.maximum(closest, pairwise[i], out=closest)
+        for i in pruned:
+            if len(selected) >= m:
+                break
+            selected.append(i)
+        return [nodes[i] for i in selected]
+
+    def _insert(self, point_id: int, vector: np.ndarray) -> int:
+        node = len(self._node_ids)
+        self._grow(node + 1)
+        self._vectors[node] = vector
+        self._node_ids.append(point_id)
+        level = int(-math.log(1.0 - self._rng.random()) * self._level_mult)
+        self._links.append([[] for _ in range(level + 1)])
+
+        if self._entry == -1:
+            self._entry, self._max_level = node, level
+            return node
+
+        entry_points = [self._entry]
+        for lc in range(self._max_level, level, -1):
+            entry_points = [self._search_layer(vector, entry_points, 1, lc)[0][1]]
+
+        for lc in range(min(level, self._max_level), -1, -1):
+            candidates = self._search_layer(vector, entry_points, self.ef_construction, lc)
+            m_max = 2 * self.M if lc == 0 else self.M
+            neighbours = self._select_neighbours(candidates, self.M)
+            self._links[node][lc] = neighbours
+            for neighbour in neighbours:
+                links = self._links[neighbour][lc] + [node]
+                if len(links) > m_max:
+                    sims = (self._vectors[links] @ self._vectors[neighbour]).tolist()
+                    links = self._select_neighbours(sorted(zip(sims, links), reverse=True), m_max)
+                # Copy-on-write, so a copy taken by save() or a rebuild never sees the change
+                layers = list(self._links[neighbour])
+                layers[lc] = links
+                self._links[neighbour] = layers
+            entry_points = [n for _, n in candidates]
+
+        if level > self._max_level:
+            self._entry, self._max_level = node, level
+        return node
+
+    def upsert(self, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        for point_id, vector, payload in zip(ids, vectors, payloads):
+            # Lock per insert so searches can run between inserts of a large batch
+            with self._lock:
+                if self._rebuild_dirty is not None:
+                    self._rebuild_dirty.add(point_id)
+                self._index_payload(point_id, payload)
+                self._payloads[point_id] = payload
+                old = self._nodes.get(point_id)
+                if old is not None:
+                    # Payload-only changes keep their place in the graph
+                    if np.allclose(self._vectors[old], vector, atol=1e-6):
+                        continue
+                    self._deleted.add(old)
+                self._nodes[point_id] = self._insert(point_id, vector)
+        self._after_write(len(vectors))
+
+    def delete(self, ids):
+        ids = list(ids)
+        with self._lock:
+            for point_id in ids:
+                node = self._nodes.pop(point_id, None)
+                if node is None:
+                    continue
+                if self._rebuild_dirty is not None:
+                    self._rebuild_dirty.add(point_id)
+                self._unindex_payload(point_id)
+                del self._payloads[point_id]
+                self._deleted.add(node)
+        self._after_write(len(ids))
+
+    def _after_write(self, count: int):
+        with self._lock:
+            self._unsaved += count
+            rebuild = self._rebuild_dirty is None and len(self._deleted) > max(len(self._nodes), 1000)
+            if rebuild:
+                self._rebuild_dirty = set()
+            due = bool(self.path) and self._unsaved >= self.save_every
+        if rebuild:
+            self._rebuild()
+        if due:
+            self.save(self.path)
+
+    def _index_payload(self, point_id: int, payload: Dict[str, Any]):
+        self._unindex_payload(point_id)
+        for field in FILTER_FIELDS:
+            self._payload_index.setdefault((field, payload.get(field)), set()).add(point_id)
+
+    def _unindex_payload(self, point_id: int):
+        old = self._payloads.get(point_id)
+        if old is None:
+            return
+        for field in FILTER_FIELDS:
+            ids = self._payload_index.get((field, old.get(field)))
+            if ids is not None:
+                ids.discard(point_id)
+                if not ids:
+                    del self._payload_index[(field, old.get(field))]
+
+    def _matching_ids(self, filter) -> Set[int]:
+        sets = sorted((self._payload_index.get((field, value), set()) for field, value in filter.items()), key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def _rebuild(self):
+        # Searches and writes go on against the old graph while the new one is built
+        with self._lock:
+            vectors, nodes = self._vectors, dict(self._nodes)
+        fresh = HNSWVectorIndex(dim=self.dim, M=self.M, ef_construction=self.ef_construction,
+                                ef_search=self.ef_search)
+        fresh._reset(capacity=max(1024, len(nodes)))
+        for point_id, node in nodes.items():
+            fresh._nodes[point_id] = fresh._insert(point_id, vectors[node])
+        with self._lock:
+            # Bring the ids written meanwhile up to date, then swap the graph in
+            for point_id in self._rebuild_dirty:
+                stale = fresh._nodes.pop(point_id, None)
+                if stale is not None:
+                    fresh._deleted.add(stale)
+                node = self._nodes.get(point_id)
+                if node is not None:
+                    fresh._nodes[point_id] = fresh._insert(point_id, self._vectors[node])
+            self._rebuild_dirty = None
+            self._vectors, self._node_ids, self._links = fresh._vectors, fresh._node_ids, fresh._links
+            self._nodes, self._deleted = fresh._nodes, fresh._deleted
+            self._entry, self._max_level = fresh._entry, fresh._max_level
+
+    def search(self, vector, k, filter=None):
+        check_filter(filter)
+        query = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            if not self._nodes or k <= 0:
+                return []
+            allowed = self._matching_ids(filter) if filter else None
+            if allowed is not None and len(allowed) <= max(self.EXACT_FILTER_LIMIT, k):
+                return self._exact_search(query, k, allowed)
+
+            entry_points = [self._entry]
+            for lc in range(self._max_level, 0, -1):
+                entry_points = [self._search_layer(query, entry_points, 1, lc)[0][1]]
+
+            # Widen the beam when tombstones or filtered-out nodes crowd matches out of the top ef
+            ef = max(self.ef_search, k)
+            wanted = min(k, len(self._nodes) if allowed is None else len(allowed))
+            while True:
+                found = [(sim, node) for sim, node in self._search_layer(query, entry_points, ef, 0)
+                         if node not in self._deleted and (allowed is None or self._node_ids[node] in allowed)]
+                if len(found) >= wanted or ef >= len(self._node_ids):
+                    break
+                ef *= 2
+
+            hits = []
+            for sim, node in found[:k]:
+                point_id = self._node_ids[node]
+                hits.append((point_id, sim, self._payloads[point_id]))
+            return hits
+
+    def _exact_search(self, query: np.ndarray, k: int, point_ids: Set[int]):
+        if not point_ids:
+            return []
+        ids = list(point_ids)
+        sims = self._vectors[[self._nodes[point_id] for point_id in ids]] @ query
+        top = np.argsort(-sims)[:k]
+        return [(ids[i], float(sims[i]), self._payloads[ids[i]]) for i in top]
+
+    def get_vectors(self, ids):
+        with self._lock:
+            return {point_id: self._vectors[self._nodes[point_id]].copy() for point_id in ids if point_id in self._nodes}
+
+    def stored_payloads(self):
+        with self._lock:
+            return dict(self._payloads)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def save(self, path: str):
+        # Only the containers are copied under the lock (rows and link lists are never changed
+        # in place); pickling and writing happen outside it, so searches and writes go on
+        with self._lock:
+            state = {
+                "dim": self.dim,
+                "M": self.M,
+                "vectors": self._vectors[:len(self._node_ids)],
+                "node_ids": list(self._node_ids),
+                "links": list(self._links),
+                "nodes": dict(self._nodes),
+                "payloads": dict(self._payloads),
+                "deleted": set(self._deleted),
+                "entry": self._entry,
+                "max_level": self._max_level,
+            }
+            self._unsaved = 0
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._save_lock:
+            # Write to a temp file first so a crash never leaves a truncated index
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def _load(self, path: str):
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            if state["dim"] != self.dim or state["M"] != self.M:
+                print("Stored HNSW index was built with different parameters, starting empty")
+                return
+            self._reset(capacity=max(1024, len(state["node_ids"])))
+            self._vectors[:len(state["node_ids"])] = state["vectors"]
+            self._node_ids = state["node_ids"]
+            self._links = state["links"]
+            self._nodes = state["nodes"]
+            self._payloads = state["payloads"]
+            self._deleted = state["deleted"]
+            for point_id, payload in self._payloads.items():
+                self._index_payload(point_id, payload)
+            self._entry = state["entry"]
+            self._max_level = state["max_level"]
+        except Exception as e:
+            print(f"Error loading HNSW index from {path}: {str(e)}")
+            self._reset()
+
+    def staging(self):
+        # Built in memory only, so a periodic save mid-rebuild cannot overwrite the live
+        # file with a partial graph; take_over() hands it the file after the swap
+        return HNSWVectorIndex(dim=self.dim, M=self.M, ef_construction=self.ef_construction,
+                               ef_search=self.ef_search, save_every=self.save_every)
+
+    def take_over(self, replaced):
+        with self._lock:
+            self.path, replaced.path = getattr(replaced, "path", ""), ""
+            if self.path:
+                # The file still holds the replaced graph; the next write saves this one
+                self._unsaved = max(self._unsaved, self.save_every)
+
+    def retire(self):
+        self.path = ""
+
+    def close(self):
+        if self.path:
+            self.save(self.path)
@@ -0,0 +1,202 @@
+import threading
+from typing import List, Dict, Any, Optional, Sequence, FrozenSet
+import numpy as np
+from vector_index import VectorIndex, NumpyVectorIndex, SearchHit
+
+class IndexSnapshot:
+    """
+    Immutable, versioned view of the vector index.
+
+    Recent writes live in a small delta; shadowed holds every id written since the
+    delta was last folded into the base, so stale base points are filtered out.
+    A reader that grabbed a snapshot keeps using it even after newer ones are
+    published.
+    """
+
+    __slots__ = ("version", "base", "delta", "shadowed")
+
+    def __init__(self, version: int, base: VectorIndex, delta: NumpyVectorIndex, shadowed: FrozenSet[int]):
+        self.version = version
+        self.base = base
+        self.delta = delta
+        self.shadowed = shadowed
+
+    def search_batch(self, vectors: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Dict[str, Any]] = None) -> List[List[SearchHit]]:
+        if k <= 0:
+            return [[] for _ in vectors]
+        delta_hits = self.delta.search_batch(vectors, k, filter) if len(self.delta) else [[] for _ in vectors]
+        base_hits = self.base.search_batch(vectors, k, filter)
+
+        results = []
+        for vector, base, delta in zip(vectors, base_hits, delta_hits):
+            live = [hit for hit in base if hit[0] not in self.shadowed]
+            # Shadowed ids may crowd the base top-k; widen until k live hits or the base runs out
+            fetch = k
+            while len(live) < k and len(base) == fetch:
+                fetch += k + (len(base) - len(live))
+                base = self.base.search(vector, fetch, filter)
+                live = [hit for hit in base if hit[0] not in self.shadowed]
+            # The base may already hold a folded copy of a delta point; the delta wins
+            delta_ids = {hit[0] for hit in delta}
+            merged = delta + [hit for hit in live if hit[0] not in delta_ids]
+            merged.sort(key=lambda hit: hit[1], reverse=True)
+            results.append(merged[:k])
+        return results
+
+    def search(self, vector: Sequence[float], k: int, filter: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        return self.search_batch([vector], k, filter)[0]
+
+    def get_vectors(self, ids: Sequence[int]) -> Dict[int, np.ndarray]:
+        vectors = self.delta.get_vectors(ids)
+        # Shadowed ids missing from the delta were deleted; the base may still hold them
+        rest = [point_id for point_id in ids if point_id not in vectors and point_id not in self.shadowed]
+        if rest:
+            vectors.update(self.base.get_vectors(rest))
+        return vectors
+
+class SnapshotIndex(VectorIndex):
+    """
+    Publishes a VectorIndex as a sequence of immutable snapshots.
+
+    Every batch of writes produces a new snapshot (a copied delta plus a larger
+    shadowed set) that replaces the current one with a single reference
+    assignment, so searches never take a lock held by writers. Once the delta
+    passes delta_limit rows, a background thread folds it into the base in place.
+    The fold does not change results, because the folded ids stay shadowed until
+    the next snapshot is published.
+    """
+
+    def __init__(self, base: VectorIndex, dim: int = 384, delta_limit: int = 256):
+        self.dim = dim
+        self.delta_limit = delta_limit
+        self._snapshot = IndexSnapshot(0, base, NumpyVectorIndex(dim=dim, initial_capacity=64), frozenset())
+        # Id -> version of its last write, for ids not yet folded into the base
+        self._last_write: Dict[int, int] = {}
+        self._write_lock = threading.Lock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> IndexSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def apply(self, ids: Sequence[int] = (), vectors: Optional[Sequence[Sequence[float]]] = None,
+              payloads: Sequence[Dict[str, Any]] = (), delete_ids: Sequence[int] = ()) -> int:
+        """
+        Publish a new snapshot with the given upserts and deletes.
+
+        Batches larger than delta_limit are split and folded chunk by chunk, so the
+        delta (copied on every write) stays small.
+
+        Returns:
+            int: Version of the last snapshot published
+        """
+        ids = list(ids)
+        if len(ids) > self.delta_limit:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            for start in range(0, len(ids), self.delta_limit):
+                end = start + self.delta_limit
+                self._publish(ids[start:end], vectors[start:end], list(payloads[start:end]), [])
+                self.compact()
+            if delete_ids:
+                self._publish([], None, [], list(delete_ids))
+            return self.version
+        self._publish(ids, vectors, list(payloads), list(delete_ids))
+        if len(self._snapshot.shadowed) >= self.delta_limit:
+            self._schedule_compaction()
+        return self.version
+
+    def _publish(self, ids, vectors, payloads, delete_ids):
+        with self._write_lock:
+            current = self._snapshot
+            delta = current.delta.copy()
+            if ids:
+                delta.upsert(ids, vectors, payloads)
+            if delete_ids:
+                delta.delete(delete_ids)
+            version = current.version + 1
+            for point_id in list(ids) + list(delete_ids):
+                self._last_write[point_id] = version
+            self._snapshot = IndexSnapshot(version, current.base, delta, current.shadowed | set(ids) | set(delete_ids))
+
+    def _schedule_compaction(self):
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.compact, name="index-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def compact(self):
+        """Fold the current delta into the base and publish a snapshot without it."""
+        with self._compaction_lock:
+            folded = self._snapshot
+            if not folded.shadowed:
+                return
+            ids, vectors, payloads = folded.delta.items()
+            deleted = list(folded.shadowed - set(ids))
+            if ids:
+                folded.base.upsert(ids, vectors, payloads)
+            if deleted:
+                folded.base.delete(deleted)
+
+            with self._write_lock:
+                current = self._snapshot
+                # Ids rewritten after the fold started stay in the delta and stay shadowed
+                done = [point_id for point_id in folded.shadowed
+                        if self._last_write.get(point_id, 0) <= folded.version]
+                for point_id in done:
+                    self._last_write.pop(point_id, None)
+                delta = current.delta.copy()
+                delta.delete(done)
+                self._snapshot = IndexSnapshot(current.version + 1, current.base, delta, current.shadowed - set(done))
+
+    def replace_base(self, base: VectorIndex, retire_after: Optional[float] = None) -> int:
+        """
+        Swap in a freshly built base (e.g. after a full rebuild) atomically.
+
+        Writes still in the delta are newer than the rebuild and keep overriding it.
+        With retire_after, the old base is retired that many seconds later, once
+        searches still holding an older snapshot have finished.
+        """
+        with self._compaction_lock, self._write_lock:
+            current = self._snapshot
+            self._snapshot = IndexSnapshot(current.version + 1, base, current.delta, current.shadowed)
+            base.take_over(current.base)
+        if retire_after is not None:
+            timer = threading.Timer(retire_after, current.base.retire)
+            timer.daemon = True
+            timer.start()
+        return self._snapshot.version
+
+    def upsert(self, ids, vectors, payloads):
+        self.apply(ids, vectors, payloads)
+
+    def delete(self, ids):
+        self.apply(delete_ids=ids)
+
+    def search_batch(self, vectors: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Dict[str, Any]] = None) -> List[List[SearchHit]]:
+        return self._snapshot.search_batch(vectors, k, filter)
+
+    def search(self, vector: Sequence[float], k: int, filter: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        return self._snapshot.search(vector, k, filter)
+
+    def get_vectors(self, ids: Sequence[int]) -> Dict[int, np.ndarray]:
+        return self._snapshot.get_vectors(ids)
+
+    def stored_payloads(self) -> Dict[int, Dict[str, Any]]:
+        self.compact()
+        return self._snapshot.base.stored_payloads()
+
+    def __len__(self) -> int:
+        # Upper bound: ids rewritten since the last fold may be counted in both parts
+        snapshot = self._snapshot
+        return len(snapshot.base) + len(snapshot.delta)
+
+    def close(self):
+        # Persistent bases must see every write before they flush
+        self.compact()
+        self._snapshot.base.close()
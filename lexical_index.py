@@ -0,0 +1,100 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, List, Dict, Optional, Tuple
+
+# Keeps ticket ids and similar compound tokens ("ABC-123", "v2.1") whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.#/][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        # Also index the parts so "abc" still matches "abc-123"
+        parts = re.split(r"[-_.#/]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+
+    Documents are keyed by todo id and can be replaced or removed one at a time, so
+    CRUD writes keep the index current without rebuilding it.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_terms: Dict[int, Counter] = {}
+        self._doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, doc_id: int, text: str):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            if self._doc_terms.get(doc_id) == terms:
+                return
+            self._remove(doc_id)
+            self._doc_terms[doc_id] = terms
+            self._doc_lengths[doc_id] = sum(terms.values())
+            self._total_length += self._doc_lengths[doc_id]
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+
+    def delete(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, k: int, doc_filter: Optional[Callable[[int], bool]] = None) -> List[Tuple[int, float]]:
+        """Return up to k (todo id, BM25 score) pairs, best first, among the ids doc_filter accepts."""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if not n_docs or not query_terms:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[int, float] = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        if doc_filter is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_filter(doc_id)}
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int, rrf_k: int = 60) -> List[int]:
+    """
+    Merge several ranked id lists with reciprocal rank fusion (score = sum of 1 / (rrf_k + rank)).
+
+    Returns:
+        List[int]: The top k ids, best first
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return [doc_id for doc_id, _ in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
@@ -0,0 +1,160 @@
+# load_test_ai.py
+"""
+Check that in-flight AI chats do not block plain CRUD requests.
+
+Starts the app under uvicorn against a local text-generation stub that takes
+--delay-ms per call, fires --chats concurrent POST /api/chat requests, and
+keeps timing GET /todos while they are in flight. With sync endpoints each
+chat holds one of the server's thread-pool workers (40 by default) for the
+whole model round trip, so /todos waits for a free worker; with async
+endpoints it should stay at its idle latency.
+
+Point --app-dir at another checkout (e.g. a `git worktree` of an older
+commit) to run the same load against that version.
+
+Usage:
+    python load_test_ai.py --chats 300 --delay-ms 2000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmark_ai_client import GenerationHandler, start_server
+
+def serve_stub(delay, ready, stop):
+    # Own process: the stub's hundreds of handler threads would otherwise share the GIL
+    # with the event loop doing the timing
+    class DelayedHandler(GenerationHandler):
+        def do_POST(self):
+            self.delay = delay.value
+            super().do_POST()
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, url, _ = start_server(directory, 0.0, tls=False, handler=DelayedHandler)
+        ready.put(url)
+        stop.wait()
+        server.shutdown()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_app(app_dir: str, directory: str, model_url: str, chats: int):
+    port = free_port()
+    env = dict(
+        os.environ,
+        HUGGINGFACEHUB_API_TOKEN="load-test",
+        HF_MODEL_NAME=model_url,
+        DATABASE_URL=f"sqlite:///{os.path.join(directory, 'todos.db')}",
+        EMBEDDING_BACKEND="hashing",
+        VECTOR_BACKEND="numpy",
+        VECTOR_STORE_PATH="",
+        EMBEDDING_CACHE_PATH="",
+        # Let every chat reach the model at once, so the server is what is being measured
+        AI_MAX_CONNECTIONS=str(chats),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir, env=env,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/ready")).json()["ai"]["ready"]:
+                return
+        except (httpx.HTTPError, KeyError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("app did not become ready")
+
+async def fire_chats(base_url: str, chats: int):
+    limits = httpx.Limits(max_connections=chats)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        began = time.perf_counter()
+        responses = await asyncio.gather(*[client.post("/api/chat", params={"query": f"what next {i}?"})
+                                           for i in range(chats)])
+        seconds = time.perf_counter() - began
+    answered = sum(1 for r in responses if r.status_code == 200 and "thinking" not in r.json()["response"])
+    return answered, seconds
+
+def chat_process(base_url: str, chats: int, results):
+    # Own process: bookkeeping for hundreds of pooled connections would stall the event loop
+    # that times /todos
+    results.put(asyncio.run(fire_chats(base_url, chats)))
+
+async def run(base_url: str, chats: int, todos: int, delay, delay_seconds: float):
+    # Expire idle connections before uvicorn's 5 s keep-alive timeout closes them under us
+    limits = httpx.Limits(keepalive_expiry=2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+        await wait_ready(client)
+        for i in range(todos):
+            await client.post("/todos", json={"description": f"Load test task {i}", "completed": i % 4 == 0})
+
+        idle = []
+        for _ in range(50):
+            began = time.perf_counter()
+            (await client.get("/todos")).raise_for_status()
+            idle.append((time.perf_counter() - began) * 1000)
+
+        delay.value = delay_seconds
+        results = multiprocessing.Queue()
+        chatter = multiprocessing.Process(target=chat_process, args=(base_url, chats, results), daemon=True)
+        chatter.start()
+        loaded = []
+        while results.empty():
+            probe = time.perf_counter()
+            (await client.get("/todos")).raise_for_status()
+            loaded.append((time.perf_counter() - probe) * 1000)
+            await asyncio.sleep(0.05)
+        answered, chat_seconds = results.get()
+        chatter.join()
+    return idle, loaded, chat_seconds, answered
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return (statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            latencies[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Time GET /todos while many AI chats are in flight")
+    parser.add_argument("--chats", type=int, default=300)
+    parser.add_argument("--delay-ms", type=float, default=2000, help="Model time per chat on the stub")
+    parser.add_argument("--todos", type=int, default=50)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Seeding categorizes through the stub, so it answers instantly until the chats start
+        delay, ready, stop = multiprocessing.Value("d", 0.0), multiprocessing.Queue(), multiprocessing.Event()
+        stub = multiprocessing.Process(target=serve_stub, args=(delay, ready, stop), daemon=True)
+        stub.start()
+        process, base_url = start_app(args.app_dir, directory, ready.get(timeout=60), args.chats)
+        try:
+            idle, loaded, chat_seconds, answered = asyncio.run(
+                run(base_url, args.chats, args.todos, delay, args.delay_ms / 1000))
+        finally:
+            process.terminate()
+            process.wait()
+            stop.set()
+            stub.join()
+
+    print(f"{'GET /todos':<22} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, latencies in (("idle", idle), (f"{args.chats} chats in flight", loaded)):
+        print(f"{name:<22} {len(latencies):>9} " + " ".join(f"{value:>9.1f}" for value in summary(latencies)))
+    print(f"chats: {answered}/{args.chats} answered in {chat_seconds:.1f} s "
+          f"({args.delay_ms:.0f} ms model time each)")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,64 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+import json
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from contextlib import asynccontextmanager
 import uvicorn
 from dotenv import load_dotenv
 from fastapi.staticfiles import StaticFiles
+import anyio
+
+# Environment variables load karein (.env file se), before the local modules read their settings
+load_dotenv()
 
 # Local files imports
 import database
 import models
 import crud
-from ai_interface import get_ai_model
-from rag import RAGService
-
-# Environment variables load karein (.env file se)
-load_dotenv()
+from ai_interface import get_ai_model, close_ai_model
+from rag import get_rag_service
+from reindex import ReindexJob
+from rag_sidecar import SidecarReindexJob
+from categorize_worker import CategorizeWorker
 
 # Database tables create karna (Phase II)
 models.Base.metadata.create_all(bind=database.engine)
+models.add_missing_columns(database.engine)
+
+# Cheap to create: the embedding model and vector index load lazily on first semantic use
+rag_service = get_rag_service()
+# With a sidecar the job runs there, next to the model and index
+reindex_job = SidecarReindexJob(rag_service) if database.RAG_SIDECAR_SOCKET else ReindexJob(rag_service)
+
+def index_todos(todos: List[models.TodoDB], read_at: float):
+    for todo in todos:
+        rag_service.upsert_todo(todo, read_at=read_at)
+
+# New todos are inserted as pending, then indexed and categorized in batches off the request path
+categorize_worker = CategorizeWorker(crud.categorize_tasks, index=index_todos)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the model and sync the index (only missing or stale rows when it is on disk)
+    # in the background; CRUD writes keep it current after that
+    if database.RAG_WARMUP:
+        rag_service.start_warmup()
+    # One AI model and connection pool for the whole process; chat still works without a token
+    try:
+        get_ai_model()
+    except ValueError as e:
+        print(f"AI model not configured: {str(e)}")
+    categorize_worker.start()
+    yield
+    categorize_worker.shutdown()
+    reindex_job.shutdown()
+    rag_service.close()
+    await close_ai_model()
 
-app = FastAPI(title="Todo AI Agent", version="1.0.0")
+app = FastAPI(title="Todo AI Agent", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware to allow frontend-backend communication
 app.add_middleware(
@@ -42,9 +80,6 @@ def get_db():
     finally:
         db.close()
 
-# Pre-initialize services for better performance
-rag_service = RAGService()
-
 # -------------------------------
 # Home Route
 # -------------------------------
@@ -61,7 +96,10 @@ def read_root():
 
 @app.post("/todos", response_model=models.TodoResponse, status_code=status.HTTP_201_CREATED)
 def create_todo(todo: models.TodoCreate, db: Session = Depends(get_db)):
-    return crud.create_todo(db=db, todo=todo)
+    # Returned with category_pending=true; GET /todos/{id} shows the category once it is set
+    db_todo = crud.create_todo(db=db, todo=todo)
+    categorize_worker.enqueue([db_todo.id])
+    return db_todo
 
 @app.get("/todos", response_model=List[models.TodoResponse])
 def read_todos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
@@ -74,6 +112,14 @@ def read_todo(todo_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Todo not found")
     return db_todo
 
+@app.get("/todos/{todo_id}/related")
+def read_related_todos(todo_id: int, k: int = Query(min(5, database.RELATED_GRAPH_K), ge=1, le=database.RELATED_GRAPH_K)):
+    # Served from the precomputed neighbour graph; no embedding or index scan per request
+    related = rag_service.related_tasks(todo_id, k=k)
+    if related is None:
+        raise HTTPException(status_code=404, detail="Todo not found")
+    return {"id": todo_id, "related": related}
+
 @app.put("/todos/{todo_id}", response_model=models.TodoResponse)
 def update_todo(todo_id: int, todo: models.TodoUpdate, db: Session = Depends(get_db)):
     db_todo = crud.update_todo(db, todo_id=todo_id, todo_update=todo)
@@ -92,43 +138,122 @@ def delete_todo(todo_id: int, db: Session = Depends(get_db)):
 # Phase III: AI & RAG Endpoints
 # -------------------------------
 
-@app.post("/api/chat")
-def chat_with_ai(query: str, selected_text: str = "", db: Session = Depends(get_db)):
-    try:
-        ai_model = get_ai_model()
+# Chat retrieval is CPU-bound, so two threads are as fast as many; its own limiter keeps a
+# burst of chats from queueing ahead of CRUD requests in the shared thread pool
+ai_retrieval_limiter = anyio.CapacityLimiter(2)
+
+def build_chat_prompt(query: str, selected_text: str, search_mode: Optional[str]):
+    # 1. Database se context build karein (most relevant tasks that fit the token budget)
+    # Own session, closed before the model call, so a chat in flight holds no pooled connection
+    with database.SessionLocal() as db:
+        # search_mode=lexical skips the embedder here too, for low-latency callers
+        context = rag_service.build_context(db, query=f"{query} {selected_text}", search_mode=search_mode)
+    task_context = context["context"]
 
-        # 1. Database se context build karein
-        task_context = rag_service.create_context_from_todos(db)
+    # 2. Similarity search agar user ne specific text select kiya ho
+    similar_context = ""
+    if selected_text.strip():
+        similar_tasks = rag_service.search_similar_tasks(selected_text, mode=search_mode)
+        if similar_tasks:
+            similar_context = "\nSpecifically relevant to your selection:\n"
+            for task in similar_tasks:
+                similar_context += f"- {task['content']}\n"
 
-        # 2. Similarity search agar user ne specific text select kiya ho
-        similar_context = ""
-        if selected_text.strip():
-            rag_service.build_vector_store(db)
-            similar_tasks = rag_service.search_similar_tasks(selected_text)
-            if similar_tasks:
-                similar_context = "\nSpecifically relevant to your selection:\n"
-                for task in similar_tasks:
-                    similar_context += f"- {task['content']}\n"
+    # 3. Final Prompt for Hugging Face
+    prompt = f"System: You are a helpful Todo Assistant. Use the context below to answer.\n\nContext:\n{task_context}\n{similar_context}\n\nUser Question: {query}\nAssistant:"
+    return prompt, context
 
-        # 3. Final Prompt for Hugging Face
-        prompt = f"System: You are a helpful Todo Assistant. Use the context below to answer.\n\nContext:\n{task_context}\n{similar_context}\n\nUser Question: {query}\nAssistant:"
+def build_summary_context():
+    # No query to rank against, so pending and recent tasks fill the budget first
+    with database.SessionLocal() as db:
+        return rag_service.build_context(db)
 
-        response = ai_model.generate_response(prompt)
-        return {"response": response}
+@app.post("/api/chat")
+async def chat_with_ai(query: str, selected_text: str = "", search_mode: Optional[str] = None):
+    try:
+        ai_model = get_ai_model()
+        # Retrieval reads the database and may embed, so it runs in the thread pool; the model
+        # round trip is awaited and holds no thread, leaving the pool to CRUD requests
+        prompt, context = await anyio.to_thread.run_sync(
+            build_chat_prompt, query, selected_text, search_mode, limiter=ai_retrieval_limiter)
+        response = await ai_model.generate_response_async(prompt)
+        return {"response": response, "tasks_included": context["included"], "tasks_omitted": context["omitted"]}
 
     except Exception as e:
         print(f"Chat endpoint error: {str(e)}")  # Log the error for debugging
         return {"response": f"AI is thinking... please try again later."}
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_with_ai_stream(query: str, selected_text: str = "", search_mode: Optional[str] = None):
+    # Same answer as /api/chat as server-sent events while it is generated: "token" events,
+    # "fallback" if the secondary model takes over, then "done" (with the context counts) or "error"
+    async def events():
+        try:
+            ai_model = get_ai_model()
+            prompt, context = await anyio.to_thread.run_sync(
+                build_chat_prompt, query, selected_text, search_mode, limiter=ai_retrieval_limiter)
+        except Exception as e:
+            print(f"Chat stream error: {str(e)}")
+            yield sse_event("error", {"error": "AI is thinking... please try again later."})
+            return
+        async for event in ai_model.stream_response(prompt):
+            # Each event is a single-key dict named after its kind
+            kind = next(iter(event))
+            yield sse_event(kind, event)
+            if kind == "error":
+                return
+        yield sse_event("done", {"tasks_included": context["included"], "tasks_omitted": context["omitted"]})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/categorize")
+def categorize_descriptions(request: models.CategorizeRequest):
+    # For imports: the local classifier first, then one model prompt per batch of the tasks it is unsure about
+    try:
+        return {"categories": crud.categorize_tasks(request.descriptions)}
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/api/search")
+def search_todos(
+    q: str,
+    k: int = Query(10, ge=1, le=500),
+    offset: int = Query(0, ge=0, le=database.SEARCH_MAX_OFFSET),
+    completed: Optional[bool] = None,
+    category: Optional[str] = None,
+    search_mode: Optional[str] = None,
+):
+    # Retrieval only, no LLM call; filters are applied inside the indexes before ranking
+    filters = {"completed": completed, "category": category}
+    # One extra hit tells whether another page exists
+    results = rag_service.search_similar_tasks(q, k=k + 1, mode=search_mode, filters=filters, offset=offset)
+    return {
+        "query": q,
+        "results": results[:k],
+        "offset": offset,
+        "next_offset": offset + k if len(results) > k else None,
+    }
+
+@app.get("/api/clusters")
+def cluster_todos(k: int = Query(database.CLUSTER_COUNT, ge=2, le=50), examples: int = Query(3, ge=1, le=20)):
+    # Embedding-space k-means fitted in the background, no LLM call; "status": "building"
+    # until the first fit for this k is done, then cached until the index changes
+    return rag_service.cluster_tasks(k=k, examples=examples)
+
 @app.post("/api/tasks/summary")
-def get_task_summary(db: Session = Depends(get_db)):
+async def get_task_summary():
     try:
         ai_model = get_ai_model()
-        full_context = rag_service.create_context_from_todos(db)
+        context = await anyio.to_thread.run_sync(build_summary_context, limiter=ai_retrieval_limiter)
+        full_context = context["context"]
 
         # Create a more specific prompt for a 2-sentence summary
         prompt = f"System: Write exactly 2 sentences summarizing the following tasks. Be concise and professional.\n\nTasks:\n{full_context}\n\nSummary:"
-        response = ai_model.generate_response(prompt)
+        response = await ai_model.generate_response_async(prompt)
 
         # Ensure the response contains exactly 2 sentences as per specification
         sentences = response.split('.')
@@ -139,10 +264,46 @@ def get_task_summary(db: Session = Depends(get_db)):
             # If there's only one sentence, keep it as is
             response = sentences[0] + '.' if sentences[0] else "Your task list is up to date."
 
-        return {"summary": response}
+        return {"summary": response, "tasks_included": context["included"], "tasks_omitted": context["omitted"]}
     except Exception as e:
         print(f"Task summary endpoint error: {str(e)}")  # Log the error for debugging
         return {"summary": "AI is thinking... Please try again later."}
 
+@app.get("/api/ready")
+def readiness():
+    # CRUD is always available; "ai" reports whether semantic search is warm yet
+    return {"status": "ok", "ai": rag_service.readiness()}
+
+@app.post("/api/reindex", status_code=status.HTTP_202_ACCEPTED)
+def start_reindex():
+    # Re-embeds every todo into a new index off to the side; searches use the old one until it is done
+    if not reindex_job.start():
+        raise HTTPException(status_code=409, detail="Reindex already running")
+    return reindex_job.progress()
+
+@app.get("/api/reindex")
+def reindex_progress():
+    return reindex_job.progress()
+
+@app.delete("/api/reindex")
+def cancel_reindex():
+    if not reindex_job.cancel():
+        raise HTTPException(status_code=409, detail="No reindex running")
+    return reindex_job.progress()
+
+@app.get("/api/rag/stats")
+def get_rag_stats():
+    return rag_service.stats()
+
+@app.get("/api/ai/stats")
+def get_ai_stats():
+    # Model call latencies, streamed time-to-first-token and fallback counts
+    try:
+        stats = get_ai_model().stats()
+    except ValueError as e:
+        stats = {"configured": False, "detail": str(e)}
+    stats["categorize_worker"] = categorize_worker.stats()
+    return stats
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
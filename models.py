@@ -1,9 +1,18 @@
-from sqlalchemy import Column, Integer, String, Boolean
-from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, Boolean, DDL, event, inspect, text
+from typing import List
+from pydantic import BaseModel, Field, field_validator
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Category shown for a new todo until the background categorizer sets one. Only the
+# category_pending column marks a todo as waiting; a user may also pick this label
+PENDING_CATEGORY = "Uncategorized"
+# Who set a todo's category. Only the user's labels (set or confirmed with PUT) train
+# the local categorizer, so it never learns from its own or the LLM's guesses
+CATEGORY_SOURCE_USER = "user"
+CATEGORY_SOURCE_MODEL = "model"
+
 # -------------------------------
 # 1. SQLAlchemy Model (Database Table)
 # -------------------------------
@@ -13,7 +22,29 @@ class TodoDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     description = Column(String, index=True)
     completed = Column(Boolean, default=False)
-    category = Column(String, default="Uncategorized")  # For AI auto-categorization
+    category = Column(String, default=PENDING_CATEGORY)  # For AI auto-categorization
+    category_source = Column(String, nullable=True)  # CATEGORY_SOURCE_*; NULL for pending and older rows
+    category_pending = Column(Boolean, nullable=True, default=False)  # True until categorized; NULL for older rows
+
+class WriteVersion(Base):
+    # Single row counting writes to todos; see database.bump_write_version
+    __tablename__ = "write_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Seeded when the table is created, so a bump is a plain UPDATE
+event.listen(WriteVersion.__table__, "after_create", DDL("INSERT INTO write_version (id, version) VALUES (1, 0)"))
+
+def add_missing_columns(engine):
+    # create_all only creates missing tables; add todos columns newer than an existing table
+    existing = {column["name"] for column in inspect(engine).get_columns(TodoDB.__tablename__)}
+    with engine.begin() as connection:
+        for column in TodoDB.__table__.columns:
+            if column.name not in existing:
+                connection.execute(text(
+                    f"ALTER TABLE {TodoDB.__tablename__} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                ))
 
 # -------------------------------
 # 2. Pydantic Models (FastAPI Validation)
@@ -21,7 +52,7 @@ class TodoDB(Base):
 class TodoBase(BaseModel):
     description: str
     completed: bool = False
-    category: str = "Uncategorized"
+    category: str = PENDING_CATEGORY
 
 class TodoCreate(TodoBase):
     pass
@@ -33,6 +64,17 @@ class TodoUpdate(TodoBase):
 
 class TodoResponse(TodoBase):
     id: int
+    # True until the background categorizer has filled the category in
+    category_pending: bool = False
+
+    @field_validator("category_pending", mode="before")
+    @classmethod
+    def pending_flag(cls, value):
+        # Rows older than the column read as NULL
+        return bool(value)
 
     class Config:
-        from_attributes = True # Purane Pydantic versions mein ye 'orm_mode = True' tha
\ No newline at end of file
+        from_attributes = True # Purane Pydantic versions mein ye 'orm_mode = True' tha
+
+class CategorizeRequest(BaseModel):
+    descriptions: List[str] = Field(min_length=1, max_length=1000)
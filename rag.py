@@ -1,80 +1,1069 @@
-from typing import List, Dict, Any
-from qdrant_client import QdrantClient
-from langchain_qdrant import Qdrant
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
+import heapq
+import threading
+import time
+from typing import List, Dict, Any, Optional
+import numpy as np
+from sqlalchemy import func
 import models
+import database
+from embedding_cache import EmbeddingCache, CachedEmbeddings, LRUCache
+from vector_index import create_vector_index
+from index_snapshot import SnapshotIndex
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from related_graph import RelatedGraph
+from categorizer import CentroidCategorizer
+from embedders import create_embedder
+from clustering import MiniBatchKMeans
 from sqlalchemy.orm import Session
 
+def estimate_tokens(text: str) -> int:
+    # GPT-2 style BPE averages about four characters of English per token
+    return len(text) // 4 + 1
+
 class RAGService:
-    def __init__(self):
-        # Memory mode for quick setup
-        self.client = QdrantClient(location=":memory:")
-        self.collection_name = "todos"
-
-        # Free Embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}  # Explicitly set device
+    """
+    Semantic and keyword search over todos.
+
+    Construction is cheap: the embedding model and vector backend are only loaded on
+    first semantic use or by start_warmup(), so CRUD traffic never waits for them.
+    Until then CRUD writes update the keyword index and are queued for embedding.
+    """
+
+    def __init__(self, session_factory=database.SessionLocal):
+        self.session_factory = session_factory
+        # sentence-transformers by default, or the dependency-free hashing embedder (EMBEDDING_BACKEND)
+        self.embedder = create_embedder(database.EMBEDDING_BACKEND)
+        self.model_name = self.embedder.name
+        self.index = None
+        self.embeddings = None
+        self.embedding_cache = None
+
+        # Hot in-memory caches: query text -> vector, and (query, k, mode, index version) -> results
+        self.query_cache = LRUCache(database.QUERY_EMBEDDING_CACHE_SIZE)
+        self.result_cache = LRUCache(database.SEARCH_RESULT_CACHE_SIZE)
+        # (query, depth, index version, filters) -> fused hybrid ranking that every page is sliced from
+        self.fusion_cache = LRUCache(database.SEARCH_RESULT_CACHE_SIZE)
+        # Bumped on every index change, which retires all cached results at once
+        self.index_version = 0
+        # (write version, index version, user context, query, search mode, budget) -> rendered prompt context
+        self.context_cache = LRUCache(database.CONTEXT_CACHE_SIZE)
+
+        # Todo id -> search result fields, kept for every known todo whether embedded yet or not
+        self._documents: Dict[int, Dict[str, Any]] = {}
+        # Keyword index over descriptions; needs no embeddings, so lexical search skips the model
+        self.lexical = BM25Index()
+        # Todo id -> payload currently embedded in the collection, so unchanged rows are never re-embedded
+        self._indexed: Dict[int, Dict[str, Any]] = {}
+        # Ids written while a reindex job runs; re-applied to its index before the swap
+        self._reindex_dirty: Optional[set] = None
+        # Todo id -> time.monotonic() of its delete, oldest first, so a row read before the
+        # delete is not written back by an upsert that lands after it
+        self._deleted_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        # Precomputed nearest neighbours of every todo, served by /todos/{id}/related
+        self.related = RelatedGraph(self._search_neighbours, k=database.RELATED_GRAPH_K,
+                                    is_live=lambda todo_id: todo_id in self._indexed)
+        self._related_thread: Optional[threading.Thread] = None
+        # Work for the related-graph thread: a full build, and lists left stale by writes
+        self._related_stale = False
+        self._related_repair_pending = False
+        self._closing = False
+        # Category centroids of the indexed todos, for categorizing new ones without the LLM
+        self.categorizer = CentroidCategorizer(
+            min_examples=database.CATEGORIZER_MIN_EXAMPLES, min_margin=database.CATEGORIZER_MIN_MARGIN
         )
-        self.vector_store = None
+        # Topic clusters: fitted in the background on first request, then fed every write;
+        # todo id -> (cluster, similarity)
+        self.kmeans: Optional[MiniBatchKMeans] = None
+        self._cluster_of: Dict[int, tuple] = {}
+        self._cluster_updates = 0
+        # Ids written while a refit runs; assigned with the new clusters once it is done
+        self._cluster_dirty: Optional[set] = None
+        self._cluster_lock = threading.Lock()
+        # Fit thread, the k it is fitting and the k asked for next; bumped generation per fit
+        self._cluster_thread: Optional[threading.Thread] = None
+        self._cluster_fitting: Optional[int] = None
+        self._cluster_wanted: Optional[int] = None
+        self._cluster_generation = 0
+        # (index version, cluster generation, k, examples) -> clusters response
+        self.cluster_cache = LRUCache(8)
 
-        # Collection setup
-        try:
-            self.client.get_collection(self.collection_name)
-        except Exception:
-            from qdrant_client.http import models as qdrant_models
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=qdrant_models.VectorParams(size=384, distance=qdrant_models.Distance.COSINE),
+        # "cold" -> "warming" -> "ready" (or "failed", retried with backoff); writes seen while
+        # warming are replayed afterwards
+        self.state = "cold"
+        self.error: Optional[str] = None
+        self._documents_loaded = False
+        self._pending_ids: set = set()
+        self._init_lock = threading.Lock()
+        self._documents_lock = threading.Lock()
+        self._warmup_thread: Optional[threading.Thread] = None
+        # Failed warm-ups in a row, and when the next retry runs (time.monotonic())
+        self._warmup_failures = 0
+        self._warmup_retry_at: Optional[float] = None
+        self._warmup_timer: Optional[threading.Timer] = None
+
+    def _load_components(self):
+        # Qdrant by default (on disk when VECTOR_STORE_PATH is set), or an in-process NumPy / HNSW index
+        base = create_vector_index(
+            database.VECTOR_BACKEND,
+            dim=384,
+            path=database.VECTOR_STORE_PATH,
+            hnsw_params={
+                "M": database.HNSW_M,
+                "ef_construction": database.HNSW_EF_CONSTRUCTION,
+                "ef_search": database.HNSW_EF_SEARCH,
+            },
+            numpy_params={
+                "dtype": database.VECTOR_DTYPE,
+                "rerank": database.VECTOR_RERANK,
+            },
+        )
+        # Searches read an immutable snapshot, so they never wait on writes or rebuilds
+        self.index = SnapshotIndex(base, dim=384, delta_limit=database.SNAPSHOT_DELTA_LIMIT)
+
+        self.embedder.load()
+        embeddings = self.embedder
+
+        # Shared cache in front of the model for both document and query embeddings
+        if database.EMBEDDING_CACHE_PATH and self.embedder.cacheable:
+            self.embedding_cache = EmbeddingCache(
+                database.EMBEDDING_CACHE_PATH, self.model_name, max_entries=database.EMBEDDING_CACHE_MAX_ENTRIES
             )
+            embeddings = CachedEmbeddings(embeddings, self.embedding_cache)
+        self.embeddings = embeddings
+        self._load_indexed_state()
+
+    def ensure_ready(self) -> bool:
+        """
+        Load the model and vector backend and sync them with the todos table, once.
+
+        A failed attempt leaves the service "failed" (keyword search still works) and is
+        retried in the background after RAG_WARMUP_RETRY_SECONDS, doubling each time.
 
-    def create_context_from_todos(self, db: Session, user_context: str = "") -> str:
+        Returns:
+            bool: True if semantic search is available
+        """
+        if self.state in ("ready", "failed"):
+            return self.state == "ready"
+        with self._init_lock:
+            if self.state in ("ready", "failed"):
+                return self.state == "ready"
+            self.state = "warming"
+            db = self.session_factory()
+            try:
+                # Keyword search works as soon as this first, cheap pass is done
+                self._ensure_documents()
+                self._load_components()
+                self._sync_vectors(db)
+                # Writes are still queued in _pending_ids here, so nothing changes under the fit
+                self._fit_categorizer()
+                with self._lock:
+                    pending, self._pending_ids = self._pending_ids, set()
+                    self._warmup_failures, self.error = 0, None
+                    self.state = "ready"
+                    # Results cached while warming were keyword-only
+                    self.index_version += 1
+                self._replay(db, pending)
+                self._start_related_build()
+                return True
+            except Exception as e:
+                print(f"Error warming up RAG service: {str(e)}")
+                self._discard_components()
+                with self._lock:
+                    # Nothing to replay: the next attempt syncs the whole table again
+                    self._pending_ids = set()
+                    self.state = "failed"
+                self.error = str(e)
+                self._schedule_warmup_retry()
+                return False
+            finally:
+                db.close()
+
+    def _discard_components(self):
+        # Release what a failed warm-up opened (e.g. Qdrant's storage lock) so a retry can reopen it
         try:
-            todos = db.query(models.TodoDB).all()
-            context_parts = [f"User context: {user_context}"] if user_context else []
-            if todos:
-                context_parts.append("Current tasks in database:")
-                for todo in todos:
-                    status = "completed" if todo.completed else "pending"
-                    context_parts.append(f"- ID {todo.id}: {todo.description} [{status}]")
+            if self.index is not None:
+                self.index.close()
+            if self.embedding_cache:
+                self.embedding_cache.close()
+        except Exception as e:
+            print(f"Error closing vector store: {str(e)}")
+        self.index = self.embeddings = self.embedding_cache = None
+        self._indexed = {}
+        self.categorizer.clear()
+
+    def _schedule_warmup_retry(self):
+        self._warmup_failures += 1
+        self._warmup_retry_at = None
+        if database.RAG_WARMUP_RETRY_SECONDS <= 0 or self._closing:
+            return
+        delay = min(database.RAG_WARMUP_RETRY_SECONDS * 2 ** (self._warmup_failures - 1),
+                    database.RAG_WARMUP_RETRY_MAX_SECONDS)
+        self._warmup_retry_at = time.monotonic() + delay
+        self._warmup_timer = threading.Timer(delay, self._retry_warmup)
+        self._warmup_timer.daemon = True
+        self._warmup_timer.start()
+
+    def _retry_warmup(self):
+        with self._init_lock:
+            if self.state != "failed" or self._closing:
+                return
+            self._warmup_retry_at = None
+            self.state = "cold"
+        self.ensure_ready()
+
+    def _ensure_documents(self):
+        if self._documents_loaded:
+            return
+        with self._documents_lock:
+            if self._documents_loaded:
+                return
+            db = self.session_factory()
+            try:
+                self._sync_documents(db)
+            finally:
+                db.close()
+
+    def start_warmup(self):
+        """Warm the AI subsystem on a background thread so startup is not blocked."""
+        if self._warmup_thread is None and self.state == "cold":
+            self._warmup_thread = threading.Thread(target=self.ensure_ready, name="rag-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    def readiness(self) -> Dict[str, Any]:
+        retry_at = self._warmup_retry_at
+        return {
+            "state": self.state,
+            "ready": self.state == "ready",
+            "keyword_search_ready": self._documents_loaded,
+            "error": self.error,
+            "failures": self._warmup_failures,
+            # Seconds until a failed warm-up is tried again; None when no retry is scheduled
+            "retry_in": round(max(retry_at - time.monotonic(), 0.0), 1) if retry_at is not None else None,
+        }
+
+    def _replay(self, db: Session, todo_ids):
+        # Rows written while warming up are re-read so the index reflects their latest state
+        db.expire_all()
+        for todo_id in todo_ids:
+            todo = db.get(models.TodoDB, todo_id)
+            if todo is None:
+                self.delete_todo(todo_id)
             else:
-                context_parts.append("The todo list is currently empty.")
-            return "\n".join(context_parts)
+                self.upsert_todo(todo)
+
+    def _load_indexed_state(self):
+        """
+        Rebuild the id -> content map from points already stored on disk, so a warm
+        restart only re-embeds rows that are missing or stale.
+        """
+        try:
+            stale_ids = []
+            for point_id, payload in self.index.stored_payloads().items():
+                # Points embedded by another model are treated as stale
+                if payload.get("model") == self.model_name:
+                    self._indexed[point_id] = payload
+                else:
+                    stale_ids.append(point_id)
+            if stale_ids:
+                self.index.delete(stale_ids)
+        except Exception as e:
+            print(f"Error loading stored vector index: {str(e)}")
+            self._indexed = {}
+
+    # Relevance weights: rank in the retrieval results, position by id (newer first) and pending status
+    CONTEXT_RETRIEVAL_WEIGHT = 3.0
+    CONTEXT_RECENCY_WEIGHT = 1.0
+    CONTEXT_PENDING_WEIGHT = 1.0
+    CONTEXT_MAX_DESCRIPTION_CHARS = 300
+
+    def create_context_from_todos(self, db: Session, user_context: str = "", query: str = "",
+                                  token_budget: Optional[int] = None) -> str:
+        return self.build_context(db, user_context=user_context, query=query, token_budget=token_budget)["context"]
+
+    def build_context(self, db: Session, user_context: str = "", query: str = "",
+                      token_budget: Optional[int] = None, search_mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Render the most relevant todos into a prompt context of at most token_budget tokens.
+
+        Rows are streamed from the table and only the best-scoring ones that fit the
+        budget are kept, so memory and prompt size stay bounded however many todos
+        exist. A todo scores higher when it ranks high in retrieval against the
+        query, is newer and is still pending. Results are cached until the next
+        write through crud.py (or index change, when a query is used).
+
+        Args:
+            db (Session): Database session
+            user_context (str): Optional text placed before the task list
+            query (str): Text to rank tasks against; without it recency and status decide
+            token_budget (int): Estimated token limit; defaults to CONTEXT_TOKEN_BUDGET
+            search_mode (str): Retrieval mode for the query, as in search_similar_tasks;
+                "lexical" ranks without the embedding model
+
+        Returns:
+            Dict[str, Any]: "context" string, "included" and "omitted" task counts and estimated "tokens"
+        """
+        token_budget = token_budget or database.CONTEXT_TOKEN_BUDGET
+        # Read the versions before rendering, so a write that lands meanwhile retires this entry
+        key = (
+            database.get_write_version(db),
+            self.index_version if query.strip() else None,
+            user_context,
+            query,
+            search_mode,
+            token_budget,
+        )
+        cached = self.context_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        result = self._render_context(db, user_context, query, token_budget, search_mode)
+        if result["tokens"]:
+            self.context_cache.put(key, result)
+        return dict(result)
+
+    def _render_context(self, db: Session, user_context: str, query: str, token_budget: int,
+                        search_mode: Optional[str] = None) -> Dict[str, Any]:
+        try:
+            header = [f"User context: {user_context}"] if user_context else []
+            header.append("Current tasks in database:")
+            # Room for the header and the "N more tasks not shown" line
+            budget = token_budget - sum(estimate_tokens(line) for line in header) - 10
+
+            retrieval = {}
+            if query.strip():
+                depth = database.CONTEXT_RETRIEVAL_DEPTH
+                for rank, task in enumerate(self.search_similar_tasks(query, k=depth, mode=search_mode)):
+                    retrieval[task["id"]] = 1.0 - rank / depth
+            max_id = db.query(func.max(models.TodoDB.id)).scalar() or 1
+
+            # Min-heap of (score, id, line, tokens) trimmed to the budget as rows stream in
+            kept, used, total = [], 0, 0
+            rows = db.query(models.TodoDB.id, models.TodoDB.description, models.TodoDB.completed).yield_per(1000)
+            for todo_id, description, completed in rows:
+                total += 1
+                score = (
+                    self.CONTEXT_RETRIEVAL_WEIGHT * retrieval.get(todo_id, 0.0)
+                    + self.CONTEXT_RECENCY_WEIGHT * todo_id / max_id
+                    + self.CONTEXT_PENDING_WEIGHT * (0.0 if completed else 1.0)
+                )
+                if len(kept) and used >= budget and score <= kept[0][0]:
+                    continue
+                description = (description or "")[:self.CONTEXT_MAX_DESCRIPTION_CHARS]
+                line = f"- ID {todo_id}: {description} [{'completed' if completed else 'pending'}]"
+                tokens = estimate_tokens(line)
+                heapq.heappush(kept, (score, todo_id, line, tokens))
+                used += tokens
+                while used > budget and kept:
+                    used -= heapq.heappop(kept)[3]
+
+            if total == 0:
+                context = "\n".join(header[:-1] + ["The todo list is currently empty."])
+                return {"context": context, "included": 0, "omitted": 0, "tokens": estimate_tokens(context)}
+            kept.sort(reverse=True)
+            lines = header + [line for _, _, line, _ in kept]
+            omitted = total - len(kept)
+            if omitted:
+                lines.append(f"({omitted} more tasks not shown)")
+            context = "\n".join(lines)
+            return {"context": context, "included": len(kept), "omitted": omitted, "tokens": estimate_tokens(context)}
         except Exception as e:
             print(f"Error creating context from todos: {str(e)}")
-            return "Error retrieving tasks from database."
+            return {"context": "Error retrieving tasks from database.", "included": 0, "omitted": 0, "tokens": 0}
+
+    @staticmethod
+    def _content(description: str, completed: bool) -> str:
+        return f"Task: {description} (Status: {'Done' if completed else 'Pending'})"
+
+    @classmethod
+    def _todo_content(cls, todo: models.TodoDB) -> str:
+        return cls._content(todo.description, todo.completed)
+
+    def point_payload(self, todo: models.TodoDB) -> Dict[str, Any]:
+        # completed and category are indexed by every backend so searches can filter on them
+        return {
+            "id": todo.id,
+            "content": self._todo_content(todo),
+            "completed": todo.completed,
+            "category": todo.category,
+            "category_source": todo.category_source,
+            "model": self.model_name,
+        }
+
+    @staticmethod
+    def _training_label(payload: Dict[str, Any]) -> Optional[str]:
+        # Only user-set labels train the categorizer; None is skipped by learn and forget
+        return payload["category"] if payload.get("category_source") == models.CATEGORY_SOURCE_USER else None
+
+    def _upsert_points(self, todos: List[models.TodoDB], payloads: List[Dict[str, Any]],
+                       read_at: Optional[float] = None):
+        # A category-only change re-upserts the payload; its vector comes from the embedding cache
+        vectors = self.embeddings.embed_documents([payload["content"] for payload in payloads])
+        with self._lock:
+            if read_at is not None:
+                # Rows deleted while they were being embedded stay out
+                keep = [i for i, todo in enumerate(todos) if not self._deleted_since(todo.id, read_at)]
+                if not keep:
+                    return
+                todos, payloads, vectors = [todos[i] for i in keep], [payloads[i] for i in keep], [vectors[i] for i in keep]
+            previous = [self._indexed.get(todo.id) for todo in todos]
+            # Stored vectors of user-labelled rows whose text changed, read before they are replaced,
+            # so the old centroid contribution is forgotten without embedding the old text again
+            changed = [todo.id for todo, payload, old in zip(todos, payloads, previous)
+                       if old is not None and self._training_label(old) is not None
+                       and old["content"] != payload["content"]]
+            old_vectors = self.index.get_vectors(changed) if changed else {}
+            self.index.apply([todo.id for todo in todos], vectors, payloads)
+            for todo, payload in zip(todos, payloads):
+                self._indexed[todo.id] = payload
+            if self._reindex_dirty is not None:
+                self._reindex_dirty.update(todo.id for todo in todos)
+            self.index_version += 1
+        self.related.update([todo.id for todo in todos], vectors)
+        self._start_related_repair()
+        # A category edit is a correction: move the todo from its old centroid to the new one.
+        # Rows without a user label never trained the categorizer, so there is nothing to forget
+        forget_vectors, forget_labels = [], []
+        for i, old in enumerate(previous):
+            label = self._training_label(old) if old is not None else None
+            if label is None:
+                continue
+            vector = vectors[i] if old["content"] == payloads[i]["content"] else old_vectors.get(todos[i].id)
+            if vector is not None:
+                forget_vectors.append(vector)
+                forget_labels.append(label)
+        self.categorizer.forget(forget_vectors, forget_labels)
+        self.categorizer.learn(vectors, [self._training_label(payload) for payload in payloads])
+        self._update_clusters([todo.id for todo in todos], vectors)
+
+    def _set_document(self, todo: models.TodoDB):
+        self.lexical.upsert(todo.id, todo.description)
+        self._documents[todo.id] = {
+            "id": todo.id,
+            "description": todo.description,
+            "content": self._todo_content(todo),
+            "completed": todo.completed,
+            "category": todo.category,
+        }
+
+    def _deleted_since(self, todo_id: int, read_at: float) -> bool:
+        # Called with self._lock held
+        deleted_at = self._deleted_at.get(todo_id)
+        return deleted_at is not None and deleted_at >= read_at
+
+    def upsert_todo(self, todo: models.TodoDB, read_at: Optional[float] = None) -> bool:
+        """
+        Embed a single todo and upsert it under its own id.
+
+        Before warm-up finishes only the keyword index is updated and the id is queued,
+        so CRUD requests never load the model.
+
+        Args:
+            todo (TodoDB): The row to index
+            read_at (float): time.monotonic() from before the row was read; if the todo was
+                deleted since, the row is stale and nothing is written. Defaults to now.
+
+        Returns:
+            bool: True if the point was (re-)indexed, False if its payload was unchanged, queued,
+                deleted or indexing failed
+        """
+        try:
+            read_at = time.monotonic() if read_at is None else read_at
+            with self._lock:
+                if self._deleted_since(todo.id, read_at):
+                    return False
+                self._set_document(todo)
+            payload = self.point_payload(todo)
+            if self._queue_until_ready(todo.id):
+                return False
+            if self._indexed.get(todo.id) == payload:
+                return False
+            self._upsert_points([todo], [payload], read_at)
+            return True
+        except Exception as e:
+            print(f"Error indexing todo {todo.id}: {str(e)}")
+            return False
+
+    def _queue_until_ready(self, todo_id: int) -> bool:
+        """Queue a write for replay if warm-up has not finished; True if the index write should wait."""
+        # "ready" is final, so it can be read without the lock
+        if self.state == "ready":
+            return False
+        with self._lock:
+            # Re-checked under the lock, which ensure_ready holds while it takes the queue
+            if self.state == "ready":
+                return False
+            # Only a running warm-up needs the id: a cold or failed service syncs the whole
+            # table when it (next) warms up, so the set stays bounded by one warm-up's writes
+            if self.state == "warming":
+                self._pending_ids.add(todo_id)
+            self.index_version += 1
+            return True
+
+    def _remove_points(self, todo_ids: List[int]) -> bool:
+        with self._lock:
+            if self._reindex_dirty is not None:
+                self._reindex_dirty.update(todo_ids)
+            removed = {todo_id: self._indexed.pop(todo_id, None) for todo_id in todo_ids}
+            removed = {todo_id: payload for todo_id, payload in removed.items() if payload is not None}
+            if not removed:
+                return False
+            todo_ids = list(removed)
+            # Read before the points go; only user-labelled rows trained the categorizer
+            labelled = {todo_id: self._training_label(payload) for todo_id, payload in removed.items()
+                        if self._training_label(payload) is not None}
+            old_vectors = self.index.get_vectors(list(labelled)) if labelled else {}
+            self.index.apply(delete_ids=todo_ids)
+            self.index_version += 1
+        self.related.remove(todo_ids)
+        self._start_related_repair()
+        self.categorizer.forget(list(old_vectors.values()), [labelled[todo_id] for todo_id in old_vectors])
+        with self._cluster_lock:
+            for todo_id in todo_ids:
+                self._cluster_of.pop(todo_id, None)
+        return True
+
+    # How long a delete is remembered; far longer than any row is held before it is indexed
+    DELETE_TOMBSTONE_SECONDS = 600
+
+    def delete_todo(self, todo_id: int) -> bool:
+        try:
+            with self._lock:
+                now = time.monotonic()
+                self._deleted_at.pop(todo_id, None)
+                self._deleted_at[todo_id] = now
+                # Oldest first, so expired tombstones are always at the front
+                for expired, deleted_at in list(self._deleted_at.items()):
+                    if now - deleted_at < self.DELETE_TOMBSTONE_SECONDS:
+                        break
+                    del self._deleted_at[expired]
+                self.lexical.delete(todo_id)
+                self._documents.pop(todo_id, None)
+            if self._queue_until_ready(todo_id):
+                return False
+            return self._remove_points([todo_id])
+        except Exception as e:
+            print(f"Error removing todo {todo_id} from index: {str(e)}")
+            return False
 
     def build_vector_store(self, db: Session):
+        """
+        Bring the index in line with the todos table.
+
+        Only rows that are missing or whose description/status/category changed are re-indexed,
+        and points for deleted rows are dropped. Meant for startup, not per request.
+        """
         try:
-            todos = db.query(models.TodoDB).all()
-            documents = []
-            for todo in todos:
-                content = f"Task: {todo.description} (Status: {'Done' if todo.completed else 'Pending'})"
-                documents.append(Document(
-                    page_content=content,
-                    metadata={"id": todo.id, "completed": todo.completed}
-                ))
-
-            if documents:
-                # Updated to use Qdrant.from_documents with proper parameters
-                self.vector_store = Qdrant.from_documents(
-                    documents=documents,
-                    embedding=self.embeddings,
-                    location=":memory:",
-                    collection_name=self.collection_name,
-                    client=self.client
-                )
+            if self.ensure_ready():
+                self._sync_documents(db)
+                self._sync_vectors(db)
         except Exception as e:
             print(f"Error building vector store: {str(e)}")
-            self.vector_store = None
 
-    def search_similar_tasks(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+    def begin_reindex(self):
+        """Start recording writes that a reindex job running from now on may miss."""
+        with self._lock:
+            self._reindex_dirty = set()
+
+    def abort_reindex(self):
+        with self._lock:
+            self._reindex_dirty = None
+
+    def finish_reindex(self, staging, payloads: Dict[int, Dict[str, Any]]):
+        """
+        Publish a fully rebuilt index in place of the current one.
+
+        Rows written while the job ran are brought up to date in the staging index
+        first, holding the write lock so no write can slip in before the swap.
+
+        Args:
+            staging (VectorIndex): Index filled by the job, from base.staging()
+            payloads (dict): Todo id -> payload the job indexed
+        """
+        with self._lock:
+            dirty, self._reindex_dirty = self._reindex_dirty or set(), None
+            present = [todo_id for todo_id in dirty if todo_id in self._indexed]
+            if present:
+                latest = [self._indexed[todo_id] for todo_id in present]
+                staging.upsert(present, self.embeddings.embed_documents([p["content"] for p in latest]), latest)
+            gone = [todo_id for todo_id in dirty if todo_id not in self._indexed]
+            if gone:
+                staging.delete(gone)
+            for todo_id in gone:
+                payloads.pop(todo_id, None)
+            payloads.update((todo_id, self._indexed[todo_id]) for todo_id in present)
+            self._indexed = payloads
+            # Searches still running on the old snapshot get a few seconds before it is dropped
+            self.index.replace_base(staging, retire_after=5.0)
+            self.index_version += 1
+        # Every vector may have changed, so the neighbour lists are recomputed from scratch
+        self._start_related_build()
+
+    def _sync_documents(self, db: Session):
+        # The keyword index lives in memory only, so it is refilled from the table
+        known_ids = set(self._documents)
+        todo_ids = set()
+        for todo in db.query(models.TodoDB).yield_per(1000):
+            self._set_document(todo)
+            todo_ids.add(todo.id)
+        # Only drop ids known before the scan; rows created meanwhile are not in it
+        for todo_id in known_ids - todo_ids:
+            self.lexical.delete(todo_id)
+            self._documents.pop(todo_id, None)
+        self._documents_loaded = True
+
+    # Rows embedded and applied per step of the startup sync; the lock is released between steps
+    SYNC_CHUNK_SIZE = 256
+
+    def _sync_vectors(self, db: Session):
+        with self._lock:
+            indexed = dict(self._indexed)
+
+        todo_ids = set()
+        changed, payloads = [], []
+        for todo in db.query(models.TodoDB).yield_per(1000):
+            todo_ids.add(todo.id)
+            payload = self.point_payload(todo)
+            if indexed.get(todo.id) != payload:
+                changed.append(todo)
+                payloads.append(payload)
+            if len(changed) >= self.SYNC_CHUNK_SIZE:
+                self._upsert_points(changed, payloads)
+                changed, payloads = [], []
+        if changed:
+            self._upsert_points(changed, payloads)
+
+        stale_ids = set(indexed) - todo_ids
+        if stale_ids:
+            self._remove_points(list(stale_ids))
+
+    def search_similar_tasks(self, query: str, k: int = 3, mode: Optional[str] = None,
+                             filters: Optional[Dict[str, Any]] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        Find the todos most similar to the query.
+
+        Args:
+            query (str): Free text, usually the user's selection
+            k (int): Number of tasks to return
+            mode (str): "vector", "lexical" (BM25 only, never calls the embedder) or
+                "hybrid" (both, merged by reciprocal rank fusion); defaults to RAG_SEARCH_MODE
+            filters (dict): Required "completed" / "category" values, applied inside the indexes
+            offset (int): Number of best matches to skip, for pagination
+
+        Returns:
+            List[Dict[str, Any]]: Matching tasks, best first
+        """
+        return self.search_similar_tasks_batch([query], k=k, mode=mode, filters=filters, offset=offset)[0]
+
+    def search_similar_tasks_batch(self, queries: List[str], k: int = 3, mode: Optional[str] = None,
+                                   filters: Optional[Dict[str, Any]] = None, offset: int = 0) -> List[List[Dict[str, Any]]]:
+        """
+        Search several queries at once: one embedding batch and one backend call.
+        """
+        mode = mode or database.RAG_SEARCH_MODE
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
         try:
-            if not self.vector_store:
+            if not queries:
                 return []
-            docs = self.vector_store.similarity_search(query, k=k)
-            return [{"id": d.metadata["id"], "content": d.page_content, "completed": d.metadata["completed"]} for d in docs]
+            if mode == "hybrid" and self.state == "warming":
+                # Don't hold the request while the background warm-up loads the model
+                mode = "lexical"
+            elif mode != "lexical" and not self.ensure_ready():
+                mode = "lexical"
+            self._ensure_documents()
+            if not self._documents:
+                return [[] for _ in queries]
+            version = self.index_version
+            filter_key = tuple(sorted(filters.items()))
+            keys = [(query, k, mode, version, filter_key, offset) for query in queries]
+            cached = [self.result_cache.get(key) for key in keys]
+            pending = [i for i, hit in enumerate(cached) if hit is None]
+            if pending:
+                fresh = self._search_uncached([queries[i] for i in pending], k, mode, filters, offset)
+                for i, results in zip(pending, fresh):
+                    cached[i] = results
+                    self.result_cache.put(keys[i], results)
+            return cached
         except Exception as e:
             print(f"Error searching similar tasks: {str(e)}")
-            return []
\ No newline at end of file
+            return [[] for _ in queries]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        vectors = [self.query_cache.get(query) for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embeddings.embed_documents([queries[i] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self.query_cache.put(queries[i], vector)
+        return vectors
+
+    def _search_uncached(self, queries: List[str], k: int, mode: str,
+                         filters: Dict[str, Any], offset: int) -> List[List[Dict[str, Any]]]:
+        # A page needs every hit before it
+        wanted = offset + k
+        if mode != "hybrid":
+            rankings = self._rankings(queries, wanted, mode, filters)
+        else:
+            # Fused at one depth per query whatever the offset, since fusing deeper lists reorders
+            # the top; pages past it are empty, and the offset bound caps it
+            depth = min(database.HYBRID_FUSION_DEPTH, database.SEARCH_MAX_OFFSET) + k
+            filter_key = tuple(sorted(filters.items()))
+            keys = [(query, depth, self.index_version, filter_key) for query in queries]
+            rankings = [self.fusion_cache.get(key) for key in keys]
+            missing = [i for i, ranking in enumerate(rankings) if ranking is None]
+            if missing:
+                fused = self._rankings([queries[i] for i in missing], depth, mode, filters)
+                for i, ranking in zip(missing, fused):
+                    rankings[i] = ranking
+                    self.fusion_cache.put(keys[i], ranking)
+        return [[self._task(todo_id) for todo_id in ranking[offset:wanted] if todo_id in self._documents]
+                for ranking in rankings]
+
+    def _rankings(self, queries: List[str], depth: int, mode: str, filters: Dict[str, Any]) -> List[List[int]]:
+        """Up to depth todo ids per query, best first; hybrid fuses depth candidates from each side."""
+        vector_rankings = [[] for _ in queries]
+        if mode in ("vector", "hybrid"):
+            vectors = self._embed_queries(queries)
+            # One snapshot for the whole batch, even if a write publishes a newer one meanwhile
+            snapshot = self.index.snapshot()
+            vector_rankings = [[hit[0] for hit in hits] for hits in snapshot.search_batch(vectors, depth, filters or None)]
+        lexical_rankings = [[] for _ in queries]
+        if mode in ("lexical", "hybrid"):
+            doc_filter = (lambda doc_id: self._matches(doc_id, filters)) if filters else None
+            lexical_rankings = [[doc_id for doc_id, _ in self.lexical.search(query, depth, doc_filter)] for query in queries]
+
+        if mode == "hybrid":
+            return [reciprocal_rank_fusion([vector_ids, lexical_ids], depth)
+                    for vector_ids, lexical_ids in zip(vector_rankings, lexical_rankings)]
+        return [(vector_ids or lexical_ids)[:depth] for vector_ids, lexical_ids in zip(vector_rankings, lexical_rankings)]
+
+    def _search_neighbours(self, vectors: List[List[float]], k: int) -> List[List[tuple]]:
+        return self.index.snapshot().search_batch(vectors, k)
+
+    def _indexed_vectors(self, todo_ids: List[int]) -> Dict[int, np.ndarray]:
+        # Read back from the vector index, so nothing is re-embedded; ids deleted in the meantime are left out
+        return self.index.get_vectors([todo_id for todo_id in todo_ids if todo_id in self._indexed])
+
+    def _start_related_build(self):
+        self._related_stale = True
+        self._start_related_thread()
+
+    def _start_related_repair(self):
+        if self.related.stale_count():
+            self._related_repair_pending = True
+            self._start_related_thread()
+
+    def _start_related_thread(self):
+        if self._related_thread is not None and self._related_thread.is_alive():
+            # The running thread checks both flags again before it exits
+            return
+        thread = threading.Thread(target=self._run_related, name="related-graph", daemon=True)
+        thread.start()
+        # Published once started, so close() never joins a thread that has not begun
+        self._related_thread = thread
+
+    def _run_related(self):
+        try:
+            while not self._closing:
+                if self._related_stale:
+                    self.build_related_graph()
+                elif self._related_repair_pending:
+                    self._related_repair_pending = False
+                    self.repair_related_graph()
+                else:
+                    return
+        except Exception as e:
+            print(f"Error building related tasks graph: {str(e)}")
+
+    def build_related_graph(self, batch_size: int = 256):
+        """
+        Compute the neighbour lists of every indexed todo, one search batch at a time.
+
+        Runs in the background after warm-up and after a reindex; writes made meanwhile
+        keep the lists already built up to date, and lookups of todos not reached yet
+        compute their list on demand.
+        """
+        self._related_stale = False
+        self.related.clear()
+        todo_ids = list(self._indexed)
+        for start in range(0, len(todo_ids), batch_size):
+            if self._closing or self._related_stale:
+                return
+            vectors = self._indexed_vectors(todo_ids[start:start + batch_size])
+            if vectors:
+                self.related.build(list(vectors), list(vectors.values()))
+
+    def repair_related_graph(self, batch_size: int = 256):
+        """Recompute the neighbour lists left stale by writes, one search batch at a time."""
+        while not self._closing and not self._related_stale:
+            if not self.related.repair(self._indexed_vectors, limit=batch_size):
+                return
+
+    def _fit_categorizer(self, batch_size: int = 1024):
+        self.categorizer.clear()
+        labels = {todo_id: self._training_label(payload) for todo_id, payload in self._indexed.items()}
+        todo_ids = [todo_id for todo_id, label in labels.items() if label is not None]
+        for start in range(0, len(todo_ids), batch_size):
+            vectors = self._indexed_vectors(todo_ids[start:start + batch_size])
+            self.categorizer.learn(list(vectors.values()), [labels[todo_id] for todo_id in vectors])
+
+    def categorize_tasks(self, descriptions: List[str], completed: Optional[List[bool]] = None,
+                         min_margin: Optional[float] = None) -> List[Optional[str]]:
+        """
+        Categorize new tasks by their nearest category centroid, in one embedding batch.
+
+        The texts are embedded exactly as upsert_todo will index them, so the embedding
+        cache serves the index write that follows.
+
+        Args:
+            descriptions (list): Task descriptions
+            completed (list): Their status, pending when omitted
+            min_margin (float): Overrides CATEGORIZER_MIN_MARGIN; 0 for a best guess
+
+        Returns:
+            List[Optional[str]]: A category per task, or None where the classifier is not
+                confident (or not warmed up yet) and the LLM should decide
+        """
+        try:
+            if self.state != "ready" or not descriptions:
+                return [None for _ in descriptions]
+            completed = completed or [False] * len(descriptions)
+            vectors = self.embeddings.embed_documents(
+                [self._content(description, done) for description, done in zip(descriptions, completed)]
+            )
+            return [label for label, _ in self.categorizer.predict(vectors, min_margin=min_margin)]
+        except Exception as e:
+            print(f"Error categorizing tasks locally: {str(e)}")
+            return [None for _ in descriptions]
+
+    def related_tasks(self, todo_id: int, k: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Todos most similar to the given one, from the precomputed neighbour graph.
+
+        Args:
+            todo_id (int): Todo to find neighbours for
+            k (int): Number of neighbours to return, at most RELATED_GRAPH_K
+
+        Returns:
+            List[Dict[str, Any]]: Related tasks with their similarity score, best first; None if the todo does not exist
+        """
+        try:
+            self._ensure_documents()
+            if todo_id not in self._documents:
+                return None
+            if self.related.is_stale(todo_id):
+                # Asked for before the background repair got to it
+                self.related.repair(self._indexed_vectors, ids=[todo_id])
+            neighbours = self.related.related(todo_id)
+            if neighbours is None:
+                # Not reached by the background build yet, or written before warm-up finished
+                if not self.ensure_ready():
+                    return []
+                vectors = self._indexed_vectors([todo_id])
+                if not vectors:
+                    return []
+                self.related.build([todo_id], [vectors[todo_id]])
+                neighbours = self.related.related(todo_id) or ()
+            return [{**self._task(other), "score": round(score, 4)}
+                    for other, score in neighbours[:k or self.related.k] if other in self._documents]
+        except Exception as e:
+            print(f"Error finding tasks related to {todo_id}: {str(e)}")
+            return []
+
+    # Refit the clusters from scratch once this share of the todos arrived or changed since the last fit
+    CLUSTER_REFIT_FRACTION = 0.2
+
+    def _update_clusters(self, todo_ids: List[int], vectors: List[List[float]]):
+        with self._cluster_lock:
+            if self._cluster_dirty is not None:
+                self._cluster_dirty.update(todo_ids)
+            if self.kmeans is None:
+                return
+            self.kmeans.partial_fit(vectors)
+            labels, similarities = self.kmeans.predict(vectors)
+            for todo_id, label, similarity in zip(todo_ids, labels.tolist(), similarities.tolist()):
+                self._cluster_of[todo_id] = (label, similarity)
+            self._cluster_updates += len(todo_ids)
+
+    def _fit_clusters(self, k: int, batch_size: int = 1024, epochs: int = 2):
+        # Runs without _cluster_lock, so writes are not held up by a refit
+        with self._cluster_lock:
+            self._cluster_dirty = set()
+        todo_ids = list(self._indexed)
+        rng = np.random.default_rng(0)
+
+        def batches():
+            # A fresh random order per epoch, so every mini-batch is a sample of all topics
+            order = rng.permutation(len(todo_ids))
+            for start in range(0, len(order), batch_size):
+                if self._closing:
+                    return
+                yield list(self._indexed_vectors([todo_ids[i] for i in order[start:start + batch_size]]).values())
+
+        kmeans = MiniBatchKMeans(k).fit(batches, epochs=epochs)
+        assignments = {}
+        for start in range(0, len(todo_ids), batch_size):
+            if self._closing:
+                return
+            vectors = self._indexed_vectors(todo_ids[start:start + batch_size])
+            labels, similarities = kmeans.predict(list(vectors.values()))
+            assignments.update(zip(vectors, zip(labels.tolist(), similarities.tolist())))
+        with self._cluster_lock:
+            dirty, self._cluster_dirty = self._cluster_dirty, None
+            vectors = self._indexed_vectors(list(dirty))
+            if vectors:
+                kmeans.partial_fit(list(vectors.values()))
+                labels, similarities = kmeans.predict(list(vectors.values()))
+                assignments.update(zip(vectors, zip(labels.tolist(), similarities.tolist())))
+            for todo_id in dirty - set(vectors):
+                assignments.pop(todo_id, None)
+            self.kmeans, self._cluster_of, self._cluster_updates = kmeans, assignments, 0
+            self._cluster_generation += 1
+
+    def _start_cluster_fit(self, k: int):
+        with self._cluster_lock:
+            if self._cluster_thread is not None:
+                # A fit is running; it picks up a different k when it is done
+                if self._cluster_fitting != k:
+                    self._cluster_wanted = k
+                return
+            self._cluster_wanted = k
+            self._cluster_thread = threading.Thread(target=self._run_cluster_fit, name="cluster-fit", daemon=True)
+            self._cluster_thread.start()
+
+    def _run_cluster_fit(self):
+        while True:
+            with self._cluster_lock:
+                k, self._cluster_wanted = self._cluster_wanted, None
+                self._cluster_fitting = k
+                if k is None or self._closing:
+                    self._cluster_thread = None
+                    return
+            try:
+                self._fit_clusters(k)
+            except Exception as e:
+                print(f"Error clustering tasks: {str(e)}")
+
+    def cluster_tasks(self, k: Optional[int] = None, examples: int = 3) -> Dict[str, Any]:
+        """
+        Group todos into k topics with mini-batch k-means over their embeddings.
+
+        The first call (or one with a new k) starts fitting the clusters in the
+        background and returns status "building" with no clusters until the fit is
+        done. After that each write nudges them and assigns the written todo, and
+        once CLUSTER_REFIT_FRACTION of the todos changed a refit runs in the
+        background while the current clusters keep being served. Responses are
+        cached per index version and fit, so repeated calls between writes cost a
+        dict lookup.
+
+        Args:
+            k (int): Number of clusters; defaults to CLUSTER_COUNT
+            examples (int): Representative tasks (closest to the centroid) per cluster
+
+        Returns:
+            Dict[str, Any]: "k", "status" ("ready" or "building"), "todos" and
+                "clusters" (largest first) with "size" and "tasks"
+        """
+        k = k or database.CLUSTER_COUNT
+        try:
+            if not self.ensure_ready():
+                return {"k": k, "status": "ready", "todos": 0, "clusters": []}
+            key = (self.index_version, self._cluster_generation, k, examples)
+            cached = self.cluster_cache.get(key)
+            if cached is not None:
+                return cached
+            with self._cluster_lock:
+                current = self.kmeans is not None and self.kmeans.k == k
+                refit = not current or \
+                    self._cluster_updates > self.CLUSTER_REFIT_FRACTION * max(len(self._cluster_of), 1)
+                assignments = list(self._cluster_of.items()) if current else None
+            if refit and self._indexed:
+                self._start_cluster_fit(k)
+            if assignments is None:
+                # Not cached: the finished fit bumps the generation, but only a write bumps the index version
+                return {"k": k, "status": "building" if self._indexed else "ready", "todos": 0, "clusters": []}
+
+            members: Dict[int, list] = {}
+            for todo_id, (label, similarity) in assignments:
+                if todo_id in self._documents:
+                    members.setdefault(label, []).append((similarity, todo_id))
+            clusters = []
+            for label, points in members.items():
+                closest = heapq.nlargest(examples, points)
+                clusters.append({
+                    "cluster": label,
+                    "size": len(points),
+                    "tasks": [{**self._task(todo_id), "similarity": round(similarity, 4)} for similarity, todo_id in closest],
+                })
+            clusters.sort(key=lambda cluster: cluster["size"], reverse=True)
+            result = {"k": k, "status": "ready", "todos": sum(cluster["size"] for cluster in clusters), "clusters": clusters}
+            self.cluster_cache.put(key, result)
+            return result
+        except Exception as e:
+            print(f"Error clustering tasks: {str(e)}")
+            return {"k": k, "status": "ready", "todos": 0, "clusters": []}
+
+    def _matches(self, todo_id: int, filters: Dict[str, Any]) -> bool:
+        document = self._documents.get(todo_id)
+        return document is not None and all(document.get(field) == value for field, value in filters.items())
+
+    def _task(self, todo_id: int) -> Dict[str, Any]:
+        return dict(self._documents[todo_id])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "vector_backend": database.VECTOR_BACKEND,
+            "state": self.state,
+            "indexed_todos": len(self._indexed),
+            "lexical_documents": len(self.lexical),
+            "index_version": self.index_version,
+            "snapshot_version": self.index.version if self.index is not None else None,
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache else None,
+            "query_cache": self.query_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "fusion_cache": self.fusion_cache.stats(),
+            "context_cache": self.context_cache.stats(),
+            "related_graph_nodes": len(self.related),
+            "related_graph_stale": self.related.stale_count(),
+            "categorizer_examples": self.categorizer.stats(),
+            "clusters": self.kmeans.k if self.kmeans is not None else None,
+            "cluster_fit_running": self._cluster_thread is not None,
+        }
+
+    def close(self):
+        # Flushes and releases the on-disk storage lock
+        self._closing = True
+        if self._warmup_timer is not None:
+            self._warmup_timer.cancel()
+        if self._related_thread is not None:
+            self._related_thread.join(timeout=10)
+        try:
+            if self.index is not None:
+                self.index.close()
+            if self.embedding_cache:
+                self.embedding_cache.close()
+        except Exception as e:
+            print(f"Error closing vector store: {str(e)}")
+
+_rag_service: Optional[RAGService] = None
+_rag_service_lock = threading.Lock()
+
+def get_rag_service() -> RAGService:
+    """
+    Return the process-wide RAGService shared by the API routes and the CRUD layer.
+
+    With RAG_SIDECAR_SOCKET set this is a client of the shared sidecar process instead.
+
+    Returns:
+        RAGService: The shared RAG service instance
+    """
+    global _rag_service
+    if _rag_service is None:
+        with _rag_service_lock:
+            if _rag_service is None:
+                if database.RAG_SIDECAR_SOCKET:
+                    from rag_sidecar import RAGSidecarClient
+                    _rag_service = RAGSidecarClient(database.RAG_SIDECAR_SOCKET)
+                else:
+                    _rag_service = RAGService()
+    return _rag_service
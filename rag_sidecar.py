@@ -0,0 +1,401 @@
+# rag_sidecar.py
+"""
+Sidecar process that owns the embedding model and vector index for every API worker.
+
+With several uvicorn workers each process would otherwise load its own model and
+build its own, diverging index. Start one sidecar and point the workers at it:
+
+    python rag_sidecar.py --socket /tmp/todo-rag.sock
+    RAG_SIDECAR_SOCKET=/tmp/todo-rag.sock uvicorn main:app --workers 4
+
+Workers talk to it over a Unix domain socket with length-prefixed JSON frames.
+Single searches arriving from different workers at the same time are answered
+as one batch (one embedding call, one index scan).
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from typing import List, Dict, Any, Optional
+import database
+import models
+from rag import RAGService
+from reindex import ReindexJob
+
+_HEADER = struct.Struct("!I")
+
+def _send(sock: socket.socket, message: Dict[str, Any]):
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _recv(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, _HEADER.unpack(header)[0])
+    return json.loads(data) if data is not None else None
+
+class SearchBatcher:
+    """
+    Coalesces single searches from concurrent connections into batched calls.
+
+    No timer is involved: whatever queued up while the previous batch ran goes
+    into the next one, so an idle sidecar adds no latency. A search that fails in
+    the batch thread raises in the request that asked for it, and a request gives
+    up after `timeout` seconds rather than waiting on a batch thread forever.
+    """
+
+    def __init__(self, rag: RAGService, max_batch: int = 64, timeout: float = 60.0):
+        self.rag = rag
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue: queue.Queue = queue.Queue()
+        threading.Thread(target=self._run, name="sidecar-batcher", daemon=True).start()
+
+    def search(self, query: str, k: int, mode: Optional[str], filters: Optional[Dict[str, Any]], offset: int):
+        item = {"query": query, "params": (k, mode, json.dumps(filters, sort_keys=True), offset),
+                "filters": filters, "done": threading.Event(), "result": [], "error": None}
+        self._queue.put(item)
+        if not item["done"].wait(self.timeout):
+            raise TimeoutError(f"Search batch did not finish within {self.timeout} s")
+        if item["error"] is not None:
+            raise item["error"]
+        return item["result"]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._search(batch)
+            finally:
+                # Nothing in the batch is left waiting, whatever went wrong above
+                for item in batch:
+                    if not item["done"].is_set():
+                        item["error"] = RuntimeError("Search batch failed")
+                        item["done"].set()
+
+    def _search(self, batch: List[Dict[str, Any]]):
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for item in batch:
+            groups.setdefault(item["params"], []).append(item)
+        for (k, mode, _, offset), items in groups.items():
+            try:
+                results = self.rag.search_similar_tasks_batch(
+                    [item["query"] for item in items], k=k, mode=mode, filters=items[0]["filters"], offset=offset
+                )
+            except Exception as e:
+                results, error = [[] for _ in items], e
+            else:
+                error = None
+            for item, result in zip(items, results):
+                item["result"], item["error"] = result, error
+                item["done"].set()
+
+class RAGSidecar:
+    """Request dispatcher around the sidecar's own RAGService and reindex job."""
+
+    def __init__(self, rag: RAGService):
+        self.rag = rag
+        self.batcher = SearchBatcher(rag)
+        self.reindex_job = ReindexJob(rag)
+
+    def dispatch(self, op: str, args: Dict[str, Any]):
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            raise ValueError(f"Unknown sidecar operation: {op}")
+        return handler(**args)
+
+    def op_search(self, query, k=3, mode=None, filters=None, offset=0):
+        return self.batcher.search(query, k, mode, filters, offset)
+
+    def op_search_batch(self, queries, k=3, mode=None, filters=None, offset=0):
+        return self.rag.search_similar_tasks_batch(queries, k=k, mode=mode, filters=filters, offset=offset)
+
+    def op_upsert(self, todo, read_at=None):
+        # Workers already committed the row and bumped the write version with it.
+        # read_at is time.monotonic(), which is shared by the processes of one host
+        return self.rag.upsert_todo(models.TodoDB(**todo), read_at=read_at)
+
+    def op_delete(self, todo_id):
+        return self.rag.delete_todo(todo_id)
+
+    def op_related(self, todo_id, k=None):
+        return self.rag.related_tasks(todo_id, k=k)
+
+    def op_categorize(self, descriptions, completed=None, min_margin=None):
+        return self.rag.categorize_tasks(descriptions, completed, min_margin=min_margin)
+
+    def op_clusters(self, k=None, examples=3):
+        return self.rag.cluster_tasks(k=k, examples=examples)
+
+    def op_context(self, user_context="", query="", token_budget=None, search_mode=None):
+        db = database.SessionLocal()
+        try:
+            return self.rag.build_context(db, user_context=user_context, query=query, token_budget=token_budget,
+                                          search_mode=search_mode)
+        finally:
+            db.close()
+
+    def op_warmup(self):
+        self.rag.start_warmup()
+
+    def op_ensure_ready(self):
+        return self.rag.ensure_ready()
+
+    def op_readiness(self):
+        return self.rag.readiness()
+
+    def op_stats(self):
+        return self.rag.stats()
+
+    def op_reindex_start(self):
+        return self.reindex_job.start()
+
+    def op_reindex_cancel(self):
+        return self.reindex_job.cancel()
+
+    def op_reindex_progress(self):
+        return self.reindex_job.progress()
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv(self.request)
+            except (ConnectionError, ValueError):
+                return
+            if request is None:
+                return
+            try:
+                response = {"ok": True, "result": self.server.sidecar.dispatch(request["op"], request.get("args", {}))}
+            except Exception as e:
+                print(f"Sidecar error in {request.get('op')}: {str(e)}")
+                response = {"ok": False, "error": str(e)}
+            try:
+                _send(self.request, response)
+            except ConnectionError:
+                return
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+def serve(socket_path: str):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    # The sidecar may start before any worker has created the table
+    models.Base.metadata.create_all(bind=database.engine)
+    models.add_missing_columns(database.engine)
+    rag = RAGService()
+    # Only this user's processes may talk to the sidecar; the socket is created 0600 by
+    # bind() itself, so there is no moment when others could connect
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(socket_path, _Handler)
+    finally:
+        os.umask(old_umask)
+    server.sidecar = RAGSidecar(rag)
+    # Exit through the finally block below so the index is flushed and the socket removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if database.RAG_WARMUP:
+        rag.start_warmup()
+    print(f"RAG sidecar listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+        rag.close()
+
+class RAGSidecarClient:
+    """
+    Stand-in for RAGService in API workers when RAG_SIDECAR_SOCKET is set.
+
+    Connections are pooled so concurrent requests in one worker do not queue behind
+    each other. Failures are logged and answered with the same empty results
+    RAGService gives, so the API stays up while the sidecar restarts.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool: queue.LifoQueue = queue.LifoQueue()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _call(self, op: str, **args):
+        # A pooled connection may have died with a previous sidecar; retry once on a fresh one
+        for attempt in range(2):
+            try:
+                sock = self._pool.get_nowait()
+                pooled = True
+            except queue.Empty:
+                sock, pooled = self._connect(), False
+            try:
+                _send(sock, {"op": op, "args": args})
+                response = _recv(sock)
+                if response is None:
+                    raise ConnectionError("RAG sidecar closed the connection")
+            except OSError:
+                sock.close()
+                if pooled and attempt == 0:
+                    continue
+                raise
+            self._pool.put(sock)
+            if not response["ok"]:
+                raise RuntimeError(response["error"])
+            return response["result"]
+
+    def search_similar_tasks(self, query: str, k: int = 3, mode: Optional[str] = None,
+                             filters: Optional[Dict[str, Any]] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        try:
+            return self._call("search", query=query, k=k, mode=mode, filters=filters, offset=offset)
+        except Exception as e:
+            print(f"Error searching similar tasks via sidecar: {str(e)}")
+            return []
+
+    def search_similar_tasks_batch(self, queries: List[str], k: int = 3, mode: Optional[str] = None,
+                                   filters: Optional[Dict[str, Any]] = None, offset: int = 0) -> List[List[Dict[str, Any]]]:
+        try:
+            return self._call("search_batch", queries=queries, k=k, mode=mode, filters=filters, offset=offset)
+        except Exception as e:
+            print(f"Error searching similar tasks via sidecar: {str(e)}")
+            return [[] for _ in queries]
+
+    def upsert_todo(self, todo: models.TodoDB, read_at: Optional[float] = None) -> bool:
+        try:
+            fields = {"id": todo.id, "description": todo.description,
+                      "completed": todo.completed, "category": todo.category,
+                      "category_source": todo.category_source}
+            return self._call("upsert", todo=fields, read_at=read_at)
+        except Exception as e:
+            print(f"Error indexing todo {todo.id} via sidecar: {str(e)}")
+            return False
+
+    def delete_todo(self, todo_id: int) -> bool:
+        try:
+            return self._call("delete", todo_id=todo_id)
+        except Exception as e:
+            print(f"Error removing todo {todo_id} via sidecar: {str(e)}")
+            return False
+
+    def related_tasks(self, todo_id: int, k: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return self._call("related", todo_id=todo_id, k=k)
+        except Exception as e:
+            print(f"Error finding related tasks via sidecar: {str(e)}")
+            return []
+
+    def categorize_tasks(self, descriptions: List[str], completed: Optional[List[bool]] = None,
+                         min_margin: Optional[float] = None) -> List[Optional[str]]:
+        try:
+            return self._call("categorize", descriptions=descriptions, completed=completed, min_margin=min_margin)
+        except Exception as e:
+            print(f"Error categorizing tasks via sidecar: {str(e)}")
+            return [None for _ in descriptions]
+
+    def cluster_tasks(self, k: Optional[int] = None, examples: int = 3) -> Dict[str, Any]:
+        try:
+            return self._call("clusters", k=k, examples=examples)
+        except Exception as e:
+            print(f"Error clustering tasks via sidecar: {str(e)}")
+            return {"k": k, "status": "ready", "todos": 0, "clusters": []}
+
+    def build_context(self, db=None, user_context: str = "", query: str = "",
+                      token_budget: Optional[int] = None, search_mode: Optional[str] = None) -> Dict[str, Any]:
+        # The sidecar reads the table itself, so every worker shares one context cache
+        try:
+            return self._call("context", user_context=user_context, query=query, token_budget=token_budget,
+                              search_mode=search_mode)
+        except Exception as e:
+            print(f"Error creating context via sidecar: {str(e)}")
+            return {"context": "Error retrieving tasks from database.", "included": 0, "omitted": 0, "tokens": 0}
+
+    def create_context_from_todos(self, db=None, user_context: str = "", query: str = "",
+                                  token_budget: Optional[int] = None) -> str:
+        return self.build_context(db, user_context=user_context, query=query, token_budget=token_budget)["context"]
+
+    def start_warmup(self):
+        try:
+            self._call("warmup")
+        except Exception as e:
+            print(f"RAG sidecar not reachable at {self.socket_path}: {str(e)}")
+
+    def ensure_ready(self) -> bool:
+        try:
+            return self._call("ensure_ready")
+        except Exception as e:
+            print(f"RAG sidecar not reachable at {self.socket_path}: {str(e)}")
+            return False
+
+    def readiness(self) -> Dict[str, Any]:
+        try:
+            return self._call("readiness")
+        except Exception as e:
+            return {"state": "unavailable", "ready": False, "keyword_search_ready": False, "error": str(e)}
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            return {**self._call("stats"), "sidecar": self.socket_path}
+        except Exception as e:
+            return {"sidecar": self.socket_path, "error": str(e)}
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+class SidecarReindexJob:
+    """ReindexJob interface for workers; the job itself runs inside the sidecar."""
+
+    def __init__(self, client: RAGSidecarClient):
+        self.client = client
+
+    def start(self) -> bool:
+        return self.client._call("reindex_start")
+
+    def cancel(self) -> bool:
+        return self.client._call("reindex_cancel")
+
+    def progress(self) -> Dict[str, Any]:
+        return self.client._call("reindex_progress")
+
+    def shutdown(self):
+        # The job belongs to the sidecar and outlives any one worker
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve embeddings and vector search to API workers over a Unix socket")
+    parser.add_argument("--socket", default=database.RAG_SIDECAR_SOCKET or "/tmp/todo-rag.sock")
+    args = parser.parse_args()
+    serve(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import List, Dict, Any, Optional
+import numpy as np
+import database
+import models
+
+# Set in each pool worker by _init_worker
+_worker_embeddings = None
+
+def _init_worker(backend: str):
+    global _worker_embeddings
+    try:
+        import torch
+        # One process per core already; intra-op threads would only oversubscribe
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    from embedders import create_embedder
+    _worker_embeddings = create_embedder(backend)
+    _worker_embeddings.load()
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+class ReindexJob:
+    """
+    Background job that re-embeds every todo into a fresh index and swaps it in.
+
+    Rows are read from the table one chunk at a time; chunks whose texts are not in the
+    embedding cache are embedded across a process pool (one worker per core by
+    default) and upserted into a staging index as they finish. Searches keep using
+    the current index until the job completes, and a cancelled job leaves it as is.
+    """
+
+    def __init__(self, rag_service, session_factory=database.SessionLocal):
+        self.rag = rag_service
+        self.session_factory = session_factory
+        self.workers = database.REINDEX_WORKERS or os.cpu_count() or 1
+        if not rag_service.embedder.cacheable:
+            # Embedding is cheaper than shipping texts and vectors to another process
+            self.workers = 1
+        self.chunk_size = database.REINDEX_CHUNK_SIZE
+        self.state = "idle"
+        self.error: Optional[str] = None
+        self.total = 0
+        self.processed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        """
+        Start the job on a background thread.
+
+        Returns:
+            bool: False if a job is already running
+        """
+        with self._lock:
+            if self.state == "running":
+                return False
+            self.state = "running"
+            self.error = None
+            self.total = self.processed = 0
+            self.started_at, self.finished_at = time.time(), None
+            self._cancel.clear()
+            self._thread = threading.Thread(target=self._run, name="reindex", daemon=True)
+            self._thread.start()
+            return True
+
+    def cancel(self) -> bool:
+        if self.state != "running":
+            return False
+        self._cancel.set()
+        return True
+
+    def wait(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def shutdown(self):
+        self.cancel()
+        self.wait(timeout=10)
+
+    def progress(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.processed, 0)
+        return {
+            "state": self.state,
+            "processed": self.processed,
+            "total": self.total,
+            "docs_per_sec": round(rate, 1),
+            "eta_seconds": round(remaining / rate, 1) if self.state == "running" and rate > 0 else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "workers": self.workers,
+            "error": self.error,
+        }
+
+    def _run(self):
+        staging = None
+        db = self.session_factory()
+        pool = None
+        try:
+            if not self.rag.ensure_ready():
+                raise RuntimeError(self.rag.error or "embedding model unavailable")
+            staging = self.rag.index.snapshot().base.staging()
+            self.rag.begin_reindex()
+            self.total = db.query(models.TodoDB).count()
+            if self.workers > 1:
+                # spawn, not fork: the server process has threads (and maybe torch) running
+                pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(database.EMBEDDING_BACKEND,),
+                )
+            payloads = self._embed_all(db, staging, pool)
+            if self._cancel.is_set():
+                self._abort(staging, "cancelled")
+                return
+            self.rag.finish_reindex(staging, payloads)
+            self.state = "completed"
+        except Exception as e:
+            print(f"Reindex job failed: {str(e)}")
+            self.error = str(e)
+            self._abort(staging, "failed")
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+            db.close()
+            self.finished_at = time.time()
+
+    def _abort(self, staging, state: str):
+        self.rag.abort_reindex()
+        if staging is not None:
+            staging.retire()
+        self.state = state
+
+    def _embed_all(self, db, staging, pool) -> Dict[int, Dict[str, Any]]:
+        payloads: Dict[int, Dict[str, Any]] = {}
+        # Submitted chunks, oldest first; two per worker keeps every core busy
+        in_flight = deque()
+
+        def finish_oldest():
+            ids, chunk_payloads, vectors = in_flight.popleft()
+            if not isinstance(vectors, list):
+                vectors = self._merge(chunk_payloads, vectors)
+            staging.upsert(ids, vectors, chunk_payloads)
+            payloads.update(zip(ids, chunk_payloads))
+            self.processed += len(ids)
+
+        # Rows are read in id order one chunk at a time, ending the read transaction in
+        # between: an open cursor would lock CRUD writes out of SQLite for the whole job.
+        # Rows written meanwhile are caught up by finish_reindex
+        last_id = 0
+        while not self._cancel.is_set():
+            todos = (db.query(models.TodoDB).filter(models.TodoDB.id > last_id)
+                     .order_by(models.TodoDB.id).limit(self.chunk_size).all())
+            chunk = [self.rag.point_payload(todo) for todo in todos]
+            db.rollback()
+            if not chunk:
+                break
+            last_id = chunk[-1]["id"]
+            in_flight.append(self._submit(chunk, pool))
+            while len(in_flight) > 2 * self.workers:
+                finish_oldest()
+        while in_flight and not self._cancel.is_set():
+            finish_oldest()
+        return payloads
+
+    def _submit(self, chunk_payloads: List[Dict[str, Any]], pool):
+        """Look the chunk up in the embedding cache and send only the misses to the pool."""
+        ids = [payload["id"] for payload in chunk_payloads]
+        texts = [payload["content"] for payload in chunk_payloads]
+        cache = self.rag.embedding_cache
+        cached = cache.get_many(texts) if cache else [None] * len(texts)
+        missing = [text for text, vector in zip(texts, cached) if vector is None]
+        if not missing:
+            return ids, chunk_payloads, cached
+        if pool is None:
+            future = _InlineResult(self.rag.embeddings.embed_documents(missing))
+        else:
+            future = pool.submit(_embed_batch, missing)
+        return ids, chunk_payloads, (cached, missing, future)
+
+    def _merge(self, chunk_payloads, pending) -> List[List[float]]:
+        cached, missing, future = pending
+        embedded = np.asarray(future.result(), dtype=np.float32)
+        if self.rag.embedding_cache:
+            self.rag.embedding_cache.put_many(missing, embedded)
+        fresh = iter(embedded)
+        return [vector if vector is not None else next(fresh) for vector in cached]
+
+class _InlineResult:
+    """Future-like wrapper for chunks embedded in-process (REINDEX_WORKERS=1)."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
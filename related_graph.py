@@ -0,0 +1,162 @@
+import threading
+from typing import List, Dict, Tuple, Set, Callable, Sequence, Optional
+
+# (todo id, cosine similarity)
+Neighbour = Tuple[int, float]
+
+class RelatedGraph:
+    """
+    k-nearest-neighbour adjacency over todo embeddings, for "related tasks" lookups.
+
+    Neighbour lists are computed with the vector index (search_batch) and then kept
+    current incrementally: a changed todo gets a fresh list and is offered to the
+    lists of the nodes around it. Lists that named its old version, or a deleted
+    todo, are not recomputed in the write: the deleted entry is dropped and the
+    list is marked stale, and repair() recomputes stale lists in batches later
+    (one search batch per call). Lookups are a dict read of an immutable tuple,
+    with no lock.
+
+    A todo enters another todo's list only if it is among its own widen * k
+    nearest neighbours, so very lopsided (hub) neighbourhoods can miss a link
+    until the next full build.
+
+    Searches run outside the lock, so a todo can be removed between a search and
+    the write of its results; is_live is checked under the lock to keep removed
+    todos out of the graph.
+    """
+
+    def __init__(self, search_batch: Callable[[Sequence[Sequence[float]], int], List[List[tuple]]],
+                 k: int = 10, widen: int = 4, is_live: Optional[Callable[[int], bool]] = None):
+        self.search_batch = search_batch
+        self.k = k
+        self.widen = widen
+        self.is_live = is_live or (lambda todo_id: True)
+        self._lists: Dict[int, Tuple[Neighbour, ...]] = {}
+        self._reverse: Dict[int, Set[int]] = {}  # todo id -> ids whose lists contain it
+        # Ids whose lists may be missing a neighbour or score an old vector, awaiting repair()
+        self._stale: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def related(self, todo_id: int) -> Optional[Tuple[Neighbour, ...]]:
+        return self._lists.get(todo_id)
+
+    def is_stale(self, todo_id: int) -> bool:
+        return todo_id in self._stale
+
+    def stale_count(self) -> int:
+        return len(self._stale)
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+    def _set_list(self, todo_id: int, neighbours: Sequence[Neighbour]):
+        old = self._lists.get(todo_id, ())
+        for other, _ in old:
+            linked = self._reverse.get(other)
+            if linked is not None:
+                linked.discard(todo_id)
+        for other, _ in neighbours:
+            self._reverse.setdefault(other, set()).add(todo_id)
+        self._lists[todo_id] = tuple(neighbours)
+
+    def _search(self, ids: Sequence[int], vectors: Sequence[Sequence[float]], k: int) -> List[List[Neighbour]]:
+        results = self.search_batch(vectors, k + 1)
+        return [[(hit[0], float(hit[1])) for hit in hits if hit[0] != todo_id][:k]
+                for todo_id, hits in zip(ids, results)]
+
+    def _live(self, neighbours: List[Neighbour]) -> List[Neighbour]:
+        # Called under the lock: drops todos removed since the search ran
+        return [n for n in neighbours if self.is_live(n[0])]
+
+    def build(self, ids: Sequence[int], vectors: Sequence[Sequence[float]]):
+        """Compute the lists of the given todos from scratch (one search batch)."""
+        neighbour_lists = self._search(ids, vectors, self.k)
+        with self._lock:
+            for todo_id, neighbours in zip(ids, neighbour_lists):
+                if not self.is_live(todo_id):
+                    continue
+                live = self._live(neighbours)
+                self._set_list(todo_id, live)
+                if len(live) < len(neighbours):
+                    self._stale.add(todo_id)
+                else:
+                    self._stale.discard(todo_id)
+
+    def update(self, ids: Sequence[int], vectors: Sequence[Sequence[float]]):
+        """
+        Refresh the graph after the given todos were (re-)indexed.
+
+        Args:
+            ids (list): Todo ids that changed, already upserted into the index
+            vectors (list): Their new embeddings
+        """
+        if not self._lists:
+            return
+        wide = self._search(ids, vectors, self.k * self.widen)
+        with self._lock:
+            stale = set()
+            for todo_id, candidates in zip(ids, wide):
+                if not self.is_live(todo_id):
+                    continue
+                # Lists built around the old vector are no longer right
+                stale.update(self._reverse.get(todo_id, ()))
+                candidates = self._live(candidates)
+                self._set_list(todo_id, candidates[:self.k])
+                for other, score in candidates:
+                    neighbours = self._lists.get(other)
+                    if neighbours is None or other in stale:
+                        continue
+                    if len(neighbours) < self.k or score > neighbours[-1][1]:
+                        merged = [n for n in neighbours if n[0] != todo_id] + [(todo_id, score)]
+                        merged.sort(key=lambda n: n[1], reverse=True)
+                        self._set_list(other, merged[:self.k])
+            stale.difference_update(ids)
+            self._stale.difference_update(ids)
+            self._stale.update(todo_id for todo_id in stale if todo_id in self._lists)
+
+    def remove(self, ids: Sequence[int]):
+        """Drop the given todos; lists that pointed at them lose the entry and are marked stale."""
+        removed = set(ids)
+        with self._lock:
+            for todo_id in removed:
+                linked = self._reverse.pop(todo_id, set())
+                if todo_id in self._lists:
+                    self._set_list(todo_id, ())
+                    del self._lists[todo_id]
+                self._stale.discard(todo_id)
+                for other in linked - removed:
+                    neighbours = self._lists.get(other)
+                    if neighbours is not None:
+                        self._set_list(other, [n for n in neighbours if n[0] not in removed])
+                        self._stale.add(other)
+
+    def repair(self, vector_lookup: Callable[[List[int]], Dict[int, Sequence[float]]],
+               limit: int = 256, ids: Optional[Sequence[int]] = None) -> int:
+        """
+        Recompute up to limit stale lists (or the given ones, if stale) with one search batch.
+
+        Args:
+            vector_lookup (callable): Todo ids -> {id: embedding}; ids it leaves out are dropped
+            limit (int): Most lists recomputed by this call
+            ids (list): Only repair these ids, e.g. the one being looked up
+
+        Returns:
+            int: Number of stale lists taken off the queue
+        """
+        with self._lock:
+            if ids is None:
+                batch = [todo_id for _, todo_id in zip(range(limit), self._stale)]
+            else:
+                batch = [todo_id for todo_id in ids if todo_id in self._stale][:limit]
+            self._stale.difference_update(batch)
+        if batch:
+            vectors = vector_lookup(batch)
+            if vectors:
+                self.build(list(vectors), list(vectors.values()))
+        return len(batch)
+
+    def clear(self):
+        with self._lock:
+            self._lists.clear()
+            self._reverse.clear()
+            self._stale.clear()
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Settings are read when the modules are imported, so the test environment goes in first:
+# no model download, no Qdrant, a throwaway database and no on-disk caches
+_directory = tempfile.mkdtemp(prefix="todo-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_directory, 'todos.db')}")
+os.environ.setdefault("EMBEDDING_BACKEND", "hashing")
+os.environ.setdefault("VECTOR_BACKEND", "numpy")
+os.environ.setdefault("VECTOR_STORE_PATH", "")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("RAG_WARMUP", "false")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # A fresh SQLite database per test, shareable between threads like the app's
+    engine = create_engine(f"sqlite:///{tmp_path / 'todos.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
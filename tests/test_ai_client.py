@@ -0,0 +1,45 @@
+import asyncio
+import ai_interface
+from benchmark_ai_client import GenerationHandler, start_server
+
+class CountingHandler(GenerationHandler):
+    connections = 0
+
+    def setup(self):
+        # One handler per accepted TCP connection; keep-alive requests reuse it
+        type(self).connections += 1
+        super().setup()
+
+def test_one_pool_is_reused_and_closing_it_is_safe(tmp_path, monkeypatch):
+    server, url, _ = start_server(str(tmp_path), 0.0, tls=False, handler=CountingHandler)
+    monkeypatch.setenv("HUGGINGFACEHUB_API_TOKEN", "test")
+    # The model name doubles as the endpoint URL for the text-generation API
+    monkeypatch.setenv("HF_MODEL_NAME", url)
+    try:
+        async def run():
+            model = ai_interface.get_ai_model()
+            assert ai_interface.get_ai_model() is model
+            for _ in range(5):
+                assert await model.generate_response_async("Hi") == GenerationHandler.reply
+            async_connections = CountingHandler.connections
+            for _ in range(5):
+                assert model.generate_response("Hi") == GenerationHandler.reply
+            streamed = [event["token"] async for event in model.stream_response("Hi")]
+            assert "".join(streamed) == GenerationHandler.reply
+
+            await ai_interface.close_ai_model()
+            # A second shutdown, or one without a model, does nothing
+            await ai_interface.close_ai_model()
+            await model.aclose()
+            return async_connections
+
+        async_connections = asyncio.run(run())
+        # Five async calls over one connection, five sync calls over one more, and the stream its own
+        assert async_connections == 1
+        assert CountingHandler.connections == 3
+
+        # A model created after shutdown gets a working pool again
+        assert ai_interface.get_ai_model().generate_response("Hi") == GenerationHandler.reply
+        asyncio.run(ai_interface.close_ai_model())
+    finally:
+        server.shutdown()
@@ -0,0 +1,108 @@
+import pytest
+import crud
+import rag
+import models
+from categorize_worker import CategorizeWorker
+
+def test_pending_flag_not_the_label_marks_todos_to_categorize(session_factory):
+    with session_factory() as db:
+        pending = crud.create_todo(db, models.TodoCreate(description="Call the client"))
+        chosen = models.TodoDB(description="Sort the attic", category=models.PENDING_CATEGORY,
+                               category_source=models.CATEGORY_SOURCE_USER)
+        db.add(chosen)
+        db.commit()
+        pending_id, chosen_id = pending.id, chosen.id
+    assert models.TodoResponse.model_validate(pending).category_pending
+
+    indexed = []
+    worker = CategorizeWorker(lambda descriptions, completed: ["Work"] * len(descriptions),
+                              index=lambda rows, read_at: indexed.append([row.id for row in rows]),
+                              session_factory=session_factory, linger=0)
+    worker.start()
+    assert worker.wait_idle(timeout=10)
+    worker.enqueue([chosen_id])
+    assert worker.wait_idle(timeout=10)
+    worker.shutdown()
+
+    with session_factory() as db:
+        assert db.get(models.TodoDB, pending_id).category == "Work"
+        assert not db.get(models.TodoDB, pending_id).category_pending
+        # A user's "Uncategorized" is a label like any other and is left alone
+        assert db.get(models.TodoDB, chosen_id).category == models.PENDING_CATEGORY
+    # Indexed when its batch starts, and again once the category is written
+    assert indexed == [[pending_id], [pending_id]]
+
+def test_failed_batch_is_retried_with_backoff(session_factory):
+    with session_factory() as db:
+        todo_id = crud.create_todo(db, models.TodoCreate(description="Pay the invoice")).id
+    calls = []
+
+    def flaky(descriptions, completed):
+        calls.append(descriptions)
+        if len(calls) < 3:
+            raise RuntimeError("model unavailable")
+        return ["Urgent"]
+
+    worker = CategorizeWorker(flaky, session_factory=session_factory, linger=0, retry_delay=0.01, max_retries=3)
+    worker.start()
+    assert worker.wait_idle(timeout=10)
+    worker.shutdown()
+    assert len(calls) == 3
+    assert worker.stats()["errors"] == 2 and worker.stats()["abandoned"] == 0
+    with session_factory() as db:
+        assert db.get(models.TodoDB, todo_id).category == "Urgent"
+
+def test_batch_is_left_pending_after_its_last_retry(session_factory):
+    with session_factory() as db:
+        todo_id = crud.create_todo(db, models.TodoCreate(description="Pay the invoice")).id
+
+    def down(descriptions, completed):
+        raise RuntimeError("model unavailable")
+
+    worker = CategorizeWorker(down, session_factory=session_factory, linger=0, retry_delay=0.01, max_retries=2)
+    worker.start()
+    assert worker.wait_idle(timeout=10)
+    worker.shutdown()
+    assert worker.stats()["errors"] == 3 and worker.stats()["abandoned"] == 1
+    with session_factory() as db:
+        assert db.get(models.TodoDB, todo_id).category_pending
+
+def run_batch_with_delete(session_factory, service, todo_id, delete_while_embedding):
+    def delete():
+        with session_factory() as db:
+            db.delete(db.get(models.TodoDB, todo_id))
+            db.commit()
+        service.delete_todo(todo_id)
+
+    def index(rows, read_at):
+        if delete_while_embedding:
+            embed_documents = service.embeddings.embed_documents
+            service.embeddings.embed_documents = lambda texts: delete() or embed_documents(texts)
+        else:
+            # The DELETE commits after the worker read the row but before it is indexed
+            delete()
+        for row in rows:
+            service.upsert_todo(row, read_at=read_at)
+
+    worker = CategorizeWorker(lambda descriptions, completed: ["Work"] * len(descriptions), index=index,
+                              session_factory=session_factory, linger=0)
+    worker.start()
+    assert worker.wait_idle(timeout=10)
+    worker.shutdown()
+
+@pytest.mark.parametrize("delete_while_embedding", [False, True])
+def test_todo_deleted_during_a_batch_is_not_indexed_again(session_factory, delete_while_embedding):
+    service = rag.RAGService(session_factory=session_factory)
+    assert service.ensure_ready()
+    with session_factory() as db:
+        todo_id = crud.create_todo(db, models.TodoCreate(description="Renew the passport")).id
+
+    run_batch_with_delete(session_factory, service, todo_id, delete_while_embedding)
+
+    for mode in ("lexical", "vector", "hybrid"):
+        assert todo_id not in [task["id"] for task in service.search_similar_tasks("passport", k=5, mode=mode)]
+    assert service.related_tasks(todo_id) is None
+    service.close()
+    # A new todo may reuse the id; it is indexed as usual
+    with session_factory() as db:
+        assert crud.create_todo(db, models.TodoCreate(description="Book the train")).id == todo_id
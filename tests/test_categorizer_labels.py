@@ -0,0 +1,86 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+import models
+import rag
+
+def test_categorizer_trains_only_on_user_labels(session_factory):
+    with session_factory() as db:
+        db.add_all([
+            models.TodoDB(description="Prepare the client slides", category="Work",
+                          category_source=models.CATEGORY_SOURCE_USER),
+            models.TodoDB(description="Book a dentist visit", category="Personal",
+                          category_source=models.CATEGORY_SOURCE_USER),
+            models.TodoDB(description="Email the quarterly report", category="Work",
+                          category_source=models.CATEGORY_SOURCE_MODEL),
+            models.TodoDB(description="Water the plants", category="Urgent"),
+        ])
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    assert service.ensure_ready()
+    assert service.categorizer.stats() == {"Work": 1, "Personal": 1}
+
+    with session_factory() as db:
+        # The model labels a new todo: nothing is learned from it
+        guessed = models.TodoDB(description="Call the client back", category="Work",
+                                category_source=models.CATEGORY_SOURCE_MODEL)
+        db.add(guessed)
+        db.commit()
+        service.upsert_todo(guessed)
+        assert service.categorizer.stats() == {"Work": 1, "Personal": 1}
+
+        # The user confirms it, then moves another model label to a new category
+        guessed.category_source = models.CATEGORY_SOURCE_USER
+        service.upsert_todo(guessed)
+        report = db.query(models.TodoDB).filter_by(description="Email the quarterly report").one()
+        report.category, report.category_source = "Personal", models.CATEGORY_SOURCE_USER
+        service.upsert_todo(report)
+        assert service.categorizer.stats() == {"Work": 2, "Personal": 2}
+
+        service.delete_todo(guessed.id)
+        assert service.categorizer.stats() == {"Work": 1, "Personal": 2}
+    service.close()
+
+def test_add_missing_columns_upgrades_an_older_table(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE todos (id INTEGER PRIMARY KEY, description VARCHAR, completed BOOLEAN, category VARCHAR)"
+        ))
+        connection.execute(text("INSERT INTO todos (description, completed, category) VALUES ('Old task', 0, 'Work')"))
+    models.add_missing_columns(engine)
+    models.add_missing_columns(engine)
+    assert "category_source" in {column["name"] for column in inspect(engine).get_columns("todos")}
+    with sessionmaker(bind=engine)() as db:
+        assert db.query(models.TodoDB).one().category_source is None
+
+def test_forgetting_a_label_reads_the_stored_vector_instead_of_embedding(session_factory):
+    with session_factory() as db:
+        db.add_all([
+            models.TodoDB(description="Prepare the client slides", category="Work",
+                          category_source=models.CATEGORY_SOURCE_USER),
+            models.TodoDB(description="Book a dentist visit", category="Personal",
+                          category_source=models.CATEGORY_SOURCE_USER),
+            models.TodoDB(description="Email the quarterly report", category="Work",
+                          category_source=models.CATEGORY_SOURCE_MODEL),
+        ])
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    assert service.ensure_ready()
+    embedded = []
+    embed_documents = service.embeddings.embed_documents
+    service.embeddings.embed_documents = lambda texts: embedded.extend(texts) or embed_documents(texts)
+
+    with session_factory() as db:
+        slides, dentist, report = db.query(models.TodoDB).order_by(models.TodoDB.id).all()
+        # Edited text: only the new text is embedded, the old one's vector comes from the index
+        slides.description = "Prepare the board slides"
+        service.upsert_todo(slides)
+        assert embedded == ["Task: Prepare the board slides (Status: Pending)"]
+        assert service.categorizer.stats() == {"Work": 1, "Personal": 1}
+
+        embedded.clear()
+        service.delete_todo(dentist.id)
+        service.delete_todo(report.id)
+        assert embedded == []
+        assert service.categorizer.stats() == {"Work": 1}
+    service.close()
@@ -0,0 +1,90 @@
+import io
+import json
+import socket
+from fastapi.testclient import TestClient
+import ai_interface
+import database
+import main
+import models
+import rag
+from benchmark_ai_client import GenerationHandler, start_server
+
+class DroppingHandler(GenerationHandler):
+    """Streams the first two tokens of the reply, then the connection drops."""
+
+    def stream_tokens(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(self.reply.split(" ")[:2]):
+            token = {"id": i, "text": word if i == 0 else f" {word}", "logprob": 0.0, "special": False}
+            self.write_chunk(f"data: {json.dumps({'index': i, 'token': token})}\n\n".encode())
+        self.wfile.flush()
+        self.connection.shutdown(socket.SHUT_RDWR)
+        self.close_connection = True
+
+class RecordingHandler(GenerationHandler):
+    inputs = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        type(self).inputs.append(json.loads(body)["inputs"])
+        # Hand the body back to the parent handler, which reads it again
+        self.rfile = io.BytesIO(body)
+        super().do_POST()
+
+class FailingHandler(GenerationHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+def stream_chat(session_factory, monkeypatch, tmp_path, primary, fallback):
+    servers = [start_server(str(tmp_path), 0.0, tls=False, handler=handler) for handler in (primary, fallback)]
+    monkeypatch.setenv("HUGGINGFACEHUB_API_TOKEN", "test")
+    # The model name doubles as the endpoint URL for the text-generation API
+    monkeypatch.setenv("HF_MODEL_NAME", servers[0][1])
+    monkeypatch.setattr(ai_interface, "FALLBACK_MODEL", servers[1][1])
+    monkeypatch.setattr(ai_interface, "_ai_model", None)
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    with session_factory() as db:
+        db.add(models.TodoDB(description="Finish the report", category="Work"))
+        database.bump_write_version(db)
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    monkeypatch.setattr(main, "rag_service", service)
+    try:
+        response = TestClient(main.app).post("/api/chat/stream", params={"query": "What first?", "search_mode": "lexical"})
+    finally:
+        for server, _, _ in servers:
+            server.shutdown()
+        service.close()
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_fallback_continues_the_answer_after_the_stream_breaks(session_factory, monkeypatch, tmp_path):
+    events = stream_chat(session_factory, monkeypatch, tmp_path, DroppingHandler, RecordingHandler)
+    kinds = [kind for kind, _ in events]
+    assert kinds[:3] == ["token", "token", "fallback"]
+    assert kinds[3:-1] == ["token"] * len(GenerationHandler.reply.split(" ")) and kinds[-1] == "done"
+    # The first tokens are not repeated: the fallback model carries on after them
+    assert "".join(data["token"] for kind, data in events[:2]) == "Finish the"
+    assert events[2][1] == {"fallback": ai_interface.FALLBACK_MODEL}
+    assert len(RecordingHandler.inputs) == 1 and RecordingHandler.inputs[0].endswith("Assistant:Finish the")
+    assert events[-1][1] == {"tasks_included": 1, "tasks_omitted": 0}
+
+def test_stream_ends_with_an_error_and_no_done_when_both_models_fail(session_factory, monkeypatch, tmp_path):
+    events = stream_chat(session_factory, monkeypatch, tmp_path, FailingHandler, FailingHandler)
+    assert [kind for kind, _ in events] == ["fallback", "error"]
+    assert events[-1][1] == {"error": "AI is thinking... please try again later."}
+
+def test_stream_without_a_fallback_is_tokens_then_done(session_factory, monkeypatch, tmp_path):
+    events = stream_chat(session_factory, monkeypatch, tmp_path, GenerationHandler, FailingHandler)
+    assert [kind for kind, _ in events] == ["token"] * len(GenerationHandler.reply.split(" ")) + ["done"]
+    assert "".join(data["token"] for _, data in events[:-1]) == GenerationHandler.reply
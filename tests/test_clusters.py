@@ -0,0 +1,27 @@
+import time
+import models
+import rag
+
+def test_clusters_are_fitted_in_the_background_from_indexed_vectors(session_factory):
+    topics = ["meeting report client slides", "groceries laundry dinner gym", "bug deploy review merge"]
+    with session_factory() as db:
+        db.add_all(models.TodoDB(description=f"{topics[i % 3]} {i}") for i in range(300))
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    assert service.ensure_ready()
+
+    embedded = []
+    embed_documents = service.embeddings.embed_documents
+    service.embeddings.embed_documents = lambda texts: embedded.extend(texts) or embed_documents(texts)
+
+    result = service.cluster_tasks(k=3)
+    assert result["status"] == "building" and result["clusters"] == []
+    deadline = time.time() + 30
+    while result["status"] == "building" and time.time() < deadline:
+        time.sleep(0.01)
+        result = service.cluster_tasks(k=3)
+    assert result["status"] == "ready"
+    assert sorted(cluster["size"] for cluster in result["clusters"]) == [100, 100, 100]
+    # The fit read the vectors back from the index instead of embedding the corpus again
+    assert embedded == []
+    service.close()
@@ -0,0 +1,71 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import database
+import models
+import rag
+
+def test_write_from_another_process_retires_cached_context(session_factory):
+    service = rag.RAGService(session_factory=session_factory)
+    with session_factory() as db:
+        db.add(models.TodoDB(description="Water the plants", category="Personal"))
+        database.bump_write_version(db)
+        db.commit()
+        assert "Water the plants" in service.build_context(db)["context"]
+
+    # Another worker process: its own engine, and the write bumps the shared version in its transaction
+    other = sessionmaker(bind=create_engine(session_factory.kw["bind"].url, connect_args={"check_same_thread": False}))
+    with other() as db:
+        db.add(models.TodoDB(description="Renew the passport", category="Personal"))
+        database.bump_write_version(db)
+        db.commit()
+
+    with session_factory() as db:
+        assert "Renew the passport" in service.build_context(db)["context"]
+
+def test_lexical_context_search_does_not_load_the_model(session_factory):
+    service = rag.RAGService(session_factory=session_factory)
+    with session_factory() as db:
+        db.add_all(models.TodoDB(description=description) for description in ("Renew the passport", "Water the plants"))
+        database.bump_write_version(db)
+        db.commit()
+        modes = []
+        search = service.search_similar_tasks
+        service.search_similar_tasks = lambda query, k=3, mode=None, **kwargs: modes.append(mode) or search(
+            query, k=k, mode=mode, **kwargs)
+
+        context = service.build_context(db, query="passport", search_mode="lexical")
+        # Ranked first by the keyword match although it is the older todo
+        assert context["context"].splitlines()[1].endswith("Renew the passport [pending]")
+        assert service.state == "cold" and service.embeddings is None
+        # Cached per mode: the same query in another mode is rendered again
+        service.build_context(db, query="passport", search_mode="lexical")
+        service.build_context(db, query="passport", search_mode="hybrid")
+        assert modes == ["lexical", "hybrid"]
+    service.close()
+
+def test_context_keeps_the_best_tasks_that_fit_and_counts_the_rest(session_factory):
+    service = rag.RAGService(session_factory=session_factory)
+    with session_factory() as db:
+        assert service.build_context(db) == {"context": "The todo list is currently empty.", "included": 0,
+                                             "omitted": 0, "tokens": rag.estimate_tokens("The todo list is currently empty.")}
+        db.add(models.TodoDB(description="Renew the passport", completed=True))
+        db.add_all(models.TodoDB(description=f"Routine chore number {i}", completed=i % 2 == 0) for i in range(199))
+        database.bump_write_version(db)
+        db.commit()
+
+        context = service.build_context(db, query="passport", search_mode="lexical", token_budget=200)
+        lines = context["context"].splitlines()
+        tasks = [line for line in lines if line.startswith("- ID ")]
+        assert context["included"] == len(tasks) and context["included"] + context["omitted"] == 200
+        assert context["omitted"] > 150 and lines[-1] == f"({context['omitted']} more tasks not shown)"
+        assert context["tokens"] <= 200
+        # The query match comes first although it is the oldest task and done; then newer pending ones
+        assert tasks[0] == "- ID 1: Renew the passport [completed]"
+        assert all(line.endswith("[pending]") for line in tasks[1:])
+        ids = [int(line.split()[2].rstrip(":")) for line in tasks[1:]]
+        assert ids == sorted(ids, reverse=True) and ids[0] == 199
+
+        everything = service.build_context(db, token_budget=100000)
+        assert everything["included"] == 200 and everything["omitted"] == 0
+        assert "more tasks not shown" not in everything["context"]
+    service.close()
@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from embedders import HashingEmbedder, create_embedder
+
+TEXTS = ["Renew the passport", "Water the plants", "Fix ABC-123 before the release", "Café au lait ☕"]
+
+def test_same_text_gets_the_same_vector_in_any_batch():
+    embedder = create_embedder("hashing")
+    assert isinstance(embedder, HashingEmbedder) and not embedder.cacheable
+    alone = np.array([embedder.embed_query(text) for text in TEXTS])
+    batched = embedder.embed_matrix(TEXTS)
+    reordered = embedder.embed_matrix(TEXTS[::-1] + ["Another task"])[:len(TEXTS)][::-1]
+    assert np.array_equal(alone.astype(np.float32), batched)
+    assert np.array_equal(batched, reordered)
+    assert batched.shape == (4, 384) and batched.dtype == np.float32
+    assert np.allclose(np.linalg.norm(batched, axis=1), 1.0, atol=1e-6)
+    # Case does not matter; an embedding of nothing is all zeros rather than NaN
+    assert np.array_equal(embedder.embed_matrix(["RENEW THE PASSPORT"])[0], batched[0])
+    assert not np.any(embedder.embed_matrix([""])) and embedder.embed_matrix([]).shape == (0, 384)
+
+def test_vectors_do_not_depend_on_the_process_hash_seed():
+    # Python's str hash is salted per process; stored vectors must survive a restart
+    script = ("import json, sys; sys.path.insert(0, sys.argv[1]); from embedders import HashingEmbedder; "
+              f"print(json.dumps(HashingEmbedder().embed_documents({TEXTS!r})))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    outputs = []
+    for seed in ("1", "2"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        result = subprocess.run([sys.executable, "-c", script, root], env=env, capture_output=True, text=True, check=True)
+        outputs.append(np.array(json.loads(result.stdout), dtype=np.float32))
+    assert np.array_equal(outputs[0], outputs[1])
+    assert np.array_equal(outputs[0], HashingEmbedder().embed_matrix(TEXTS))
+
+def test_shared_words_and_spellings_score_closer():
+    embedder = HashingEmbedder()
+    passport, renewal, plants = embedder.embed_matrix(["Renew the passport", "Passport renewal", "Water the plants"])
+    assert passport @ renewal > passport @ plants
+    # The settings are part of the name, so differently built vectors are never mixed
+    assert HashingEmbedder(dim=128).name != embedder.name
+    assert HashingEmbedder(dim=128).embed_matrix(["x y z"]).shape == (1, 128)
+    with pytest.raises(ValueError):
+        create_embedder("word2vec")
@@ -0,0 +1,112 @@
+import threading
+import os
+import numpy as np
+import hnsw_index
+from hnsw_index import HNSWVectorIndex
+from index_snapshot import SnapshotIndex
+
+def random_vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+def payload(point_id):
+    return {"id": point_id, "completed": False, "category": "Work"}
+
+def test_staging_index_saves_to_the_live_file_only_after_the_swap(tmp_path):
+    path = str(tmp_path / "hnsw_index.pkl")
+    live = HNSWVectorIndex(dim=8, M=4, ef_construction=20, path=path, save_every=10)
+    live.upsert(range(20), random_vectors(20), [payload(i) for i in range(20)])
+    saved = os.path.getmtime(path), os.path.getsize(path)
+
+    staging = live.staging()
+    # Enough writes for several periodic saves; none of them may reach the live file
+    staging.upsert(range(100, 150), random_vectors(50, seed=1), [payload(i) for i in range(100, 150)])
+    assert (os.path.getmtime(path), os.path.getsize(path)) == saved
+    assert len(HNSWVectorIndex(dim=8, M=4, path=path)) == 20
+
+    snapshot = SnapshotIndex(live, dim=8)
+    snapshot.replace_base(staging)
+    assert staging.path == path and live.path == ""
+    # The next write saves the new graph; the replaced one no longer writes
+    staging.upsert([150], random_vectors(1, seed=2), [payload(150)])
+    live.upsert([999], random_vectors(1, seed=3), [payload(999)])
+    assert sorted(HNSWVectorIndex(dim=8, M=4, path=path).stored_payloads()) == list(range(100, 151))
+
+def test_rebuild_runs_outside_the_lock_and_keeps_writes_made_meanwhile(monkeypatch):
+    index = HNSWVectorIndex(dim=8, M=4, ef_construction=20)
+    vectors = random_vectors(3000)
+    index.upsert(range(3000), vectors, [payload(i) for i in range(3000)])
+    index.delete(range(1500))
+    started, release = threading.Event(), threading.Event()
+    insert = HNSWVectorIndex._insert
+
+    def slow_insert(self, point_id, vector):
+        if self is not index and not started.is_set():
+            # The first insert into the new graph: hold the rebuild here
+            started.set()
+            assert release.wait(10)
+        return insert(self, point_id, vector)
+    monkeypatch.setattr(HNSWVectorIndex, "_insert", slow_insert)
+
+    # The next delete tips the dead nodes over the threshold and starts the rebuild
+    rebuild = threading.Thread(target=index.delete, args=([1500],))
+    rebuild.start()
+    assert started.wait(10)
+    # Searches and writes are served by the old graph in the meantime
+    assert index.search(vectors[2000], 1)[0][0] == 2000
+    index.upsert([5000, 2001], random_vectors(2, seed=4), [payload(5000), payload(2001)])
+    index.delete([2002])
+    release.set()
+    rebuild.join(10)
+
+    assert len(index._node_ids) < 1600
+    assert index.search(random_vectors(2, seed=4)[0], 1)[0][0] == 5000
+    assert index.search(random_vectors(2, seed=4)[1], 1)[0][0] == 2001
+    assert all(hit[0] not in (1500, 2002) for hit in index.search(vectors[2002], 50))
+    assert len(index) == 3000 - 1501 + 1 - 1
+
+def test_save_serializes_outside_the_lock(tmp_path, monkeypatch):
+    index = HNSWVectorIndex(dim=8, M=4, ef_construction=20)
+    index.upsert(range(50), random_vectors(50), [payload(i) for i in range(50)])
+    dumps = hnsw_index.pickle.dumps
+    free = []
+
+    def checked_dumps(state, **kwargs):
+        # Another thread can take the lock while the graph is being pickled
+        probe = threading.Thread(target=lambda: free.append(index._lock.acquire(timeout=1) and index._lock.release() is None))
+        probe.start()
+        probe.join()
+        return dumps(state, **kwargs)
+    monkeypatch.setattr(hnsw_index.pickle, "dumps", checked_dumps)
+    index.save(str(tmp_path / "hnsw_index.pkl"))
+    assert free == [True]
+    assert len(HNSWVectorIndex(dim=8, M=4, path=str(tmp_path / "hnsw_index.pkl"))) == 50
+
+def test_filtered_search_returns_k_matching_hits_on_both_paths():
+    vectors = random_vectors(2000, dim=16)
+    payloads = [{"id": i, "completed": i % 4 == 0, "category": ("Work", "Personal")[i % 2]} for i in range(2000)]
+    index = HNSWVectorIndex(dim=16, M=8, ef_construction=64, ef_search=32)
+    index.upsert(range(2000), vectors, payloads)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    query = random_vectors(1, dim=16, seed=5)[0]
+    scores = normalized @ (query / np.linalg.norm(query))
+
+    def exact(keep, k):
+        return sorted((i for i in range(2000) if keep(payloads[i])), key=lambda i: -scores[i])[:k]
+
+    # 500 matches: scored exactly
+    hits = index.search(query, 10, filter={"completed": True})
+    assert [hit[0] for hit in hits] == exact(lambda p: p["completed"], 10)
+
+    # 1000 matches over the limit: searched through the graph, skipping the other half
+    index.EXACT_FILTER_LIMIT = 100
+    hits = index.search(query, 10, filter={"category": "Personal"})
+    assert len(hits) == 10 and all(hit[2]["category"] == "Personal" for hit in hits)
+    assert len({hit[0] for hit in hits} & set(exact(lambda p: p["category"] == "Personal", 10))) >= 8
+
+    # A narrow filter still fills k from the graph by widening the beam
+    index.upsert([1, 3, 5], vectors[[1, 3, 5]], [dict(payloads[i], category="Urgent") for i in (1, 3, 5)])
+    index.EXACT_FILTER_LIMIT = 0
+    hits = index.search(query, 2, filter={"category": "Urgent"})
+    assert len(hits) == 2 and {hit[0] for hit in hits} <= {1, 3, 5}
+    assert 1 not in [hit[0] for hit in index.search(query, 2000, filter={"category": "Personal"})]
+    assert index.search(query, 3, filter={"category": "Errands"}) == []
@@ -0,0 +1,86 @@
+import threading
+import numpy as np
+from index_snapshot import SnapshotIndex
+from vector_index import NumpyVectorIndex
+
+DIM = 8
+
+def unit(seed):
+    return np.random.default_rng(seed).normal(size=DIM).astype(np.float32)
+
+def payload(point_id, category="Work"):
+    return {"id": point_id, "completed": False, "category": category}
+
+def top_id(index, vector):
+    hits = index.search(vector, 1)
+    return hits[0][0] if hits else None
+
+def test_writes_during_a_compaction_stay_visible_and_win_over_the_fold():
+    base = NumpyVectorIndex(dim=DIM)
+    index = SnapshotIndex(base, dim=DIM, delta_limit=1000)
+    index.apply(range(10), [unit(i) for i in range(10)], [payload(i) for i in range(10)])
+
+    folding, release = threading.Event(), threading.Event()
+    upsert = base.upsert
+    def held_upsert(ids, vectors, payloads):
+        folding.set()
+        assert release.wait(10)
+        upsert(ids, vectors, payloads)
+    base.upsert = held_upsert
+    compaction = threading.Thread(target=index.compact)
+    compaction.start()
+    assert folding.wait(10)
+
+    # While the fold runs: rewrite a folded id, delete another and add a new one
+    index.apply([3], [unit(103)], [payload(3, "Urgent")])
+    index.apply(delete_ids=[4])
+    index.apply([10], [unit(10)], [payload(10)])
+    assert top_id(index, unit(103)) == 3 and top_id(index, unit(10)) == 10
+    assert all(hit[0] != 4 for hit in index.search(unit(4), 11))
+
+    release.set()
+    compaction.join(10)
+    snapshot = index.snapshot()
+    # Only the ids untouched since the fold started left the delta
+    assert snapshot.shadowed == {3, 4, 10}
+    assert index.search(unit(103), 1)[0][2]["category"] == "Urgent"
+    assert all(hit[0] != 4 for hit in index.search(unit(4), 11))
+    assert top_id(index, unit(7)) == 7
+
+    index.compact()
+    assert not index.snapshot().shadowed and len(index.snapshot().delta) == 0
+    assert sorted(base.stored_payloads()) == [0, 1, 2, 3, 5, 6, 7, 8, 9, 10]
+    assert base.stored_payloads()[3]["category"] == "Urgent"
+
+def test_concurrent_writers_and_background_compactions_converge():
+    index = SnapshotIndex(NumpyVectorIndex(dim=DIM), dim=DIM, delta_limit=16)
+    expected = {}
+    expected_lock = threading.Lock()
+
+    def writer(offset):
+        for step in range(300):
+            point_id = offset + step % 40
+            if step % 7 == 3:
+                index.apply(delete_ids=[point_id])
+                with expected_lock:
+                    expected.pop(point_id, None)
+            else:
+                index.apply([point_id], [unit(point_id * 1000 + step)], [payload(point_id)])
+                with expected_lock:
+                    expected[point_id] = point_id * 1000 + step
+            # Every search sees one consistent snapshot: no id twice
+            hits = index.search(unit(step), 20)
+            assert len({hit[0] for hit in hits}) == len(hits)
+
+    threads = [threading.Thread(target=writer, args=(offset,)) for offset in (0, 100, 200)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    # The writers each own their ids, so the last write per id is known
+    index.compact()
+    stored = index.snapshot().base.get_vectors(list(expected))
+    assert set(index.stored_payloads()) == set(expected)
+    for point_id, seed in expected.items():
+        vector = unit(seed)
+        assert np.allclose(stored[point_id], vector / np.linalg.norm(vector), atol=1e-6)
@@ -0,0 +1,43 @@
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+def make_index(documents):
+    index = BM25Index()
+    for doc_id, text in documents.items():
+        index.upsert(doc_id, text)
+    return index
+
+def test_compound_tokens_match_whole_and_by_part():
+    assert tokenize("Fix ABC-123 in v2.1") == ["fix", "abc-123", "abc", "123", "in", "v2.1", "v2", "1"]
+    index = make_index({1: "Fix ABC-123 login bug", 2: "Review ABC-124"})
+    assert [doc_id for doc_id, _ in index.search("abc-123", 5)] == [1, 2]
+
+def test_bm25_ranks_rare_terms_and_short_documents_first():
+    index = make_index({
+        1: "Email the team about the report",
+        2: "Renew the passport",
+        3: "Email the passport office about the passport renewal appointment next week",
+        4: "Email the landlord",
+    })
+    # "passport" is rarer than "email", so matching it outweighs matching "email"
+    assert [doc_id for doc_id, _ in index.search("email passport", 4)][:2] == [3, 2]
+    # The same single match scores higher in a shorter document
+    assert [doc_id for doc_id, _ in index.search("email", 4)] == [4, 1, 3]
+    assert index.search("passport", 4, doc_filter=lambda doc_id: doc_id != 3) == index.search("passport", 1)
+    assert index.search("groceries", 4) == [] and index.search("", 4) == []
+
+def test_replaced_and_deleted_documents_leave_no_postings():
+    index = make_index({1: "Water the plants", 2: "Water the garden"})
+    index.upsert(1, "Feed the cat")
+    index.delete(2)
+    assert index.search("water", 5) == []
+    assert [doc_id for doc_id, _ in index.search("cat", 5)] == [1]
+    assert len(index) == 1
+
+def test_reciprocal_rank_fusion_rewards_agreement_between_rankings():
+    vector = [10, 20, 30, 40]
+    lexical = [50, 30, 10]
+    # 10 and 30 are in both lists and beat either list's lone winner; 10 ranks higher overall
+    assert reciprocal_rank_fusion([vector, lexical], 10) == [10, 30, 50, 20, 40]
+    assert reciprocal_rank_fusion([vector, lexical], 2) == [10, 30]
+    # A lone list keeps its order
+    assert reciprocal_rank_fusion([vector, []], 10) == vector
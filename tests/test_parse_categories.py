@@ -0,0 +1,59 @@
+import ai_interface
+import crud
+from ai_interface import AIModel
+
+def parse(response, count):
+    # The prompt ends with "1." and the model continues from there
+    return AIModel._parse_categories(response, count)
+
+def test_numbered_answer_is_matched_by_number():
+    assert parse(" Work\n2. Personal\n3. Urgent", 3) == ["Work", "Personal", "Urgent"]
+    assert parse(" work\n2) PERSONAL\n3: urgent ", 3) == ["Work", "Personal", "Urgent"]
+
+def test_reordered_answer_lands_on_the_right_tasks():
+    assert parse(" Work\n3. Urgent\n2. Personal", 3) == ["Work", "Personal", "Urgent"]
+
+def test_missing_and_out_of_range_lines_are_left_for_the_fallback():
+    assert parse(" Work\n3. Urgent\n7. Personal", 3) == ["Work", None, "Urgent"]
+    assert parse("", 2) == [None, None]
+
+def test_chatty_and_conflicting_lines_are_not_guessed():
+    response = (" Work\n"
+                "2. This one is personal, but it is also work related\n"
+                "Task 3 looks urgent to me\n"
+                "4. Personal\n4. Urgent\n"
+                "5. Work\n5. Work")
+    assert parse(response, 5) == ["Work", None, None, None, "Work"]
+    # Unnumbered lines no longer fall back to line order
+    assert parse(" Work\nPersonal\nUrgent", 3) == ["Work", None, None]
+
+def test_tasks_without_a_model_label_take_the_local_best_guess(monkeypatch):
+    class Model:
+        def categorize_tasks(self, descriptions):
+            return ["Urgent", None]
+
+    class Service:
+        def __init__(self):
+            self.calls = []
+
+        def categorize_tasks(self, descriptions, completed, min_margin=None):
+            self.calls.append((descriptions, min_margin))
+            if min_margin is None:
+                return ["Work", None, None]
+            return ["Personal"]
+
+    service = Service()
+    monkeypatch.setattr(crud, "get_ai_model", Model)
+    monkeypatch.setattr(crud, "get_rag_service", lambda: service)
+    assert crud.categorize_tasks(["a", "b", "c"]) == ["Work", "Urgent", "Personal"]
+    assert service.calls == [(["a", "b", "c"], None), (["c"], 0.0)]
+
+def test_tasks_are_categorized_without_an_api_token(monkeypatch):
+    class Service:
+        def categorize_tasks(self, descriptions, completed, min_margin=None):
+            return [None] * len(descriptions)
+
+    monkeypatch.delenv("HUGGINGFACEHUB_API_TOKEN", raising=False)
+    monkeypatch.setattr(ai_interface, "_ai_model", None)
+    monkeypatch.setattr(crud, "get_rag_service", Service)
+    assert crud.categorize_tasks(["Water the plants"]) == ["Personal"]
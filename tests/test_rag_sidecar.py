@@ -0,0 +1,104 @@
+import os
+import socket
+import tempfile
+import threading
+import pytest
+import database
+import models
+import rag
+import rag_sidecar
+from rag_sidecar import RAGSidecar, RAGSidecarClient
+
+@pytest.fixture
+def sidecar(session_factory, monkeypatch):
+    # Unix socket paths are limited to about 100 bytes, too short for pytest's tmp_path
+    directory = tempfile.TemporaryDirectory(prefix="sidecar-")
+    socket_path = os.path.join(directory.name, "rag.sock")
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    service = rag.RAGService(session_factory=session_factory)
+    server = rag_sidecar._Server(socket_path, rag_sidecar._Handler)
+    server.sidecar = RAGSidecar(service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path, service
+    server.shutdown()
+    server.server_close()
+    service.close()
+    directory.cleanup()
+
+def add_todo(session_factory, description, **fields):
+    with session_factory() as db:
+        todo = models.TodoDB(description=description, **fields)
+        db.add(todo)
+        database.bump_write_version(db)
+        db.commit()
+        db.refresh(todo)
+        db.expunge(todo)
+        return todo
+
+def test_frames_carry_one_json_request_and_response_each(sidecar):
+    socket_path, service = sidecar
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(10)
+    sock.connect(socket_path)
+    # Several requests on one connection, each answered in order
+    rag_sidecar._send(sock, {"op": "readiness"})
+    assert rag_sidecar._recv(sock) == {"ok": True, "result": service.readiness()}
+    rag_sidecar._send(sock, {"op": "search", "args": {"query": "x", "k": 2, "mode": "lexical"}})
+    assert rag_sidecar._recv(sock) == {"ok": True, "result": []}
+    # Errors come back as a response instead of closing the connection
+    rag_sidecar._send(sock, {"op": "drop_tables"})
+    assert rag_sidecar._recv(sock) == {"ok": False, "error": "Unknown sidecar operation: drop_tables"}
+    rag_sidecar._send(sock, {"op": "related", "args": {"todo_id": 1, "unexpected": True}})
+    assert rag_sidecar._recv(sock)["ok"] is False
+    rag_sidecar._send(sock, {"op": "ensure_ready"})
+    assert rag_sidecar._recv(sock) == {"ok": True, "result": True}
+    sock.close()
+
+def test_client_round_trips_writes_searches_and_context(sidecar, session_factory):
+    socket_path, service = sidecar
+    client = RAGSidecarClient(socket_path, timeout=10)
+    assert client.ensure_ready()
+    passport = add_todo(session_factory, "Renew the passport", category="Personal")
+    plants = add_todo(session_factory, "Water the plants", category="Personal", completed=True)
+    assert client.upsert_todo(passport) and client.upsert_todo(plants)
+    assert set(service._indexed) == {passport.id, plants.id}
+
+    # Concurrent single searches are answered (batched) with each request's own results
+    results = {}
+    def search(query):
+        results[query] = [task["id"] for task in client.search_similar_tasks(query, k=1, mode="vector")]
+    threads = [threading.Thread(target=search, args=(query,)) for query in ("passport", "plants")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results == {"passport": [passport.id], "plants": [plants.id]}
+    assert client.search_similar_tasks("plants", k=5, mode="vector", filters={"completed": False})[0]["id"] == passport.id
+    assert [[task["id"] for task in hits] for hits in client.search_similar_tasks_batch(
+        ["passport", "plants"], k=1, mode="lexical")] == [[passport.id], [plants.id]]
+
+    context = client.build_context(query="passport", search_mode="lexical")
+    assert context["included"] == 2 and "Renew the passport" in context["context"]
+    assert client.delete_todo(passport.id)
+    assert passport.id not in service._indexed
+    assert client.readiness()["state"] == "ready"
+    client.close()
+
+def test_client_reconnects_and_falls_back_when_the_sidecar_is_gone(sidecar, session_factory):
+    socket_path, service = sidecar
+    client = RAGSidecarClient(socket_path, timeout=10)
+    assert client.ensure_ready()
+    # A pooled connection the sidecar dropped (e.g. on restart) is retried once on a fresh one
+    pooled = client._pool.get_nowait()
+    pooled.shutdown(socket.SHUT_RDWR)
+    client._pool.put(pooled)
+    assert client.readiness()["state"] == "ready"
+
+    with pytest.raises(RuntimeError):
+        client._call("drop_tables")
+    down = RAGSidecarClient(socket_path + ".missing", timeout=1)
+    assert down.search_similar_tasks("passport") == []
+    assert down.readiness()["state"] == "unavailable"
+    assert down.build_context()["included"] == 0
+    client.close()
@@ -0,0 +1,80 @@
+import threading
+import database
+import models
+import rag
+
+def test_crud_is_not_blocked_by_warmup(session_factory):
+    with session_factory() as db:
+        db.add_all(models.TodoDB(description=f"Seeded task {i}", category="Work") for i in range(50))
+        db.commit()
+
+    service = rag.RAGService(session_factory=session_factory)
+    # Hold the warm-up while it embeds the table (outside the index lock) until the CRUD calls
+    # below are done
+    embed_documents = service.embedder.embed_documents
+    embedding, release = threading.Event(), threading.Event()
+    def held_embed(texts):
+        embedding.set()
+        assert release.wait(30)
+        return embed_documents(texts)
+    service.embedder.embed_documents = held_embed
+    warmup = threading.Thread(target=service.ensure_ready)
+    warmup.start()
+    assert embedding.wait(30)
+
+    with session_factory() as db:
+        todo = models.TodoDB(description="Created during warm-up", category="Personal")
+        db.add(todo)
+        db.delete(db.get(models.TodoDB, 1))
+        db.commit()
+        # Return while the warm-up is still held: the writes are queued, not waiting on it
+        service.upsert_todo(todo)
+        service.delete_todo(1)
+        todo_id = todo.id
+    assert warmup.is_alive() and service.state == "warming"
+
+    release.set()
+    warmup.join(60)
+    assert service.state == "ready"
+    # Writes queued while warming are replayed once it is done
+    assert todo_id in service._indexed
+    assert 1 not in service._indexed
+    service.close()
+
+def test_failed_warmup_is_retried_and_stops_queueing_writes(session_factory, monkeypatch):
+    monkeypatch.setattr(database, "RAG_WARMUP_RETRY_SECONDS", 0.05)
+    with session_factory() as db:
+        db.add(models.TodoDB(description="Seeded task", category="Work"))
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    load = service.embedder.load
+    attempts = []
+    retried = threading.Event()
+
+    def flaky_load():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise RuntimeError("model download failed")
+        retried.set()
+        load()
+    service.embedder.load = flaky_load
+
+    assert not service.ensure_ready()
+    readiness = service.readiness()
+    assert readiness["state"] == "failed" and readiness["failures"] == 1
+    assert readiness["retry_in"] is not None and readiness["error"] == "model download failed"
+
+    # Writes while failed are not queued; the retry syncs the table instead
+    with session_factory() as db:
+        todo = models.TodoDB(description="Created while failed", category="Personal")
+        db.add(todo)
+        db.commit()
+        service.upsert_todo(todo)
+        todo_id = todo.id
+    assert service._pending_ids == set()
+
+    assert retried.wait(10)
+    assert service.ensure_ready()
+    assert service.readiness()["failures"] == 0 and service.readiness()["retry_in"] is None
+    assert set(service._indexed) == {1, todo_id}
+    service.close()
@@ -0,0 +1,124 @@
+import threading
+import database
+import models
+import rag
+from hnsw_index import HNSWVectorIndex
+from reindex import ReindexJob
+
+def make_service(session_factory, count=60):
+    with session_factory() as db:
+        db.add_all(models.TodoDB(description=f"Seeded task {i}", category="Work") for i in range(count))
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    assert service.ensure_ready()
+    return service
+
+def hold_job_embedding(service):
+    """Hold the job on its second chunk; returns (held, release) events."""
+    held, release = threading.Event(), threading.Event()
+    embed_documents = service.embeddings.embed_documents
+    calls = []
+
+    def held_embed(texts):
+        calls.append(texts)
+        if len(calls) == 2:
+            held.set()
+            assert release.wait(10)
+        return embed_documents(texts)
+    service.embeddings.embed_documents = held_embed
+    return held, release
+
+def make_job(service, session_factory):
+    job = ReindexJob(service, session_factory=session_factory)
+    job.chunk_size = 10
+    return job
+
+def test_finished_job_swaps_in_the_new_index_with_writes_made_meanwhile(session_factory):
+    service = make_service(session_factory)
+    old_base, version = service.index.snapshot().base, service.index_version
+    job = make_job(service, session_factory)
+    held, release = hold_job_embedding(service)
+    assert job.start()
+    assert held.wait(10)
+    assert not job.start()
+
+    # Writes while the job runs: the staging index may already hold the old rows
+    with session_factory() as db:
+        added = models.TodoDB(description="Renew the passport", category="Personal")
+        db.add(added)
+        db.delete(db.get(models.TodoDB, 2))
+        db.commit()
+        service.upsert_todo(added)
+        service.delete_todo(2)
+        added_id = added.id
+    assert job.progress()["state"] == "running"
+    release.set()
+    job.wait(10)
+
+    progress = job.progress()
+    # The todo created meanwhile was read in a later chunk, after the total was counted
+    assert progress["state"] == "completed" and progress["total"] == 60 and progress["processed"] == 61
+    assert service.index.snapshot().base is not old_base and service.index_version > version
+    assert service.search_similar_tasks("Renew the passport", k=1, mode="vector")[0]["id"] == added_id
+    assert 2 not in service.index.stored_payloads()
+    assert set(service.index.stored_payloads()) == set(range(1, 62)) - {2}
+    service.close()
+
+def test_cancelled_job_leaves_the_current_index_in_place(session_factory):
+    service = make_service(session_factory)
+    old_base, version = service.index.snapshot().base, service.index_version
+    job = make_job(service, session_factory)
+    held, release = hold_job_embedding(service)
+    assert job.start()
+    assert held.wait(10)
+    assert job.cancel()
+    release.set()
+    job.wait(10)
+
+    assert job.progress()["state"] == "cancelled" and job.progress()["processed"] < 60
+    assert service.index.snapshot().base is old_base and service.index_version == version
+    assert service._reindex_dirty is None
+    assert len(service.index.stored_payloads()) == 60
+    assert not job.cancel()
+    # A cancelled job can be started again
+    service.embeddings.embed_documents = service.embedder.embed_documents
+    assert job.start()
+    job.wait(10)
+    assert job.progress()["state"] == "completed"
+    service.close()
+
+def test_hnsw_reindex_writes_the_live_file_only_when_it_finishes(session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "VECTOR_BACKEND", "hnsw")
+    monkeypatch.setattr(database, "VECTOR_STORE_PATH", str(tmp_path / "vector_store"))
+    path = str(tmp_path / "vector_store" / "hnsw_index.pkl")
+    service = make_service(session_factory)
+    # Fold the seeded rows into the graph and write it out, as a restart would
+    service.index.compact()
+    old_base = service.index.snapshot().base
+    old_base.save(old_base.path)
+
+    job = make_job(service, session_factory)
+    held, release = hold_job_embedding(service)
+    assert job.start()
+    assert held.wait(10)
+    assert job.cancel()
+    release.set()
+    job.wait(10)
+    # The cancelled staging graph never touched the live file
+    assert old_base.path == path
+    assert len(HNSWVectorIndex(dim=384, path=path)) == 60
+
+    service.embeddings.embed_documents = service.embedder.embed_documents
+    assert job.start()
+    job.wait(10)
+    new_base = service.index.snapshot().base
+    assert job.progress()["state"] == "completed" and new_base is not old_base
+    # The new graph took the file over; the old one no longer writes to it
+    assert new_base.path == path and old_base.path == ""
+    with session_factory() as db:
+        added = models.TodoDB(description="Renew the passport", category="Personal")
+        db.add(added)
+        db.commit()
+        service.upsert_todo(added)
+    service.close()
+    assert sorted(HNSWVectorIndex(dim=384, path=path).stored_payloads()) == list(range(1, 62))
@@ -0,0 +1,54 @@
+import numpy as np
+from related_graph import RelatedGraph
+
+def make_graph(points, **kwargs):
+    def search_batch(vectors, k):
+        ids = list(points)
+        matrix = np.array([points[todo_id] for todo_id in ids])
+        results = []
+        for vector in vectors:
+            scores = matrix @ np.asarray(vector)
+            order = np.argsort(-scores)[:k]
+            results.append([(ids[i], float(scores[i]), {}) for i in order])
+        return results
+    return RelatedGraph(search_batch, k=2, **kwargs)
+
+def unit(angle):
+    return [np.cos(angle), np.sin(angle)]
+
+def test_remove_marks_lists_stale_and_repair_refills_them():
+    points = {todo_id: unit(todo_id ** 2 * 0.02) for todo_id in range(1, 6)}
+    graph = make_graph(points)
+    graph.build(list(points), list(points.values()))
+    assert [n[0] for n in graph.related(3)] == [2, 4]
+
+    del points[2]
+    graph.remove([2])
+    # The delete only drops the entry; no search runs until repair
+    assert [n[0] for n in graph.related(3)] == [4]
+    assert graph.is_stale(3) and graph.is_stale(1)
+
+    graph.repair(lambda ids: {todo_id: points[todo_id] for todo_id in ids if todo_id in points})
+    assert graph.stale_count() == 0
+    assert [n[0] for n in graph.related(3)] == [4, 1]
+    assert all(2 not in [n[0] for n in graph.related(todo_id)] for todo_id in points)
+
+def test_todo_removed_during_a_search_stays_out_of_the_graph():
+    points = {todo_id: unit(todo_id ** 2 * 0.02) for todo_id in range(1, 6)}
+    live = set(points)
+    graph = make_graph(points, is_live=lambda todo_id: todo_id in live)
+    search_batch = graph.search_batch
+
+    def search_then_delete(vectors, k):
+        results = search_batch(vectors, k)
+        # A delete lands after the search ran but before its results are stored
+        live.discard(2)
+        graph.remove([2])
+        return results
+    graph.search_batch = search_then_delete
+    graph.build(list(points), list(points.values()))
+
+    assert graph.related(2) is None
+    assert all(2 not in [n[0] for n in graph.related(todo_id)] for todo_id in live)
+    # Lists that lost the entry are repaired later rather than left short
+    assert graph.is_stale(3)
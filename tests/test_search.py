@@ -0,0 +1,63 @@
+import random
+from fastapi.testclient import TestClient
+import database
+import main
+import models
+import rag
+
+WORDS = "report meeting client plants groceries dentist invoice budget slides garden car bike code review deploy".split()
+
+def make_service(session_factory, count=400):
+    rng = random.Random(1)
+    with session_factory() as db:
+        db.add_all(models.TodoDB(description=" ".join(rng.sample(WORDS, 4)) + f" {i}", category=("Work", "Personal")[i % 2],
+                                 completed=i % 3 == 0) for i in range(count))
+        db.commit()
+    service = rag.RAGService(session_factory=session_factory)
+    assert service.ensure_ready()
+    return service
+
+def test_pages_slice_one_ranking(session_factory):
+    service = make_service(session_factory)
+    for mode in ("hybrid", "vector", "lexical"):
+        pages = []
+        for offset in range(0, 60, 6):
+            # /api/search asks for one extra hit to see whether another page exists
+            pages += [task["id"] for task in service.search_similar_tasks("client report", k=7, mode=mode, offset=offset)[:6]]
+        assert len(pages) == len(set(pages)) == 60
+        if mode == "hybrid":
+            # Every page came from the one ranking fused at the query's depth
+            depth = min(database.HYBRID_FUSION_DEPTH, database.SEARCH_MAX_OFFSET) + 7
+            ranking = service._rankings(["client report"], depth, mode, {})[0]
+        else:
+            ranking = [task["id"] for task in service.search_similar_tasks("client report", k=60, mode=mode)]
+        assert pages == ranking[:60]
+    service.close()
+
+def test_search_endpoint_filters_and_bounds_pages(session_factory, monkeypatch):
+    service = make_service(session_factory, count=60)
+    monkeypatch.setattr(main, "rag_service", service)
+    client = TestClient(main.app)
+
+    for mode in ("hybrid", "vector", "lexical"):
+        params = {"q": "client report", "k": 4, "completed": "false", "category": "Work", "search_mode": mode}
+        ids, offset = [], 0
+        while offset is not None:
+            body = client.get("/api/search", params=dict(params, offset=offset)).json()
+            assert body["offset"] == offset and len(body["results"]) <= 4
+            assert all(not task["completed"] and task["category"] == "Work" for task in body["results"])
+            ids += [task["id"] for task in body["results"]]
+            offset = body["next_offset"]
+        # Pages run until the filtered tasks are used up; lexical only finds keyword matches
+        matching = [i for i in range(1, 61) if (i - 1) % 2 == 0 and (i - 1) % 3 != 0]
+        assert len(ids) == len(set(ids))
+        assert set(ids) <= set(matching)
+        if mode != "lexical":
+            assert sorted(ids) == matching
+
+    past_the_end = client.get("/api/search", params={"q": "client", "offset": 100}).json()
+    assert past_the_end["results"] == [] and past_the_end["next_offset"] is None
+    assert client.get("/api/search", params={"q": "client", "offset": database.SEARCH_MAX_OFFSET}).status_code == 200
+    for bad in ({"offset": database.SEARCH_MAX_OFFSET + 1}, {"offset": -1}, {"k": 0}, {"k": 501}):
+        assert client.get("/api/search", params=dict(q="client", **bad)).status_code == 422
+    service.close()
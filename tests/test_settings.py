@@ -0,0 +1,23 @@
+import os
+import shutil
+import subprocess
+import sys
+from conftest import ROOT
+
+def test_database_settings_read_dotenv(tmp_path):
+    # A .env next to the modules must be honoured by settings read at import time
+    shutil.copy(os.path.join(ROOT, "database.py"), tmp_path)
+    (tmp_path / ".env").write_text("VECTOR_BACKEND=numpy\nEMBEDDING_BACKEND=hashing\nRAG_WARMUP=false\n"
+                                   f"DATABASE_URL=sqlite:///{tmp_path / 'todos.db'}\n")
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("VECTOR_BACKEND", "EMBEDDING_BACKEND", "RAG_WARMUP", "DATABASE_URL")}
+    output = subprocess.run(
+        [sys.executable, "-c", "import database; print(database.VECTOR_BACKEND, database.EMBEDDING_BACKEND, database.RAG_WARMUP)"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    assert output == ["numpy", "hashing", "False"]
+
+def test_main_loads_dotenv_before_local_imports():
+    with open(os.path.join(ROOT, "main.py")) as f:
+        source = f.read()
+    assert source.index("load_dotenv()") < source.index("import database")
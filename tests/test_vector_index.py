@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from vector_index import NumpyVectorIndex
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+def payload(point_id):
+    return {"id": point_id, "completed": point_id % 5 == 0, "category": ("Work", "Personal", "Urgent")[point_id % 3]}
+
+def expected(vectors, ids, query, k, keep):
+    # Brute-force cosine ranking over the ids the filter keeps
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    ranked = sorted((i for i in ids if keep(payload(i))), key=lambda i: -scores[i])
+    return ranked[:k]
+
+def test_filtered_search_ranks_only_matching_rows():
+    vectors = random_vectors(500)
+    index = NumpyVectorIndex(dim=16, initial_capacity=4)
+    index.upsert(range(500), vectors, [payload(i) for i in range(500)])
+    query = random_vectors(1, seed=1)[0]
+
+    # A selective filter (gathers the matching rows) and a broad one (scores all rows, then picks)
+    for filter in ({"completed": True, "category": "Urgent"}, {"completed": False}):
+        hits = index.search(query, 10, filter=filter)
+        keep = lambda p: all(p[field] == value for field, value in filter.items())
+        assert [hit[0] for hit in hits] == expected(vectors, range(500), query, 10, keep)
+        assert all(keep(hit[2]) for hit in hits)
+        scores = [hit[1] for hit in hits]
+        assert scores == sorted(scores, reverse=True)
+
+    # Fewer matches than k: every match is returned, nothing else
+    assert len(index.search(query, 50, filter={"completed": True, "category": "Urgent"})) == 33
+    assert index.search(query, 5, filter={"category": "Errands"}) == []
+    with pytest.raises(ValueError):
+        index.search(query, 5, filter={"description": "x"})
+
+def test_filter_columns_follow_rows_moved_by_deletes_and_updates():
+    vectors = random_vectors(60)
+    index = NumpyVectorIndex(dim=16, initial_capacity=4)
+    index.upsert(range(60), vectors, [payload(i) for i in range(60)])
+    # Deleting from the front moves the last rows into the holes
+    index.delete(range(0, 30, 2))
+    # A todo changes category in place
+    index.upsert([31], vectors[31:32], [dict(payload(31), category="Work")])
+    query = random_vectors(1, seed=2)[0]
+
+    live = [i for i in range(60) if not (i < 30 and i % 2 == 0)]
+    filter = {"category": "Work"}
+    hits = index.search(query, 100, filter=filter)
+    assert sorted(hit[0] for hit in hits) == sorted(i for i in live if payload(i)["category"] == "Work" or i == 31)
+    assert [hit[0] for hit in index.search_batch([query, query], 3, filter=filter)[1]] == [hit[0] for hit in hits[:3]]
+
+def test_int8_rows_reranked_against_exact_memmapped_rows():
+    vectors = random_vectors(3000, dim=64)
+    queries = random_vectors(20, dim=64, seed=3)
+    exact = NumpyVectorIndex(dim=64)
+    int8 = NumpyVectorIndex(dim=64, initial_capacity=4, dtype="int8", rerank=4)
+    for index in (exact, int8):
+        index.upsert(range(3000), vectors, [payload(i) for i in range(3000)])
+    assert isinstance(int8._exact, np.memmap)
+    assert int8.memory_bytes() < exact.memory_bytes() / 3
+
+    truth = exact.search_batch(queries, 10)
+    found = int8.search_batch(queries, 10)
+    recall = np.mean([len({h[0] for h in t} & {h[0] for h in f}) / 10 for t, f in zip(truth, found)])
+    assert recall >= 0.95
+    # Re-ranked scores are the exact cosine, not the quantized estimate
+    for exact_hits, hits in zip(truth, found):
+        scores = {hit[0]: hit[1] for hit in exact_hits}
+        assert all(hit[1] == pytest.approx(scores[hit[0]], abs=1e-5) for hit in hits if hit[0] in scores)
+
+    # Deletes move the exact rows with the compressed ones
+    int8.delete(range(0, 3000, 2))
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    stored = int8.get_vectors([1, 2999, 2])
+    assert sorted(stored) == [1, 2999]
+    assert np.allclose(stored[2999], normalized[2999], atol=1e-6)
+    assert np.allclose(int8.copy().get_vectors([1])[1], normalized[1], atol=1e-6)
+    assert int8.search(vectors[2999], 1)[0][0] == 2999
+
+def test_int8_without_rerank_keeps_no_exact_rows():
+    index = NumpyVectorIndex(dim=16, dtype="int8", rerank=0)
+    vectors = random_vectors(100)
+    index.upsert(range(100), vectors, [payload(i) for i in range(100)])
+    assert index._exact is None
+    # Rows decode from the int8 codes and their scales
+    normalized = vectors[7] / np.linalg.norm(vectors[7])
+    assert np.allclose(index.get_vectors([7])[7], normalized, atol=0.02)
+    assert index.search(vectors[7], 1)[0][0] == 7
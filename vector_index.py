@@ -0,0 +1,524 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Sequence
+import numpy as np
+
+# (todo id, similarity score, payload)
+SearchHit = Tuple[int, float, Dict[str, Any]]
+
+# Payload fields every backend indexes so searches can filter on them before ranking
+FILTER_FIELDS = ("completed", "category")
+
+def check_filter(filter: Optional[Dict[str, Any]]):
+    for field in filter or {}:
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Cannot filter on unindexed payload field: {field}")
+
+class VectorIndex:
+    """
+    Interface shared by the vector backends behind RAGService.
+
+    Points are keyed by todo id and carry a small payload dict. Scores are cosine
+    similarities, highest first. A search filter maps FILTER_FIELDS to required
+    values (all must match) and is applied before the top k are picked, so a
+    filtered search still returns k hits whenever k points match.
+    """
+
+    def upsert(self, ids: Sequence[int], vectors: Sequence[Sequence[float]], payloads: Sequence[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[int]):
+        raise NotImplementedError
+
+    def search(self, vector: Sequence[float], k: int, filter: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        raise NotImplementedError
+
+    def search_batch(self, vectors: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Dict[str, Any]] = None) -> List[List[SearchHit]]:
+        return [self.search(vector, k, filter) for vector in vectors]
+
+    def get_vectors(self, ids: Sequence[int]) -> Dict[int, np.ndarray]:
+        """Stored (normalized) vectors of the given ids; ids not in the index are left out."""
+        raise NotImplementedError
+
+    def stored_payloads(self) -> Dict[int, Dict[str, Any]]:
+        """Payloads of every stored point, used to diff the index against the todos table."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def staging(self) -> "VectorIndex":
+        """
+        Empty index of the same kind and settings, filled off to the side by a full
+        rebuild and then swapped in; it takes over this index's storage.
+        """
+        raise NotImplementedError
+
+    def take_over(self, replaced: "VectorIndex"):
+        """Called on a staging index once it has been swapped in for `replaced`; claims its storage."""
+        pass
+
+    def retire(self):
+        """Drop an index that a staging index has replaced, without touching shared storage."""
+        pass
+
+    def close(self):
+        pass
+
+class _ReadWriteLock:
+    """
+    Shared for reads, exclusive for writes. A waiting writer blocks new readers,
+    so a background loop of searches cannot starve writes.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+class QdrantVectorIndex(VectorIndex):
+    """
+    Qdrant collection, in memory or in local on-disk storage when path is set.
+
+    The local client is not safe for a search running during a write to the same
+    collection (it can see arrays of different lengths), so writes take the
+    collection's lock exclusively and reads share it.
+    """
+
+    def __init__(self, collection_name: str = "todos", dim: int = 384, path: str = "", client=None):
+        from qdrant_client import QdrantClient
+        from qdrant_client.http import models as qdrant_models
+        self._models = qdrant_models
+        self.dim = dim
+        self._lock = _ReadWriteLock()
+
+        # On-disk mode survives restarts; memory mode for quick setup
+        if client is not None:
+            self.client = client
+        elif path:
+            self.client = QdrantClient(path=path)
+        else:
+            self.client = QdrantClient(location=":memory:")
+        # Rebuilds alternate between "<name>" and "<name>_next" (local Qdrant has no aliases)
+        if client is None and not self.client.collection_exists(collection_name) \
+                and self.client.collection_exists(self._alternate(collection_name)):
+            collection_name = self._alternate(collection_name)
+        self.collection_name = collection_name
+
+        # Collection setup
+        try:
+            self.client.get_collection(self.collection_name)
+        except Exception:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=qdrant_models.VectorParams(size=dim, distance=qdrant_models.Distance.COSINE),
+            )
+
+    def upsert(self, ids, vectors, payloads):
+        points = [
+            self._models.PointStruct(id=point_id, vector=list(vector), payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        with self._lock.write():
+            self.client.upsert(collection_name=self.collection_name, points=points)
+
+    def delete(self, ids):
+        with self._lock.write():
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=self._models.PointIdsList(points=list(ids)),
+            )
+
+    def _filter(self, filter):
+        # Local Qdrant evaluates the filter inside its scan (payload indexes are a server-only feature)
+        check_filter(filter)
+        if not filter:
+            return None
+        return self._models.Filter(must=[
+            self._models.FieldCondition(key=field, match=self._models.MatchValue(value=value))
+            for field, value in filter.items()
+        ])
+
+    def search(self, vector, k, filter=None):
+        query_filter = self._filter(filter)
+        with self._lock.read():
+            points = self.client.query_points(
+                collection_name=self.collection_name,
+                query=list(vector),
+                query_filter=query_filter,
+                limit=k,
+                with_payload=True,
+            ).points
+        return [(p.id, p.score, p.payload) for p in points]
+
+    def search_batch(self, vectors, k, filter=None):
+        query_filter = self._filter(filter)
+        requests = [
+            self._models.QueryRequest(query=list(vector), filter=query_filter, limit=k, with_payload=True)
+            for vector in vectors
+        ]
+        with self._lock.read():
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return [[(p.id, p.score, p.payload) for p in response.points] for response in responses]
+
+    def get_vectors(self, ids):
+        with self._lock.read():
+            points = self.client.retrieve(collection_name=self.collection_name, ids=list(ids),
+                                          with_payload=False, with_vectors=True)
+        return {point.id: np.asarray(point.vector, dtype=np.float32) for point in points}
+
+    def stored_payloads(self):
+        payloads = {}
+        offset = None
+        while True:
+            with self._lock.read():
+                points, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=1000,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False,
+                )
+            for point in points:
+                payloads[point.id] = point.payload
+            if offset is None:
+                return payloads
+
+    def __len__(self):
+        with self._lock.read():
+            return self.client.count(collection_name=self.collection_name).count
+
+    @staticmethod
+    def _alternate(collection_name: str) -> str:
+        return collection_name[:-len("_next")] if collection_name.endswith("_next") else f"{collection_name}_next"
+
+    def staging(self):
+        name = self._alternate(self.collection_name)
+        if self.client.collection_exists(name):
+            self.client.delete_collection(name)
+        return QdrantVectorIndex(collection_name=name, dim=self.dim, client=self.client)
+
+    def retire(self):
+        with self._lock.write():
+            self.client.delete_collection(self.collection_name)
+
+    def close(self):
+        # Flushes and releases the on-disk storage lock
+        self.client.close()
+
+class NumpyVectorIndex(VectorIndex):
+    """
+    Exact brute-force index over one contiguous matrix.
+
+    Rows are L2-normalized on insert so a single matrix-vector product gives cosine
+    scores. The matrix grows by doubling and deletes move the last row into the hole,
+    so live rows always stay packed at the front.
+
+    dtype "float16" halves memory; "int8" stores each row as int8 with a per-row
+    scale, a quarter of float32. Compressed rows are scored in blocks, and with
+    rerank > 0 the top k * rerank candidates are re-scored against exact float32
+    rows. Those are kept row-aligned in a memory-mapped temporary file, so they
+    take disk and page cache rather than the memory the compression saves, and
+    only the candidates' rows are read back.
+
+    Each FILTER_FIELDS value is kept as an integer code in a column next to the
+    rows, so a filter becomes one vectorized comparison and only matching rows
+    are scored.
+    """
+
+    SCORE_BLOCK_ROWS = 16384
+
+    def __init__(self, dim: int = 384, initial_capacity: int = 1024, dtype: str = "float32", rerank: int = 0):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.dim = dim
+        self.dtype = dtype
+        self.rerank = rerank
+        self._vectors = np.zeros((initial_capacity, dim), dtype=np.dtype(dtype))
+        self._scales = np.ones(initial_capacity, dtype=np.float32) if dtype == "int8" else None
+        # Full-precision copies of the compressed rows, for re-ranking
+        self._exact = self._exact_rows(initial_capacity) if dtype != "float32" and rerank > 0 else None
+        self._row_ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._rows: Dict[int, int] = {}
+        self._payloads: Dict[int, Dict[str, Any]] = {}
+        # Field -> per-row value codes, and field -> value -> code
+        self._columns = {field: np.zeros(initial_capacity, dtype=np.int32) for field in FILTER_FIELDS}
+        self._codes: Dict[str, Dict[Any, int]] = {field: {} for field in FILTER_FIELDS}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _exact_rows(self, capacity: int) -> np.ndarray:
+        # Backed by an already unlinked file, so nothing is left behind
+        return np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+
+    def _encode(self, vectors: np.ndarray):
+        if self.dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self.dtype), None
+
+    def _grow(self, needed: int):
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=self._vectors.dtype)
+        vectors[:self._size] = self._vectors[:self._size]
+        row_ids = np.zeros(capacity, dtype=np.int64)
+        row_ids[:self._size] = self._row_ids[:self._size]
+        for field, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=np.int32)
+            grown[:self._size] = column[:self._size]
+            self._columns[field] = grown
+        if self._scales is not None:
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+        if self._exact is not None:
+            exact = self._exact_rows(capacity)
+            exact[:self._size] = self._exact[:self._size]
+            self._exact = exact
+        self._vectors, self._row_ids = vectors, row_ids
+
+    def upsert(self, ids, vectors, payloads):
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        encoded, scales = self._encode(vectors)
+        with self._lock:
+            self._grow(self._size + len(ids))
+            for i, (point_id, payload) in enumerate(zip(ids, payloads)):
+                row = self._rows.get(point_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._rows[point_id] = row
+                    self._row_ids[row] = point_id
+                self._vectors[row] = encoded[i]
+                if scales is not None:
+                    self._scales[row] = scales[i]
+                if self._exact is not None:
+                    self._exact[row] = vectors[i]
+                self._payloads[point_id] = payload
+                for field, column in self._columns.items():
+                    codes = self._codes[field]
+                    column[row] = codes.setdefault(payload.get(field), len(codes))
+
+    def delete(self, ids):
+        with self._lock:
+            for point_id in ids:
+                row = self._rows.pop(point_id, None)
+                if row is None:
+                    continue
+                del self._payloads[point_id]
+                last = self._size - 1
+                if row != last:
+                    moved_id = int(self._row_ids[last])
+                    self._vectors[row] = self._vectors[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    if self._exact is not None:
+                        self._exact[row] = self._exact[last]
+                    for column in self._columns.values():
+                        column[row] = column[last]
+                    self._row_ids[row] = moved_id
+                    self._rows[moved_id] = row
+                self._size = last
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        # argpartition is O(n); only the k winners get fully sorted
+        if k < scores.shape[-1]:
+            top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        else:
+            top = np.broadcast_to(np.arange(scores.shape[-1]), scores.shape[:-1] + (scores.shape[-1],))
+        order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1)
+        return np.take_along_axis(top, order, axis=-1)
+
+    def _filter_rows(self, filter) -> Optional[np.ndarray]:
+        """Indices of the rows matching the filter, or None for all rows."""
+        check_filter(filter)
+        if not filter:
+            return None
+        mask = np.ones(self._size, dtype=bool)
+        for field, value in filter.items():
+            code = self._codes[field].get(value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self._columns[field][:self._size] == code
+        return np.flatnonzero(mask)
+
+    def _scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if rows is None:
+            rows = slice(0, self._size)
+            count = self._size
+        else:
+            count = len(rows)
+        if self.dtype == "float32":
+            return queries @ self._vectors[rows].T
+        # Widen one block at a time so scoring never materializes a float32 copy of the matrix
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, self.SCORE_BLOCK_ROWS):
+            end = min(start + self.SCORE_BLOCK_ROWS, count)
+            block_rows = slice(start, end) if isinstance(rows, slice) else rows[start:end]
+            block = queries @ self._vectors[block_rows].astype(np.float32).T
+            if self._scales is not None:
+                block *= self._scales[block_rows]
+            scores[:, start:end] = block
+        return scores
+
+    def search(self, vector, k, filter=None):
+        return self.search_batch([vector], k, filter)[0]
+
+    def search_batch(self, vectors, k, filter=None):
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        with self._lock:
+            matched = self._filter_rows(filter)
+            count = self._size if matched is None else len(matched)
+            if count == 0 or k <= 0:
+                return [[] for _ in range(len(queries))]
+            rerank = self._exact is not None
+            if matched is not None and count > self._size // 2:
+                # Gathering most of the matrix costs more than scoring all of it
+                scores = self._scores(queries)[:, matched]
+            else:
+                scores = self._scores(queries, matched)
+            top = self._top_k(scores, min(k * self.rerank if rerank else k, count))
+            results = []
+            for query, query_scores, columns in zip(queries, scores, top):
+                rows = columns if matched is None else matched[columns]
+                if rerank:
+                    # Only the candidates' exact rows are paged in
+                    row_scores = (self._exact[rows] @ query).tolist()
+                else:
+                    row_scores = query_scores[columns].tolist()
+                hits = []
+                for row, score in zip(rows.tolist(), row_scores):
+                    point_id = int(self._row_ids[row])
+                    hits.append((point_id, float(score), self._payloads[point_id]))
+                if rerank:
+                    hits.sort(key=lambda hit: hit[1], reverse=True)
+                results.append(hits[:k])
+            return results
+
+    def copy(self) -> "NumpyVectorIndex":
+        """Independent copy; used to derive a new immutable snapshot from an old one."""
+        with self._lock:
+            clone = NumpyVectorIndex(dim=self.dim, initial_capacity=1, dtype=self.dtype, rerank=self.rerank)
+            clone._vectors = self._vectors.copy()
+            clone._scales = self._scales.copy() if self._scales is not None else None
+            if self._exact is not None:
+                clone._exact = clone._exact_rows(len(self._vectors))
+                clone._exact[:self._size] = self._exact[:self._size]
+            clone._row_ids = self._row_ids.copy()
+            clone._rows = dict(self._rows)
+            clone._payloads = dict(self._payloads)
+            clone._columns = {field: column.copy() for field, column in self._columns.items()}
+            clone._codes = {field: dict(codes) for field, codes in self._codes.items()}
+            clone._size = self._size
+            return clone
+
+    def items(self):
+        """(ids, float32 vectors, payloads) of every live row."""
+        with self._lock:
+            ids = [int(point_id) for point_id in self._row_ids[:self._size]]
+            if self._exact is not None:
+                vectors = np.array(self._exact[:self._size])
+            else:
+                vectors = self._vectors[:self._size].astype(np.float32)
+                if self._scales is not None:
+                    vectors *= self._scales[:self._size, None]
+            return ids, vectors, [self._payloads[point_id] for point_id in ids]
+
+    def get_vectors(self, ids):
+        with self._lock:
+            rows = [(point_id, self._rows[point_id]) for point_id in ids if point_id in self._rows]
+            if not rows:
+                return {}
+            indices = [row for _, row in rows]
+            if self._exact is not None:
+                vectors = np.array(self._exact[indices])
+            else:
+                vectors = self._vectors[indices].astype(np.float32)
+                if self._scales is not None:
+                    vectors *= self._scales[indices, None]
+            return {point_id: vector for (point_id, _), vector in zip(rows, vectors)}
+
+    def memory_bytes(self) -> int:
+        """Bytes held in memory by the vector matrix (and int8 scales) at current capacity; exact rows are on disk."""
+        return self._vectors.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+
+    def stored_payloads(self):
+        with self._lock:
+            return dict(self._payloads)
+
+    def __len__(self):
+        return self._size
+
+    def staging(self):
+        return NumpyVectorIndex(dim=self.dim, dtype=self.dtype, rerank=self.rerank)
+
+def create_vector_index(backend: str, dim: int = 384, path: str = "",
+                        hnsw_params: Optional[Dict[str, int]] = None,
+                        numpy_params: Optional[Dict[str, Any]] = None) -> VectorIndex:
+    """
+    Build the vector backend selected by name.
+
+    Args:
+        backend (str): "qdrant", "numpy" or "hnsw"
+        dim (int): Embedding dimension
+        path (str): On-disk storage directory (qdrant and hnsw)
+        hnsw_params (dict): M / ef_construction / ef_search for the hnsw backend
+        numpy_params (dict): dtype / rerank for the numpy backend
+
+    Returns:
+        VectorIndex: The selected backend
+    """
+    if backend == "numpy":
+        return NumpyVectorIndex(dim=dim, **(numpy_params or {}))
+    if backend == "qdrant":
+        return QdrantVectorIndex(dim=dim, path=path)
+    if backend == "hnsw":
+        from hnsw_index import HNSWVectorIndex
+        index_path = ""
+        if path:
+            os.makedirs(path, exist_ok=True)
+            index_path = os.path.join(path, "hnsw_index.pkl")
+        return HNSWVectorIndex(dim=dim, path=index_path, **(hnsw_params or {}))
+    raise ValueError(f"Unknown vector backend: {backend}")